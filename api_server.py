@@ -0,0 +1,369 @@
+# 本地 HTTP 控制接口 (asyncio，只用标准库)
+#
+#   GET    /api/jobs           任务列表 (?state=running&limit=100&offset=0)
+#   POST   /api/jobs           提交任务 {"url" 或 "urls", "format", "priority", "outtmpl",
+#                                        "audio_only", "audio_format", "clip": "1:30-2:45" 或 [90, 165]}
+#   GET    /api/jobs/<id>      单个任务
+#   DELETE /api/jobs/<id>      取消任务 (已交给后处理合并 / 已结束返回 409，已不在队列中返回 404)
+#   GET    /api/status         总速度 / 运行中 / 排队数 / 各主机的熔断状态
+#   GET    /api/history        历史任务的传输统计 (?limit=100)
+#   GET    /api/events         SSE 事件流 (?job=<id> 只看某个任务)，连接后先推送一次全部任务的快照
+#   GET    /metrics            Prometheus 格式的运行指标，见 metrics.py
+#
+# 引擎事件在下载线程中触发 (进度已由进度总线按帧合并)，经 loop.call_soon_threadsafe 转到事件循环，
+# 再分发到每个订阅者自己的有界队列；
+# 跟不上的订阅者会被断开 (收到 lagged 事件)，重连后从快照继续，不会拖慢下载或占满内存。
+
+import asyncio
+import functools
+import hmac
+import json
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+import retry_policy
+from bandwidth import HIGH, LOW, NORMAL
+from downloader_core import (DownloadJob, QueueFullError, check_audio_format, check_clip, check_outtmpl,
+                             parse_batch_text)
+
+MAX_BODY = 1024 * 1024
+PRIORITIES = (HIGH, NORMAL, LOW)
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Subscriber:
+    def __init__(self, job_id=None, maxsize=1000):
+        self.job_id = job_id
+        self.queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def wants(self, event):
+        return self.job_id is None or event.get('job') in (None, self.job_id)
+
+
+class ApiServer:
+    def __init__(self, engine, host='127.0.0.1', port=8765, token=None, keep_finished=1000,
+                 subscriber_queue=1000, heartbeat=15.0):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.token = token
+        self.keep_finished = keep_finished
+        self.subscriber_queue = subscriber_queue
+        self.heartbeat = heartbeat
+
+        self.loop = None
+        self.server = None
+        self.jobs = OrderedDict()   # job_id -> 任务快照，只在事件循环线程中修改
+        self.subscribers = set()
+        self.sequence = 0
+
+        engine.on('job_added', self._on_job_added)
+        engine.on('job_state', lambda job_id, state: self._post(self._update, job_id, 'state', state=state))
+        engine.on('progress_frame', lambda frame: self._post(self._on_progress_frame, frame))
+        engine.on('job_status', lambda job_id, text: self._post(self._update, job_id, 'status', message=text))
+        engine.on('job_finished', self._on_job_finished)
+        engine.on('idle', lambda: self._post(self._publish, {'event': 'idle'}))
+
+    # ------------------------------------------------------------------
+    # 引擎事件 (下载线程) -> 事件循环
+    # ------------------------------------------------------------------
+
+    def _post(self, callback, *args, **kwargs):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(functools.partial(callback, *args, **kwargs))
+
+    def _on_job_added(self, job_id):
+        job = self.engine.jobs.get(job_id)
+        if job is not None:
+            self._post(self._add, job.to_dict())
+
+    def _on_job_finished(self, job_id, success, msg):
+        job = self.engine.jobs.get(job_id)
+        output = job.to_dict()['output'] if job is not None else None
+        self._post(self._update, job_id, 'finished', success=success, message=msg, output=output)
+
+    def _on_progress_frame(self, frame):
+        # 进度总线已按固定帧率合并，每帧只唤醒一次事件循环
+        for job_id, fields in frame.items():
+            if fields.get('phase') in (DownloadJob.DONE, DownloadJob.FAILED):
+                continue
+            self._update(job_id, 'progress', **fields)
+
+    def _add(self, snapshot):
+        self.jobs[snapshot['id']] = snapshot
+        self._publish({'event': 'added', 'job': snapshot['id'], 'data': snapshot})
+
+    def _update(self, job_id, name, **fields):
+        snapshot = self.jobs.get(job_id)
+        if snapshot is not None:
+            snapshot.update((key, value) for key, value in fields.items() if key in snapshot)
+            if name == 'finished':
+                snapshot['speed'] = 0.0
+                if fields.get('success'):
+                    snapshot['progress'] = 100.0
+                self._prune()
+        self._publish(dict(fields, event=name, job=job_id))
+
+    def _prune(self):
+        # 只保留最近 keep_finished 个已结束的任务
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job['state'] in (DownloadJob.DONE, DownloadJob.FAILED)]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self.jobs[job_id]
+
+    def _publish(self, event):
+        self.sequence += 1
+        event['seq'] = self.sequence
+        for subscriber in list(self.subscribers):
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+                self.subscribers.discard(subscriber)
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        # 通知所有订阅连接结束
+        for subscriber in list(self.subscribers):
+            subscriber.lagged = True
+            if not subscriber.queue.full():
+                subscriber.queue.put_nowait(None)
+        self.subscribers.clear()
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, query, headers, body = await self._read_request(reader)
+            self._check_token(headers, query)
+            if path == '/api/events' and method == 'GET':
+                await self._stream_events(writer, query)
+                return
+            if path == '/metrics' and method == 'GET':
+                await self._send(writer, 200, metrics.REGISTRY.render().encode('utf-8'), metrics.CONTENT_TYPE)
+                return
+            status, payload = await self._route(method, path, query, body)
+        except HttpError as e:
+            status, payload = e.status, {'error': e.message}
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        await self._send_json(writer, status, payload)
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "请求格式错误")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "Content-Length 无效")
+        if length < 0:
+            raise HttpError(400, "Content-Length 无效")
+        if length > MAX_BODY:
+            raise HttpError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b''
+        url = urlparse(target)
+        return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), headers, body
+
+    def _check_token(self, headers, query):
+        if not self.token:
+            return
+        # EventSource 不能设置请求头，允许通过 ?token= 传递
+        supplied = headers.get('authorization', '')
+        supplied = supplied[7:] if supplied.startswith('Bearer ') else (query.get('token') or [''])[0]
+        # compare_digest 只接受 ASCII 字符串，非 ASCII 的 ?token= 会抛 TypeError，统一编码成字节再比较
+        if not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+            raise HttpError(401, "未授权")
+
+    async def _route(self, method, path, query, body):
+        if path == '/api/status' and method == 'GET':
+            speed, running, pending = self.engine.throughput()
+            return 200, {'speed': speed, 'running': running, 'pending': pending,
+                         'max_workers': self.engine.max_workers, 'subscribers': len(self.subscribers),
+                         'hosts': retry_policy.breaker_states()}
+        if path == '/api/history' and method == 'GET':
+            try:
+                limit = int((query.get('limit') or [100])[0])
+            except ValueError:
+                raise HttpError(400, "limit 必须是整数")
+            history = self.engine.history
+            return 200, {'summary': history.aggregate(), 'jobs': history.recent(limit)}
+        if path == '/api/jobs':
+            if method == 'GET':
+                return 200, self._list_jobs(query)
+            if method == 'POST':
+                return await self._submit(body)
+            raise HttpError(405, "不支持的请求方法")
+        if path.startswith('/api/jobs/'):
+            try:
+                job_id = int(path.rsplit('/', 1)[1])
+            except ValueError:
+                raise HttpError(404, "任务不存在")
+            snapshot = self.jobs.get(job_id)
+            if snapshot is None:
+                raise HttpError(404, "任务不存在")
+            if method == 'GET':
+                return 200, snapshot
+            if method == 'DELETE':
+                if snapshot['state'] in (DownloadJob.DONE, DownloadJob.FAILED):
+                    raise HttpError(409, "任务已结束")
+                if not await self.loop.run_in_executor(None, self.engine.cancel, job_id):
+                    if job_id not in self.engine.jobs:
+                        raise HttpError(404, "任务已不在队列中")
+                    if self.engine.jobs[job_id].state == DownloadJob.MERGING:
+                        raise HttpError(409, "任务正在合并，无法取消")
+                    raise HttpError(409, "任务无法取消")
+                return 202, {'id': job_id, 'cancelled': True}
+            raise HttpError(405, "不支持的请求方法")
+        raise HttpError(404, "接口不存在")
+
+    def _list_jobs(self, query):
+        jobs = list(self.jobs.values())
+        state = (query.get('state') or [None])[0]
+        if state:
+            jobs = [job for job in jobs if job['state'] == state]
+        try:
+            offset = max(int((query.get('offset') or [0])[0]), 0)
+            limit = max(int((query.get('limit') or [len(jobs)])[0]), 0)
+        except ValueError:
+            raise HttpError(400, "offset / limit 必须是整数")
+        return {'total': len(jobs), 'jobs': jobs[offset:offset + limit]}
+
+    async def _submit(self, body):
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, "请求体不是合法的 JSON")
+        if not isinstance(request, dict):
+            raise HttpError(400, "请求体必须是 JSON 对象")
+
+        urls = request.get('urls') or ([request['url']] if request.get('url') else [])
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise HttpError(400, "urls 必须是字符串列表")
+        urls = parse_batch_text('\n'.join(urls))
+        if not urls:
+            raise HttpError(400, "缺少 url")
+        priority = request.get('priority') or NORMAL
+        if priority not in PRIORITIES:
+            raise HttpError(400, f"priority 只能是 {', '.join(PRIORITIES)}")
+        format_id = request.get('format') or None
+        audio_only = bool(request.get('audio_only'))
+        try:
+            outtmpl = check_outtmpl(request.get('outtmpl')) if request.get('outtmpl') else None
+            audio_format = check_audio_format(request.get('audio_format'))
+            clip = check_clip(request.get('clip'))
+        except ValueError as e:
+            raise HttpError(400, str(e))
+
+        # 写下载日志是磁盘操作，放到线程池里执行，不阻塞事件循环
+        def submit_all():
+            accepted = []
+            for url in urls:
+                try:
+                    job = self.engine.submit(url, format_id, priority=priority, outtmpl=outtmpl, audio_only=audio_only,
+                                             audio_format=audio_format, clip=clip)
+                except QueueFullError as e:
+                    return accepted, str(e)
+                accepted.append(job.job_id)
+            return accepted, None
+
+        accepted, error = await self.loop.run_in_executor(None, submit_all)
+        if error:
+            return 503, {'error': error, 'jobs': accepted, 'rejected': urls[len(accepted):]}
+        return 201, {'jobs': accepted}
+
+    async def _send_json(self, writer, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await self._send(writer, status, body, 'application/json; charset=utf-8')
+
+    async def _send(self, writer, status, body, content_type):
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _stream_events(self, writer, query):
+        try:
+            job_id = int(query['job'][0]) if query.get('job') else None
+        except ValueError:
+            raise HttpError(400, "job 必须是整数")
+        subscriber = Subscriber(job_id, self.subscriber_queue)
+        self.subscribers.add(subscriber)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+            jobs = [job for job in self.jobs.values() if job_id is None or job['id'] == job_id]
+            writer.write(self._format_event({'event': 'snapshot', 'seq': self.sequence, 'jobs': jobs}))
+            await writer.drain()
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                if event is None:
+                    break
+                writer.write(self._format_event(event))
+                if subscriber.lagged and subscriber.queue.empty():
+                    writer.write(self._format_event({'event': 'lagged', 'seq': self.sequence}))
+                    await writer.drain()
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            writer.close()
+
+    @staticmethod
+    def _format_event(event):
+        data = json.dumps(event, ensure_ascii=False)
+        return f"id: {event.get('seq', 0)}\nevent: {event['event']}\ndata: {data}\n\n".encode('utf-8')
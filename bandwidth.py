@@ -0,0 +1,210 @@
+# 带宽调度：全局令牌桶 + 单任务限速 + 优先级 + 分时段限速
+#
+# 所有下载 (分段下载、yt-dlp 下载、封面) 每读到一块数据就向调度器申请等量的令牌，
+# 令牌不足时阻塞等待，从而把总带宽限制在设定值以内。
+# 时钟、sleep 和当前时间都可以注入，便于用假时钟做单元测试。
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+HIGH = 'high'
+NORMAL = 'normal'
+LOW = 'low'
+
+# 令牌桶中至少保留多少比例的令牌，低优先级才能取用；
+# 带宽紧张时高优先级先拿到令牌，空闲时各优先级都能跑满
+PRIORITY_RESERVE = {
+    HIGH: 0.0,
+    NORMAL: 0.25,
+    LOW: 0.5,
+}
+
+SCHEDULE_FILE = 'bandwidth.json'
+
+
+class TokenBucket:
+    def __init__(self, rate=None, capacity=None, clock=time.monotonic):
+        self.clock = clock
+        self.rate = None
+        self.capacity = 0.0
+        self.tokens = 0.0
+        self.updated = clock()
+        self.set_rate(rate, capacity)
+
+    @property
+    def unlimited(self):
+        return not self.rate
+
+    def set_rate(self, rate, capacity=None):
+        # rate 为 None / 0 表示不限速；默认容量为 1 秒的流量
+        self._refill()
+        self.rate = float(rate) if rate else None
+        self.capacity = float(capacity) if capacity else (self.rate or 0.0)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = self.clock()
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, threshold=0.0):
+        # 令牌数达到 threshold 还需要等多久
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        if self.tokens >= threshold:
+            return 0.0
+        return (threshold - self.tokens) / self.rate
+
+    def consume(self, nbytes):
+        # 允许欠账 (令牌为负)，大块数据也不会永远拿不到令牌
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= nbytes
+
+
+def parse_clock(value):
+    hour, _, minute = str(value).partition(':')
+    return int(hour) * 60 + int(minute or 0)
+
+
+class ScheduleRule:
+    def __init__(self, start, end, rate):
+        self.start = parse_clock(start)
+        self.end = parse_clock(end)
+        self.rate = rate
+
+    def matches(self, minute_of_day):
+        if self.start <= self.end:
+            return self.start <= minute_of_day < self.end
+        # 跨午夜，如 23:00 - 07:00
+        return minute_of_day >= self.start or minute_of_day < self.end
+
+
+class BandwidthScheduler:
+    def __init__(self, global_rate=None, schedule=None, clock=time.monotonic, sleep=time.sleep,
+                 now=datetime.now, max_sleep=0.25):
+        self.clock = clock
+        self.sleep = sleep
+        self.now = now
+        self.max_sleep = max_sleep
+        self.lock = threading.Lock()
+
+        self.default_rate = global_rate
+        self.schedule = []
+        self.global_bucket = TokenBucket(global_rate, clock=clock)
+        self.jobs = {}   # job_id -> (TokenBucket, priority)
+        self.set_schedule(schedule or [])
+
+    # ------------------------------------------------------------------
+    # 配置
+    # ------------------------------------------------------------------
+
+    def set_global_rate(self, rate):
+        with self.lock:
+            self.default_rate = rate or None
+            self._apply_schedule()
+
+    def set_schedule(self, rules):
+        # rules: [{'start': '09:00', 'end': '18:00', 'rate': 2 * 1024 * 1024}, ...]
+        with self.lock:
+            self.schedule = [
+                rule if isinstance(rule, ScheduleRule) else ScheduleRule(rule['start'], rule['end'], rule.get('rate'))
+                for rule in rules
+            ]
+            self._apply_schedule()
+
+    def load_schedule(self, path=SCHEDULE_FILE):
+        # 可选配置文件：{"global_rate": 0, "schedule": [{"start": "09:00", "end": "18:00", "rate": 2097152}]}
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if 'global_rate' in config:
+            self.set_global_rate(config['global_rate'])
+        self.set_schedule(config.get('schedule', []))
+        return True
+
+    def current_rate(self):
+        with self.lock:
+            self._apply_schedule()
+            return self.global_bucket.rate
+
+    def _apply_schedule(self):
+        now = self.now()
+        minute = now.hour * 60 + now.minute
+        rate = self.default_rate
+        for rule in self.schedule:
+            if rule.matches(minute):
+                rate = rule.rate
+                break
+        if (rate or None) != self.global_bucket.rate:
+            self.global_bucket.set_rate(rate)
+
+    def register_job(self, job_id, rate=None, priority=NORMAL):
+        with self.lock:
+            self.jobs[job_id] = (TokenBucket(rate, clock=self.clock), priority)
+
+    def set_job_rate(self, job_id, rate):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id][0].set_rate(rate)
+
+    def unregister_job(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    # ------------------------------------------------------------------
+    # 申请令牌
+    # ------------------------------------------------------------------
+
+    def acquire(self, nbytes, job_id=None, priority=None, cancel_check=None):
+        # 阻塞直到单任务桶和全局桶都允许传输 nbytes，返回实际等待的秒数
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._apply_schedule()
+                job_bucket, job_priority = self.jobs.get(job_id, (None, NORMAL))
+                priority = priority or job_priority
+
+                wait = job_bucket.wait_time() if job_bucket is not None else 0.0
+                if not wait:
+                    bucket = self.global_bucket
+                    threshold = PRIORITY_RESERVE.get(priority, 0.0) * bucket.capacity
+                    wait = bucket.wait_time(threshold)
+                    if not wait:
+                        bucket.consume(nbytes)
+                        if job_bucket is not None:
+                            job_bucket.consume(nbytes)
+                        return waited
+
+            if cancel_check is not None and cancel_check():
+                return waited
+            # 分片睡眠，限速调整 / 取消能尽快生效
+            step = min(wait, self.max_sleep)
+            self.sleep(step)
+            waited += step
+
+    def throttle_for(self, job_id=None, priority=None, cancel_check=None):
+        # 返回供下载器调用的 throttle(nbytes) 回调
+        return lambda nbytes: self.acquire(nbytes, job_id, priority, cancel_check)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_bandwidth_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler()
+            try:
+                _scheduler.load_schedule()
+            except (OSError, ValueError, KeyError):
+                pass
+        return _scheduler
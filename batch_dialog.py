@@ -0,0 +1,61 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QPlainTextEdit, QFileDialog, QMessageBox)
+from PyQt5.QtCore import Qt
+
+class BatchDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("批量添加")
+        self.resize(560, 420)
+
+        layout = QVBoxLayout(self)
+
+        tip_label = QLabel("每行一个链接或 BV 号，支持分P视频、合集、收藏夹和 UP 主空间链接：")
+        tip_label.setWordWrap(True)
+
+        self.text_edit = QPlainTextEdit()
+        self.text_edit.setPlaceholderText(
+            "https://www.bilibili.com/video/BV...\n"
+            "https://space.bilibili.com/xxx/favlist?fid=...\n"
+            "BV1xx411c7mD")
+
+        btn_layout = QHBoxLayout()
+        self.import_btn = QPushButton("从文件导入...")
+        self.import_btn.setObjectName("SecondaryBtn")
+        self.import_btn.setCursor(Qt.PointingHandCursor)
+        self.import_btn.clicked.connect(self.import_file)
+
+        self.ok_btn = QPushButton("加入队列")
+        self.ok_btn.setCursor(Qt.PointingHandCursor)
+        self.ok_btn.clicked.connect(self.on_accept)
+
+        btn_layout.addWidget(self.import_btn)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.ok_btn)
+
+        layout.addWidget(tip_label)
+        layout.addWidget(self.text_edit)
+        layout.addLayout(btn_layout)
+
+    def import_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择链接列表", "", "文本文件 (*.txt);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                content = f.read()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取文件失败: {e}")
+            return
+        existing = self.text_edit.toPlainText().rstrip()
+        self.text_edit.setPlainText(f"{existing}\n{content}" if existing else content)
+
+    def on_accept(self):
+        if not self.urls():
+            QMessageBox.warning(self, "提示", "请至少输入一个链接！")
+            return
+        self.accept()
+
+    def urls(self):
+        from downloader_core import parse_batch_text
+        return parse_batch_text(self.text_edit.toPlainText())
@@ -0,0 +1 @@
+# 性能基准 (离线运行，不访问 B 站)。在仓库根目录执行，例如: python -m benchmarks.bench_ydl_pool
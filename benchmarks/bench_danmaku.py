@@ -0,0 +1,111 @@
+# 弹幕导出基准：弹幕条数增加时的耗时、内存峰值和文件大小 (本地替身服务器，不访问 B 站)
+#
+#   python -m benchmarks.bench_danmaku [--counts 10000,100000,300000] [--per-segment 6000] [--source protobuf,xml]
+#                                      [--ass] [-w 4] [--latency 0.02] [--json result.json]
+#
+# 每个分段 (6 分钟) 的弹幕数固定为 per-segment，条数越多视频越长、分段越多，和线上的情况一致。
+# 每次导出在单独的子进程中运行，内存峰值只统计导出本身 (减去导入模块后的基线)；
+# 条数增加几十倍时内存峰值应基本不变。文件大小和同样内容的 XML 对比。
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_bilibili import MockBilibili
+from danmaku import SEGMENT_SECONDS
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = 'https://www.bilibili.com/video/BV1Danmaku01'
+
+
+def rss_mb():
+    # ru_maxrss: Linux 为 KB，macOS 为字节
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(args):
+    # 在子进程中执行：导出一个视频，输出耗时和内存峰值
+    import http_client
+    from danmaku import DanmakuExporter
+
+    baseline = rss_mb()
+    exporter = DanmakuExporter(session=http_client.create_session(), workers=args.workers,
+                               api_base=f'{args.child}/api.bilibili.com', comment_base=f'{args.child}/comment.bilibili.com')
+    started = time.perf_counter()
+    result = exporter.export(URL, args.output, ass=args.ass, subtitles=False, source=args.source)[0]
+    wall = time.perf_counter() - started
+    print(json.dumps({'count': result['count'], 'wall_s': wall, 'peak_rss_mb': rss_mb() - baseline,
+                      'sizes': {path.rsplit('.', 1)[-1]: os.path.getsize(path) for path in result['files']}}))
+
+
+def measure(mock, count, source, args, directory):
+    segments = max(1, -(-count // args.per_segment))
+    mock.danmaku = count
+    mock.duration = segments * SEGMENT_SECONDS
+    output = os.path.join(directory, f'{source}-{count}')
+    command = [sys.executable, '-m', 'benchmarks.bench_danmaku', '--child', mock.base_url, '--source', source,
+               '--output', output, '-w', str(args.workers)] + (['--ass'] if args.ass else [])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    proc = subprocess.run(command, cwd=directory, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'退出码 {proc.returncode}')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    _, cid = mock.ids('BV1Danmaku01')
+    result['xml_bytes'] = sum(len(chunk) for chunk in mock.danmaku_xml(cid))
+    result.update(source=source, segments=segments)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='弹幕导出基准')
+    parser.add_argument('--counts', default='10000,100000,300000', help='每个视频的弹幕条数，逗号分隔')
+    parser.add_argument('--per-segment', type=int, default=6000, help='每个分段 (6 分钟) 的弹幕数')
+    parser.add_argument('--source', default='protobuf,xml', help='弹幕来源 (protobuf / xml)，逗号分隔')
+    parser.add_argument('--ass', action='store_true', help='同时生成 ASS')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='同时下载的分段数')
+    parser.add_argument('--latency', type=float, default=0.02, help='每个请求的延迟 (秒)')
+    parser.add_argument('--json', help='结果写入 JSON 文件')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+        return 0
+
+    mock = MockBilibili({}, SEGMENT_SECONDS, latency=args.latency)
+    mock.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for source in args.source.split(','):
+                for count in (int(c) for c in args.counts.split(',')):
+                    r = measure(mock, count, source.strip(), args, directory)
+                    results.append(r)
+                    print(f"{r['source']:>8} {r['count']:>8} 条 ({r['segments']} 段): {r['wall_s']:.2f}s "
+                          f"{r['count'] / r['wall_s']:.0f} 条/s，内存峰值 +{r['peak_rss_mb']:.1f}MB，"
+                          f".dmk {r['sizes']['dmk'] / 1024:.0f}KB (XML {r['xml_bytes'] / 1024:.0f}KB，"
+                          f"{r['sizes']['dmk'] / r['xml_bytes']:.1%})"
+                          + (f"，ASS {r['sizes']['ass'] / 1024:.0f}KB" if 'ass' in r['sizes'] else ''))
+    finally:
+        mock.stop()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,318 @@
+# 端到端基准：解析 + 分段下载 + 合并，全部在本地替身服务器上进行 (不访问 B 站)
+#
+#   python -m benchmarks.bench_download [-s single,batch,concurrent] [-n 8] [-j 4] [--latency 0.05] ...
+#   python -m benchmarks.bench_download --compare 旧结果.json [新结果.json]
+#
+# 场景：
+#   single      1 个任务
+#   batch       n 个任务依次下载 (1 个下载槽位)，看每个任务的固定开销
+#   concurrent  n 个任务，j 个下载槽位同时下载
+# 每个场景先像界面上 "解析" 按钮那样逐个获取视频信息 (fetch_video_info，测解析耗时)，
+# 再交给 DownloadEngine 下载和合并。每个场景在单独的子进程和临时目录中运行，
+# 缓存、存档互不影响，CPU 时间和内存峰值也只统计该场景。
+#
+# 结果写入 benchmarks/results/<时间>-<提交>.json，--compare 对比两次结果。
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from yt_dlp.version import __version__ as yt_dlp_version
+
+from benchmarks.mock_bilibili import add_network_arguments, create_server, install_redirect, network_config
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SCENARIOS = ('single', 'batch', 'concurrent')
+
+# --compare 显示的指标：(路径, 说明, 越大越好)
+COMPARED = (
+    ('extract.p50_ms', '解析 p50 (ms)', False),
+    ('extract.p95_ms', '解析 p95 (ms)', False),
+    ('wall_s', '总耗时 (s)', False),
+    ('throughput_mb_s', '吞吐 (MB/s)', True),
+    ('merge.mean_ms', '合并平均 (ms)', False),
+    ('cpu_s.total', 'CPU (s)', False),
+    ('peak_rss_mb', '内存峰值 (MB)', False),
+)
+
+
+def video_urls(count):
+    return [f'https://www.bilibili.com/video/BV1Bench{i:04d}' for i in range(count)]
+
+
+def scenario_plan(name, jobs, workers):
+    if name == 'single':
+        return 1, 1
+    if name == 'batch':
+        return jobs, 1
+    return jobs, workers
+
+
+def percentiles(values, scale=1000.0, unit='ms'):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        f'mean_{unit}': statistics.mean(ordered) * scale,
+        f'p50_{unit}': ordered[len(ordered) // 2] * scale,
+        f'p95_{unit}': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * scale,
+        f'max_{unit}': ordered[-1] * scale,
+    }
+
+
+def usage():
+    if resource is None:
+        return None
+    this = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'user': this.ru_utime, 'system': this.ru_stime,
+        'children': children.ru_utime + children.ru_stime,
+        'peak_rss': this.ru_maxrss * rss_unit, 'children_peak_rss': children.ru_maxrss * rss_unit,
+    }
+
+
+# ----------------------------------------------------------------------
+# 子进程：运行一个场景
+# ----------------------------------------------------------------------
+
+def run_scenario(spec):
+    install_redirect(spec['base_url'])
+    started = time.perf_counter()
+    import downloader_core
+    import_seconds = time.perf_counter() - started
+
+    urls = video_urls(spec['jobs'])
+
+    def extract(url):
+        t = time.perf_counter()
+        downloader_core.fetch_video_info(url)
+        return time.perf_counter() - t
+
+    engine = downloader_core.DownloadEngine(max_workers=spec['workers'], save_path='downloads',
+                                            connections_per_job=spec['connections'],
+                                            scratch_dir=spec.get('scratch_dir'))
+    results = {}
+    engine.on('job_finished', lambda job_id, ok, msg: results.setdefault(job_id, (ok, msg)))
+
+    with ThreadPoolExecutor(spec['workers']) as executor:
+        extract_times = list(executor.map(extract, urls))
+
+    started = time.perf_counter()
+    jobs = [engine.submit(url) for url in urls]
+    finished = engine.wait_idle(spec['timeout'])
+    wall = time.perf_counter() - started
+    # 等合并进程退出，它们 (以及其中的 ffmpeg) 的 CPU 时间才会计入 RUSAGE_CHILDREN
+    engine.postprocess_pool.shutdown(wait=True)
+    engine.stop_all()
+
+    summaries = [job.summary for job in jobs if job.summary is not None]
+    failed = [msg for ok, msg in results.values() if not ok]
+    total_bytes = sum(summary['bytes'] for summary in summaries)
+    merges = [summary['merge_seconds'] for summary in summaries if summary.get('merge_seconds') is not None]
+    result = {
+        'jobs': len(urls),
+        'workers': spec['workers'],
+        'connections': spec['connections'],
+        'succeeded': sum(1 for ok, _ in results.values() if ok),
+        'failed': len(failed) + (0 if finished else len(urls) - len(results)),
+        'errors': failed[:5],
+        'import_s': import_seconds,
+        'extract': percentiles(extract_times),
+        'wall_s': wall,
+        'bytes': total_bytes,
+        'throughput_mb_s': total_bytes / wall / 1024 / 1024 if wall > 0 else None,
+        'job': percentiles([summary['duration'] for summary in summaries], 1.0, 's'),
+        'ttfb': percentiles([summary['ttfb'] for summary in summaries if summary.get('ttfb') is not None]),
+        'merge': dict(percentiles(merges) or {}, total_s=sum(merges)) if merges else None,
+        'retries': sum(job.transfer.get('retries', 0) for job in jobs),
+    }
+    rusage = usage()
+    if rusage is not None:
+        result['cpu_s'] = {'user': rusage['user'], 'system': rusage['system'], 'children': rusage['children'],
+                           'total': rusage['user'] + rusage['system'] + rusage['children']}
+        result['peak_rss_mb'] = rusage['peak_rss'] / 1024 / 1024
+        result['children_peak_rss_mb'] = rusage['children_peak_rss'] / 1024 / 1024
+    return result
+
+
+def run_child(spec_path):
+    with open(spec_path, encoding='utf-8') as f:
+        spec = json.load(f)
+    result = run_scenario(spec)
+    with open(spec['output'], 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+    return 0
+
+
+# ----------------------------------------------------------------------
+# 主进程：启动替身服务器，逐个场景启动子进程
+# ----------------------------------------------------------------------
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True,
+                                  timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+    return git('rev-parse', '--short', 'HEAD') or None, bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def spawn_scenario(mock, name, jobs, workers, connections, timeout, scratch_root=None):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    # 临时目录放在另一个位置 (如 /dev/shm) 时测试跨文件系统的落盘
+    scratch_dir = tempfile.mkdtemp(prefix=f'bench-{name}-', dir=scratch_root) if scratch_root else None
+    try:
+        spec = {'base_url': mock.base_url, 'jobs': jobs, 'workers': workers, 'connections': connections,
+                'timeout': timeout, 'output': os.path.join(workdir, 'result.json'), 'scratch_dir': scratch_dir}
+        spec_path = os.path.join(workdir, 'spec.json')
+        with open(spec_path, 'w', encoding='utf-8') as f:
+            json.dump(spec, f)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        mock.stats(reset=True)
+        # 工作目录换成临时目录：cache/、downloads/ 都在里面，不读取仓库中的登录信息和存档
+        proc = subprocess.run([sys.executable, '-m', 'benchmarks.bench_download', '--child', spec_path],
+                              cwd=workdir, env=env, timeout=timeout + 60)
+        if proc.returncode != 0 or not os.path.exists(spec['output']):
+            raise RuntimeError(f'场景 {name} 运行失败 (退出码 {proc.returncode})')
+        with open(spec['output'], encoding='utf-8') as f:
+            result = json.load(f)
+        result['server'] = mock.stats()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def print_result(name, r):
+    extract = r['extract'] or {}
+    merge = r.get('merge') or {}
+    line = (f"{name:>10}: {r['succeeded']}/{r['jobs']} 成功  解析 p50 {extract.get('p50_ms', 0):.0f}ms "
+            f"p95 {extract.get('p95_ms', 0):.0f}ms  总耗时 {r['wall_s']:.2f}s  "
+            f"吞吐 {r['throughput_mb_s'] or 0:.1f}MB/s  合并 {merge.get('mean_ms', 0):.0f}ms")
+    if 'cpu_s' in r:
+        line += f"  CPU {r['cpu_s']['total']:.2f}s  内存峰值 {r['peak_rss_mb']:.0f}MB"
+    if r['retries'] or r['failed']:
+        line += f"  重试 {r['retries']} 次  失败 {r['failed']}"
+    print(line)
+
+
+def lookup(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data if isinstance(data, (int, float)) else None
+
+
+def compare(old, new):
+    print(f"对比 {old.get('commit')} ({old.get('created')}) -> {new.get('commit')} ({new.get('created')})")
+    for name in SCENARIOS:
+        before, after = old['scenarios'].get(name), new['scenarios'].get(name)
+        if not before or not after:
+            continue
+        print(f'[{name}]')
+        for path, label, higher_is_better in COMPARED:
+            a, b = lookup(before, path), lookup(after, path)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            mark = '' if abs(change) < 5 else ('  (改善)' if better else '  (变差)')
+            print(f'  {label:<14} {a:>10.2f} -> {b:>10.2f}  {change:+6.1f}%{mark}')
+
+
+def load_result(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='端到端下载基准 (本地替身服务器)')
+    parser.add_argument('-s', '--scenarios', default=','.join(SCENARIOS), help='要运行的场景，逗号分隔')
+    parser.add_argument('-n', '--jobs', type=int, default=8, help='batch / concurrent 场景的任务数')
+    parser.add_argument('-j', '--workers', type=int, default=4, help='concurrent 场景的下载槽位数')
+    parser.add_argument('-c', '--connections', type=int, default=4, help='每个任务的连接数')
+    parser.add_argument('--timeout', type=float, default=600, help='每个场景的超时 (秒)')
+    parser.add_argument('--scratch-root', default=None, metavar='DIR',
+                        help='下载临时目录建在这里 (默认在保存目录下)，用于测试临时目录和保存目录不在同一磁盘的情况')
+    parser.add_argument('-o', '--output', help='结果文件 (默认 benchmarks/results/<时间>-<提交>.json)')
+    parser.add_argument('--compare', nargs='+', metavar='JSON',
+                        help='对比结果：给一个文件时与本次运行对比，给两个文件时只对比不运行')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    add_network_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_child(args.child)
+    if args.compare and len(args.compare) >= 2:
+        compare(load_result(args.compare[0]), load_result(args.compare[1]))
+        return 0
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    config = network_config(args)
+    print('生成测试视频...')
+    mock = create_server(config)
+    mock.start()
+    commit, dirty = git_revision()
+    now = datetime.datetime.now()
+    report = {
+        'version': 1,
+        'commit': commit,
+        'dirty': dirty,
+        'created': now.isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'yt_dlp': yt_dlp_version,
+        'config': dict(config, jobs=args.jobs, workers=args.workers, connections=args.connections,
+                       scratch_root=args.scratch_root),
+        'scenarios': {},
+    }
+    try:
+        for name in names:
+            jobs, workers = scenario_plan(name, args.jobs, args.workers)
+            result = spawn_scenario(mock, name, jobs, workers, args.connections, args.timeout, args.scratch_root)
+            report['scenarios'][name] = result
+            print_result(name, result)
+    finally:
+        mock.stop()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{now:%Y%m%d-%H%M%S}-{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'结果已保存: {output}')
+
+    if args.compare:
+        compare(load_result(args.compare[0]), report)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+# 任务列表在大量行下的响应速度
+#
+#   python -m benchmarks.bench_job_table [--rows 50000] [--active 300] [--frames 100] [--json result.json]
+#
+# 载入 rows 条历史记录，再加入 active 个正在下载的任务，按每秒 10 帧的节奏推送进度帧
+# (每帧所有活动任务都有变化)，统计每帧从 apply_frame 到界面重绘完成的耗时；
+# 另外测量加载、排序、筛选的耗时。不需要显示器 (使用 offscreen 平台)。
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+from job_history import JobHistory
+from job_table import CREATED, PROGRESS, UPLOADER, JobTableWidget
+
+
+def fill_history(history, rows):
+    states = ('done',) * 8 + ('failed', 'cancelled')
+    now = time.time()
+    with history.lock:
+        history.conn.executemany(
+            "INSERT INTO history (url, title, uploader, state, bytes, created_at, finished_at, output, message) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((f'https://www.bilibili.com/video/BV1Hist{i:05d}', f'历史视频 {i}', f'UP主{i % 500}',
+              states[i % len(states)], random.randint(1, 500) * 1024 * 1024, now - (rows - i) * 60,
+              now - (rows - i) * 60 + 30, None, '') for i in range(rows)))
+        history.conn.commit()
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='任务列表基准')
+    parser.add_argument('--rows', type=int, default=50000, help='历史记录数')
+    parser.add_argument('--active', type=int, default=300, help='同时更新进度的任务数')
+    parser.add_argument('--frames', type=int, default=100, help='进度帧数')
+    parser.add_argument('--json', help='结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as directory:
+        history = JobHistory(os.path.join(directory, 'history.sqlite3'))
+        fill_history(history, args.rows)
+
+        started = time.perf_counter()
+        widget = JobTableWidget(history)
+        widget.resize(1000, 700)
+        widget.show()
+        app.processEvents()
+        results = {'rows': args.rows, 'active': args.active, 'load_ms': (time.perf_counter() - started) * 1000}
+        history.close()
+
+    model = widget.model
+    results['add_active_ms'] = timed(lambda: [model.add_job(i, f'https://www.bilibili.com/video/BV1Live{i:05d}',
+                                                            f'下载中 {i}', f'UP主{i % 50}')
+                                              for i in range(1, args.active + 1)])
+    app.processEvents()
+
+    frame_times = []
+    for frame_no in range(args.frames):
+        frame = {job_id: {'progress': min(100.0, frame_no + job_id % 10), 'speed': random.uniform(1, 5) * 1024 * 1024,
+                          'downloaded': frame_no * 1024 * 1024, 'total': 200 * 1024 * 1024}
+                 for job_id in range(1, args.active + 1)}
+        started = time.perf_counter()
+        model.apply_frame(frame)
+        widget.view.viewport().repaint()
+        app.processEvents()
+        frame_times.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(frame_times)
+    results['frame_ms'] = {'mean': statistics.mean(ordered), 'p50': ordered[len(ordered) // 2],
+                           'p95': ordered[int(len(ordered) * 0.95)], 'max': ordered[-1]}
+
+    results['sort_progress_ms'] = timed(widget.view.sortByColumn, PROGRESS, Qt.DescendingOrder)
+    results['sort_uploader_ms'] = timed(widget.view.sortByColumn, UPLOADER, Qt.AscendingOrder)
+    results['sort_created_ms'] = timed(widget.view.sortByColumn, CREATED, Qt.DescendingOrder)
+    results['filter_state_ms'] = timed(widget.state_combo.setCurrentIndex, 1)
+    widget.search_input.setText('UP主7')
+    results['filter_text_ms'] = timed(widget.apply_filter)
+    results['filtered_rows'] = model.rowCount()
+
+    print(f"{args.rows} 行历史 + {args.active} 个活动任务")
+    print(f"  加载 {results['load_ms']:.0f}ms，加入活动任务 {results['add_active_ms']:.0f}ms")
+    print(f"  每帧 (更新 + 重绘): 平均 {results['frame_ms']['mean']:.1f}ms  p95 {results['frame_ms']['p95']:.1f}ms  "
+          f"最长 {results['frame_ms']['max']:.1f}ms")
+    print(f"  排序: 进度 {results['sort_progress_ms']:.0f}ms  UP主 {results['sort_uploader_ms']:.0f}ms  "
+          f"时间 {results['sort_created_ms']:.0f}ms")
+    print(f"  筛选: 状态 {results['filter_state_ms']:.0f}ms  关键字 {results['filter_text_ms']:.0f}ms "
+          f"({results['filtered_rows']} 行)")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,146 @@
+# 冷启动基准：导入耗时、图形界面首次绘制、引擎就绪、命令行启动
+#
+#   python -m benchmarks.bench_startup [-r 5] [--budget-ms 400] [--json result.json]
+#
+# 每次测量都启动新的 Python 进程 (工作目录为空的临时目录，没有元数据 / ffmpeg 缓存，第二次起 ffmpeg 路径有缓存)：
+#   import      python -X importtime 导入 main / cli，列出耗时最多的模块
+#   first_paint 从启动子进程到主窗口第一次绘制完成 (offscreen 平台，不需要显示器)
+#   ready       从启动子进程到后台加载的下载引擎就绪
+#   cli         python -m cli --help / python -m cli queue 的总耗时
+# 给了 --budget-ms 时，首次绘制的中位数超出预算返回 1，可以放在 CI 里防止启动变慢。
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_env(**extra):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    env.update(extra)
+    return env
+
+
+def parse_importtime(stderr, top=10):
+    # -X importtime 的每行: "import time: self [us] | cumulative | 模块名" (缩进表示被谁导入)
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(cumulative) / 1000, depth))
+    total = sum(ms for name, ms, depth in modules if depth == 0)
+    heaviest = sorted(((name, ms) for name, ms, depth in modules if depth <= 1), key=lambda m: -m[1])[:top]
+    return {'total_ms': total, 'top': [{'module': name, 'ms': round(ms, 1)} for name, ms in heaviest]}
+
+
+def measure_imports(module, cwd):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=cwd,
+                          env=child_env(), capture_output=True, text=True, check=True)
+    return parse_importtime(proc.stderr)
+
+
+def run_gui_child(started, timeout):
+    # 在子进程中执行：显示主窗口，记录第一次绘制和引擎就绪的时间 (相对父进程启动子进程的时刻)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    from main import BilibiliDownloader
+
+    result = {}
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and 'first_paint_ms' not in result:
+                # 本次绘制结束后再记录
+                QTimer.singleShot(0, lambda: result.setdefault('first_paint_ms', (time.time() - started) * 1000))
+            return False
+
+    app = QApplication(sys.argv)
+    window = BilibiliDownloader()
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.download_queue.ready_signal.connect(
+        lambda: result.setdefault('ready_ms', (time.time() - started) * 1000))
+    window.show()
+    deadline = time.time() + timeout
+    while ('first_paint_ms' not in result or 'ready_ms' not in result) and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    window.close()
+    print(json.dumps(result))
+
+
+def measure_gui(cwd, timeout):
+    started = time.time()
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--child-gui', repr(started),
+                           '--timeout', str(timeout)], cwd=cwd, env=child_env(QT_QPA_PLATFORM='offscreen'),
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_command(args, cwd):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=cwd, env=child_env(), capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return {'median': statistics.median(values), 'min': values[0], 'max': values[-1]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='冷启动基准')
+    parser.add_argument('-r', '--runs', type=int, default=5, help='每项测量的次数')
+    parser.add_argument('--budget-ms', type=float, default=None, help='首次绘制的预算 (毫秒)，超出时返回 1')
+    parser.add_argument('--timeout', type=float, default=30.0, help='等待窗口绘制 / 引擎就绪的超时 (秒)')
+    parser.add_argument('--json', help='结果写入 JSON 文件')
+    parser.add_argument('--child-gui', type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child_gui is not None:
+        run_gui_child(args.child_gui, args.timeout)
+        return 0
+
+    with tempfile.TemporaryDirectory() as cwd:
+        results = {'python': sys.version.split()[0], 'runs': args.runs,
+                   'import_main': measure_imports('main', cwd), 'import_cli': measure_imports('cli', cwd)}
+        gui = [measure_gui(cwd, args.timeout) for _ in range(args.runs)]
+        results['first_paint_ms'] = summarize(r.get('first_paint_ms') for r in gui)
+        results['ready_ms'] = summarize(r.get('ready_ms') for r in gui)
+        results['cli_help_ms'] = summarize(measure_command(['-m', 'cli', '--help'], cwd) for _ in range(args.runs))
+        results['cli_queue_ms'] = summarize(measure_command(['-m', 'cli', 'queue'], cwd) for _ in range(args.runs))
+
+    for name in ('import_main', 'import_cli'):
+        print(f"import {name[len('import_'):]}: {results[name]['total_ms']:.0f}ms")
+        for item in results[name]['top'][:6]:
+            print(f"  {item['ms']:7.1f}ms  {item['module']}")
+    for name, label in (('first_paint_ms', '首次绘制'), ('ready_ms', '引擎就绪'),
+                        ('cli_help_ms', 'cli --help'), ('cli_queue_ms', 'cli queue')):
+        r = results[name]
+        print(f"{label}: " + (f"中位数 {r['median']:.0f}ms (最快 {r['min']:.0f}ms, 最慢 {r['max']:.0f}ms)" if r else '超时'))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.budget_ms is not None:
+        paint = results['first_paint_ms']
+        if paint is None or paint['median'] > args.budget_ms:
+            print(f"首次绘制超出预算 {args.budget_ms:.0f}ms")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+# yt-dlp 实例池的收益：每个任务新建 YoutubeDL vs 从实例池借用
+#
+#   python -m benchmarks.bench_ydl_pool [-n 50] [--json result.json]
+#
+# 每个 "任务" 都在同一份离线的视频信息上做一次格式选择 (与使用元数据缓存时的下载任务一致)，
+# 并按任务覆盖格式、输出模板和进度回调，只比较 yt-dlp 实例的准备开销，不涉及网络。
+
+import argparse
+import copy
+import json
+import statistics
+import time
+
+from ydl_pool import YdlPool, create_ydl
+
+OPTIONS = {'quiet': True, 'no_warnings': True}
+FORMATS = ['bestvideo+bestaudio/best', '30080+bestaudio/best', 'bestvideo[height<=720]+bestaudio/best']
+
+
+def sample_info():
+    formats = []
+    for height, format_id in ((1080, '30080'), (720, '30064'), (480, '30032'), (360, '30016')):
+        formats.append({'format_id': format_id, 'url': f'http://127.0.0.1/{format_id}.m4s', 'ext': 'mp4',
+                        'vcodec': 'avc1.640032', 'acodec': 'none', 'height': height, 'width': height * 16 // 9,
+                        'tbr': height * 2, 'protocol': 'https'})
+    formats.append({'format_id': '30280', 'url': 'http://127.0.0.1/30280.m4s', 'ext': 'm4a', 'vcodec': 'none',
+                    'acodec': 'mp4a.40.2', 'abr': 192, 'protocol': 'https'})
+    return {'id': 'BV1xx411c7mD', 'title': 'benchmark', 'extractor': 'BiliBili', 'extractor_key': 'BiliBili',
+            'webpage_url': 'https://www.bilibili.com/video/BV1xx411c7mD', 'formats': formats, 'duration': 60}
+
+
+def job_overrides(i):
+    return {'format': FORMATS[i % len(FORMATS)], 'outtmpl': f'job{i}/%(title)s.%(ext)s',
+            'progress_hooks': [lambda d: None]}
+
+
+def run_fresh(info, count):
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        with create_ydl(dict(OPTIONS, **job_overrides(i))) as ydl:
+            ydl.process_ie_result(copy.deepcopy(info), download=False)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_pooled(info, count):
+    pool = YdlPool()
+    pool.prewarm(OPTIONS, background=False)
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        with pool.borrow(OPTIONS, **job_overrides(i)) as ydl:
+            ydl.process_ie_result(copy.deepcopy(info), download=False)
+        timings.append(time.perf_counter() - started)
+    pool.close()
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'jobs': len(timings),
+        'mean_ms': statistics.mean(timings) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'total_s': sum(timings),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='yt-dlp 实例池基准')
+    parser.add_argument('-n', '--jobs', type=int, default=50, help='任务数')
+    parser.add_argument('--json', help='结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    info = sample_info()
+    # 先各跑一次，排除解析器模块第一次导入 / 正则编译对结果的影响
+    run_fresh(info, 1)
+    results = {'fresh': summarize(run_fresh(info, args.jobs)), 'pooled': summarize(run_pooled(info, args.jobs))}
+    results['speedup'] = results['fresh']['mean_ms'] / results['pooled']['mean_ms']
+
+    for name in ('fresh', 'pooled'):
+        r = results[name]
+        print(f"{name:>7}: 平均 {r['mean_ms']:.2f}ms  p50 {r['p50_ms']:.2f}ms  p95 {r['p95_ms']:.2f}ms  "
+              f"共 {r['total_s']:.2f}s ({r['jobs']} 个任务)")
+    print(f"实例池每个任务快 {results['speedup']:.1f} 倍")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,469 @@
+# 离线的 B 站替身服务器 (基准测试 / 故障注入用)
+#
+#   python -m benchmarks.mock_bilibili --port 8800 [--latency 0.05] [--bandwidth 20] [--error-rate 0.05]
+#
+# 路径的第一段是原来的主机名，其余部分和线上接口一致：
+#   /www.bilibili.com/video/<BV号>/               视频页 (window.__INITIAL_STATE__)
+#   /api.bilibili.com/x/web-interface/nav          WBI 签名密钥
+#   /api.bilibili.com/x/web-interface/view         视频信息
+#   /api.bilibili.com/x/player/pagelist            分P列表
+#   /api.bilibili.com/x/player/wbi/playurl         DASH 视频流 / 音频流地址
+#   /api.bilibili.com/x/player/wbi/v2              字幕 / 章节
+#   /api.bilibili.com/x/v2/dm/web/seg.so           弹幕分段 (protobuf，每 6 分钟一段)
+#   /comment.bilibili.com/<cid>.xml                弹幕 (XML，边生成边发送)
+#   /i0.hdslb.com/bfs/subtitle/<cid>.json          CC 字幕
+#   /upos-sz-mirrorcos.bilivideo.com/.../<cid>-1-<格式>.m4s   DASH 流 (支持 Range)
+#
+# 任意 BV 号都返回同一份测试视频 (ffmpeg 生成，和线上一样是 ftyp / moov / sidx / moof... 的布局)。
+# 弹幕按 (cid, 分段) 用固定的随机种子现场生成，每个视频 danmaku 条，平均分布在各分段中。
+# install_redirect() 让本进程中的 yt-dlp 把访问 B 站的请求转到这里；playurl 返回的视频流地址本来就指向这里。
+#
+# 可以模拟的网络条件：每个请求的固定延迟、所有连接共享的带宽上限、按比例返回错误状态码
+# (503 / 412 / 403...) 或发送一半数据后断开连接。
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import yt_dlp
+from yt_dlp.networking import Request
+
+from bandwidth import TokenBucket
+from danmaku import SEGMENT_SECONDS, segment_count, write_varint
+
+REDIRECT_HOSTS = ('www.bilibili.com', 'api.bilibili.com')
+CDN_HOST = 'upos-sz-mirrorcos.bilivideo.com'
+VIDEO_FORMAT = 30064     # 720P
+AUDIO_FORMAT = 30280     # 192K
+CHUNK_SIZE = 64 * 1024
+MEDIA_RE = re.compile(r'-(\d+)\.m4s$')
+DANMAKU_TEXTS = ('哈哈哈哈', '前方高能', '2333', 'awsl', '来了来了', '名场面', '好耶', 'ok', '这也太强了吧',
+                 '第一次看到这里', '经典', '泪目')
+
+# 未登录时 nav 接口返回的 WBI 密钥图片 (只用文件名计算签名)
+WBI_IMG = {
+    'img_url': 'https://i0.hdslb.com/bfs/wbi/7cd084941338484aae1ad9425b84077c.png',
+    'sub_url': 'https://i0.hdslb.com/bfs/wbi/4932caff0ff746eab6f01bf08b70ac45.png',
+}
+
+
+# ----------------------------------------------------------------------
+# 测试视频
+# ----------------------------------------------------------------------
+
+def generate_media(seconds=20, video_kbps=3000, directory=None):
+    # 返回 {格式: 文件路径}；相同参数的文件只生成一次
+    from ffmpeg_locator import find_ffmpeg
+
+    directory = directory or os.path.join(tempfile.gettempdir(), 'bilibili-mock-media',
+                                          f'{seconds}s-{video_kbps}k')
+    os.makedirs(directory, exist_ok=True)
+    # 与 B 站的 DASH 流相同：fMP4，开头是 moov + 全局 sidx，每 2 秒一个分片
+    movflags = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof+global_sidx', '-f', 'mp4']
+    streams = {
+        VIDEO_FORMAT: ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=25', '-t', str(seconds),
+                       '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-g', '50',
+                       '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k'],
+        AUDIO_FORMAT: ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000', '-t', str(seconds),
+                       '-c:a', 'aac', '-b:a', '192k'],
+    }
+    files = {}
+    for format_id, args in streams.items():
+        path = os.path.join(directory, f'{format_id}.m4s')
+        if not os.path.exists(path):
+            tmp = path + '.tmp'
+            subprocess.run([find_ffmpeg() or 'ffmpeg', '-y', '-v', 'error', *args, *movflags, tmp], check=True)
+            os.replace(tmp, path)
+        files[format_id] = path
+    return files
+
+
+# ----------------------------------------------------------------------
+# 服务器
+# ----------------------------------------------------------------------
+
+class MockBilibili:
+    def __init__(self, media, duration, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 error_rate=0.0, error_statuses=(503,), drop_rate=0.0, seed=None, danmaku=0):
+        self.media = {format_id: open(path, 'rb').read() for format_id, path in media.items()}
+        self.duration = duration
+        self.danmaku = danmaku
+        self.latency = latency
+        # B/s，所有连接共享；None 表示不限。突发量只给 0.1 秒，空闲一段时间后也不会瞬间发出一大块
+        self.bucket = TokenBucket(bandwidth, bandwidth / 10 if bandwidth else None)
+        self.bucket_lock = threading.Lock()
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses) or (503,)
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-bilibili', daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = dict(self.counters)
+            if reset:
+                self.counters.clear()
+        return stats
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+    def pick_error(self):
+        with self.rng_lock:
+            return self.rng.choice(self.error_statuses)
+
+    def throttle(self, nbytes):
+        with self.bucket_lock:
+            self.bucket.consume(nbytes)
+            delay = self.bucket.wait_time()
+        if delay > 0:
+            time.sleep(delay)
+
+    # -- 接口数据 --------------------------------------------------------
+
+    @staticmethod
+    def ids(bvid):
+        aid = zlib.crc32(bvid.encode()) & 0x7fffffff
+        return aid, aid // 2 + 1
+
+    def video_data(self, bvid):
+        aid, cid = self.ids(bvid)
+        title = f'基准测试视频 {bvid}'
+        return {
+            'bvid': bvid, 'aid': aid, 'cid': cid, 'title': title, 'desc': '离线基准测试',
+            'pic': 'https://i0.hdslb.com/bfs/archive/benchmark.jpg', 'pubdate': 1700000000,
+            'duration': self.duration, 'rights': {},
+            'owner': {'mid': 1, 'name': '基准测试'},
+            'stat': {'view': 1000, 'like': 100, 'reply': 10},
+            'pages': [{'cid': cid, 'page': 1, 'part': title, 'duration': self.duration}],
+        }
+
+    def webpage(self, bvid):
+        state = {'videoData': self.video_data(bvid), 'upData': {'name': '基准测试', 'mid': 1}, 'tags': []}
+        return (f'<!DOCTYPE html><html><head><title>{state["videoData"]["title"]}_哔哩哔哩_bilibili</title></head>'
+                f'<body><script>window.__INITIAL_STATE__={json.dumps(state, ensure_ascii=False)};'
+                '(function(){})();</script></body></html>').encode()
+
+    def play_info(self, bvid):
+        _, cid = self.ids(bvid)
+        deadline = int(time.time()) + 7200
+
+        def stream_url(format_id):
+            return f'{self.base_url}/{CDN_HOST}/upgcxcode/{cid}/{cid}-1-{format_id}.m4s?e=mock&deadline={deadline}'
+
+        video_bandwidth = len(self.media[VIDEO_FORMAT]) * 8 // max(self.duration, 1)
+        audio_bandwidth = len(self.media[AUDIO_FORMAT]) * 8 // max(self.duration, 1)
+        return {
+            'quality': 64, 'format': 'mp4720', 'timelength': self.duration * 1000,
+            'accept_quality': [64], 'accept_description': ['高清 720P'],
+            'support_formats': [{'quality': 64, 'format': 'mp4720', 'new_description': '720P 高清',
+                                 'display_desc': '720P', 'codecs': ['avc1.64001F']}],
+            'dash': {
+                'duration': self.duration,
+                'video': [{'id': 64, 'baseUrl': stream_url(VIDEO_FORMAT), 'backupUrl': [],
+                           'bandwidth': video_bandwidth, 'mimeType': 'video/mp4', 'codecs': 'avc1.64001F',
+                           'width': 1280, 'height': 720, 'frameRate': '25'}],
+                'audio': [{'id': AUDIO_FORMAT, 'baseUrl': stream_url(AUDIO_FORMAT), 'backupUrl': [],
+                           'bandwidth': audio_bandwidth, 'mimeType': 'audio/mp4', 'codecs': 'mp4a.40.2'}],
+            },
+        }
+
+    def api(self, path, query):
+        bvid = (query.get('bvid') or [''])[0]
+        if path == '/x/web-interface/nav':
+            return {'code': -101, 'message': '账号未登录', 'data': {'isLogin': False, 'wbi_img': WBI_IMG}}
+        if not bvid:
+            return {'code': -400, 'message': '请求错误'}
+        if path in ('/x/web-interface/view', '/x/web-interface/wbi/view'):
+            return {'code': 0, 'data': self.video_data(bvid)}
+        if path == '/x/player/pagelist':
+            return {'code': 0, 'data': self.video_data(bvid)['pages']}
+        if path == '/x/player/wbi/playurl':
+            return {'code': 0, 'data': self.play_info(bvid)}
+        if path == '/x/player/wbi/v2':
+            _, cid = self.ids(bvid)
+            subtitles = [{'lan': 'zh-CN', 'lan_doc': '中文（中国）',
+                          'subtitle_url': f'{self.base_url}/i0.hdslb.com/bfs/subtitle/{cid}.json'}]
+            return {'code': 0, 'data': {'subtitle': {'subtitles': subtitles}, 'view_points': []}}
+        return None
+
+    # -- 弹幕 / 字幕 -----------------------------------------------------
+
+    def danmaku_records(self, cid, index):
+        segments = segment_count(self.duration)
+        count = self.danmaku // segments + (1 if index <= self.danmaku % segments else 0)
+        if index > segments or not count:
+            return
+        rng = random.Random(cid * 1000 + index)
+        start = (index - 1) * SEGMENT_SECONDS * 1000
+        end = min(index * SEGMENT_SECONDS, self.duration) * 1000
+        for i in range(count):
+            mode = rng.choice((1, 1, 1, 1, 1, 1, 4, 5))
+            yield {
+                'id': cid * 10 ** 8 + index * 10 ** 6 + i, 'progress': rng.randrange(start, max(end, start + 1)),
+                'mode': mode, 'fontsize': rng.choice((25, 25, 25, 18, 36)),
+                'color': rng.choice((0xffffff, 0xffffff, 0xfe0302, 0x00cd00)), 'mid_hash': f'{rng.getrandbits(32):08x}',
+                'content': f'{rng.choice(DANMAKU_TEXTS)} {i % 100}', 'ctime': 1700000000 + rng.randrange(86400 * 30),
+                'weight': rng.randrange(11), 'pool': 0,
+            }
+
+    def danmaku_segment(self, cid, index):
+        # DmSegMobileReply: 字段 1 为重复的 DanmakuElem
+        fields = ((1, 'id'), (2, 'progress'), (3, 'mode'), (4, 'fontsize'), (5, 'color'), (6, 'mid_hash'),
+                  (7, 'content'), (8, 'ctime'), (9, 'weight'), (11, 'pool'))
+        out = bytearray()
+        for record in self.danmaku_records(cid, index):
+            elem = bytearray()
+            for number, name in fields:
+                value = record[name]
+                if isinstance(value, str):
+                    value = value.encode('utf-8')
+                    write_varint(elem, number << 3 | 2)
+                    write_varint(elem, len(value))
+                    elem += value
+                elif value:
+                    write_varint(elem, number << 3)
+                    write_varint(elem, value)
+            write_varint(out, 1 << 3 | 2)
+            write_varint(out, len(elem))
+            out += elem
+        return bytes(out)
+
+    def danmaku_xml(self, cid):
+        # 逐个分段生成，不把整个文件放在内存中
+        yield (f'<?xml version="1.0" encoding="UTF-8"?><i><chatserver>chat.bilibili.com</chatserver>'
+               f'<chatid>{cid}</chatid><maxlimit>{self.danmaku}</maxlimit>').encode()
+        for index in range(1, segment_count(self.duration) + 1):
+            yield ''.join(
+                f'<d p="{r["progress"] / 1000:.5f},{r["mode"]},{r["fontsize"]},{r["color"]},{r["ctime"]},'
+                f'{r["pool"]},{r["mid_hash"]},{r["id"]},{r["weight"]}">{r["content"]}</d>'
+                for r in self.danmaku_records(cid, index)).encode()
+        yield b'</i>'
+
+    def subtitle(self, cid):
+        body = [{'from': t, 'to': t + 2.5, 'content': f'第 {t // 3 + 1} 句字幕'} for t in range(0, self.duration, 3)]
+        return {'font_size': 0.4, 'body': body}
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock.count('requests')
+                if mock.latency:
+                    time.sleep(mock.latency)
+                parsed = urlparse(self.path)
+                host, _, path = parsed.path.lstrip('/').partition('/')
+                path = '/' + path
+                kind = 'media' if MEDIA_RE.search(path) else 'api'
+                if mock.roll(mock.error_rate):
+                    mock.count(f'injected_{kind}_errors')
+                    return self.reply(mock.pick_error(), b'')
+
+                if kind == 'media':
+                    return self.send_media(int(MEDIA_RE.search(path).group(1)))
+                if host == 'www.bilibili.com':
+                    match = re.match(r'^/video/(BV[0-9A-Za-z]{10})/?$', path)
+                    if match:
+                        return self.reply(200, mock.webpage(match.group(1)), 'text/html; charset=utf-8')
+                elif host == 'api.bilibili.com':
+                    query = parse_qs(parsed.query)
+                    if path == '/x/v2/dm/web/seg.so':
+                        mock.count('danmaku_requests')
+                        return self.reply(200, mock.danmaku_segment(int(query['oid'][0]),
+                                                                    int(query['segment_index'][0])),
+                                          'application/octet-stream')
+                    data = mock.api(path, query)
+                    if data is not None:
+                        mock.count('api_requests')
+                        return self.reply(200, json.dumps(data, ensure_ascii=False).encode(), 'application/json')
+                elif host == 'comment.bilibili.com':
+                    match = re.match(r'^/(\d+)\.xml$', path)
+                    if match:
+                        return self.send_stream(mock.danmaku_xml(int(match.group(1))), 'text/xml')
+                elif host == 'i0.hdslb.com':
+                    match = re.match(r'^/bfs/subtitle/(\d+)\.json$', path)
+                    if match:
+                        return self.reply(200, json.dumps(mock.subtitle(int(match.group(1))), ensure_ascii=False)
+                                          .encode(), 'application/json')
+                self.reply(404, b'')
+
+            def send_stream(self, chunks, content_type):
+                # 长度未知：发送完关闭连接
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for chunk in chunks:
+                        self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def reply(self, status, body, content_type='text/plain'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_media(self, format_id):
+                data = mock.media.get(format_id)
+                if data is None:
+                    return self.reply(404, b'')
+                start, end, status = 0, len(data) - 1, 200
+                match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                    status = 206
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                body = memoryview(data)[start:end + 1]
+                self.send_response(status)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                self.end_headers()
+                mock.count('media_requests')
+
+                # 注入断线：发送一半后直接关闭连接
+                limit = len(body) // 2 if len(body) > CHUNK_SIZE and mock.roll(mock.drop_rate) else len(body)
+                sent = 0
+                try:
+                    while sent < limit:
+                        chunk = body[sent:min(sent + CHUNK_SIZE, limit)]
+                        mock.throttle(len(chunk))
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                mock.count('bytes_sent', sent)
+                if sent < len(body):
+                    mock.count('injected_drops')
+                    self.close_connection = True
+
+        return Handler
+
+
+def install_redirect(base_url, hosts=REDIRECT_HOSTS):
+    # 本进程中 yt-dlp 访问这些主机的请求改发到替身服务器；返回撤销函数
+    original = yt_dlp.YoutubeDL.urlopen
+
+    def urlopen(ydl, req):
+        if isinstance(req, str):
+            req = Request(req)
+        url = getattr(req, 'url', None)
+        parsed = urlparse(url) if isinstance(url, str) else None
+        if parsed is None or parsed.hostname not in hosts:
+            return original(ydl, req)
+        req.url = f'{base_url}/{parsed.hostname}{parsed.path}' + (f'?{parsed.query}' if parsed.query else '')
+        response = original(ydl, req)
+        # 解析器按响应地址判断是否被重定向，这里还原成原地址
+        response.url = url
+        return response
+
+    yt_dlp.YoutubeDL.urlopen = urlopen
+    return lambda: setattr(yt_dlp.YoutubeDL, 'urlopen', original)
+
+
+def parse_statuses(text):
+    return tuple(int(status) for status in text.split(',') if status.strip())
+
+
+def add_network_arguments(parser):
+    # 命令行参数，bench_download.py 共用
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的延迟 (秒)')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='总带宽上限 (MB/s)，0 表示不限')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误状态码的请求比例 (0-1)')
+    parser.add_argument('--error-status', type=parse_statuses, default=(503,), help='注入的状态码，逗号分隔')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='视频流发送一半后断开的比例 (0-1)')
+    parser.add_argument('--seconds', type=int, default=20, help='测试视频时长 (秒)')
+    parser.add_argument('--video-kbps', type=int, default=3000, help='测试视频码率 (kbps)')
+    parser.add_argument('--seed', type=int, help='故障注入的随机种子')
+
+
+def network_config(args):
+    return {
+        'latency': args.latency, 'bandwidth': args.bandwidth, 'error_rate': args.error_rate,
+        'error_status': list(args.error_status), 'drop_rate': args.drop_rate, 'seconds': args.seconds,
+        'video_kbps': args.video_kbps, 'seed': args.seed,
+    }
+
+
+def create_server(config, port=0):
+    media = generate_media(config['seconds'], config['video_kbps'])
+    return MockBilibili(media, config['seconds'], port=port, latency=config['latency'],
+                        bandwidth=config['bandwidth'] * 1024 * 1024 or None, error_rate=config['error_rate'],
+                        error_statuses=config['error_status'], drop_rate=config['drop_rate'], seed=config['seed'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线的 B 站替身服务器')
+    parser.add_argument('--port', type=int, default=8800)
+    add_network_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = create_server(network_config(args), args.port)
+    base_url = mock.start()
+    print(f'已启动: {base_url}')
+    print(f'  视频页: {base_url}/www.bilibili.com/video/BV1xx411c7mD/')
+    print(f'  视频流: {mock.play_info("BV1xx411c7mD")["dash"]["video"][0]["baseUrl"]}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,534 @@
+# 命令行 / 后台服务入口 (不加载 Qt)
+#
+#   python -m cli info URL                    查看视频信息和可选格式
+#   python -m cli download URL [URL ...]      下载一个或多个视频
+#   python -m cli batch FILE [FILE ...]       批量下载 (每行一个链接，- 表示标准输入，自动展开分P / 合集)
+#   python -m cli queue [--resume]            查看 / 继续上次未完成的任务
+#   python -m cli daemon [--inbox FILE]       后台运行：持续从 inbox 文件 (或标准输入) 读取新链接
+#   python -m cli serve [--port 8765]         后台运行并提供 HTTP 控制接口 (见 api_server.py)
+#   python -m cli history [--export FILE]     查看 / 导出历史任务的传输统计 (.csv 或 .json)
+#   python -m cli archive [--verify]          查看 / 校验下载存档 (已下载过的视频会自动跳过)
+#   python -m cli cookies [--refresh]         查看登录状态 / 立即刷新 Cookies (登录请使用图形界面扫码)
+#   python -m cli danmaku URL [-i FILE] [--ass] [--srt]   导出弹幕 (.dmk，可选 ASS / SRT) 和 CC 字幕
+#
+# 加 --json 时每个事件输出一行 JSON，方便其他程序解析。
+# 运行指标: --metrics-file FILE 定期写入 Prometheus 文本格式的文件，--metrics-port 单独提供 /metrics。
+# yt-dlp 的警告 / 错误通过 logging 输出到标准错误 (--log-level 调整)。
+# downloader_core (yt-dlp) 和 cookie_manager 在命令真正需要时才导入，--help / queue / history 等不需要加载它们。
+
+import argparse
+import json
+import logging
+import queue
+import signal
+import sys
+import threading
+import time
+
+from download_archive import get_download_archive
+from download_journal import get_download_journal
+from format_selector import FormatIndex, parse_policy
+from postprocess import AUDIO_FORMATS
+from transfer_metrics import format_speed, get_transfer_history
+
+
+class Reporter:
+    # 把引擎事件输出为文本或 JSON 行；进度已由引擎的进度总线合并，每帧每个任务一行
+    def __init__(self, json_mode=False, stream=None):
+        self.json_mode = json_mode
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.failed = 0
+        self.succeeded = 0
+        self.engine = None
+
+    def event(self, name, text=None, **fields):
+        with self.lock:
+            if self.json_mode:
+                line = json.dumps(dict(event=name, time=round(time.time(), 3), **fields), ensure_ascii=False)
+            else:
+                line = text if text is not None else f"{name}: {fields}"
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.on('job_added', self.on_job_added)
+        engine.on('job_state', lambda job_id, state: self.event(
+            'state', f"[#{job_id}] 状态: {state}", job=job_id, state=state))
+        engine.on('progress_frame', self.on_progress_frame)
+        engine.on('job_status', lambda job_id, text: self.event(
+            'status', f"[#{job_id}] {text}", job=job_id, message=text))
+        engine.on('job_finished', self.on_finished)
+        engine.on('idle', lambda: self.event('idle', "队列中的任务已全部处理完毕。"))
+
+    def on_job_added(self, job_id):
+        job = self.engine.jobs.get(job_id)
+        url = job.url if job is not None else ''
+        self.event('added', f"[#{job_id}] 已加入下载队列: {url}", job=job_id, url=url)
+
+    def on_progress_frame(self, frame):
+        for job_id, fields in sorted(frame.items()):
+            if fields.get('phase') in ('done', 'failed'):
+                continue
+            text = f"[#{job_id}] {fields.get('progress', 0):.1f}% {format_speed(fields.get('speed') or 0)}"
+            if fields.get('eta') is not None:
+                text += f" 剩余 {int(fields['eta'])}s"
+            self.event('progress', text, job=job_id, **fields)
+
+    def on_finished(self, job_id, success, msg):
+        if success:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.event('finished', f"[#{job_id}] {'任务结束' if success else '任务失败'}: {msg}",
+                   job=job_id, success=success, message=msg)
+
+
+def install_stop_handlers(stop_event):
+    # SIGINT / SIGTERM 时不直接退出，先停止下载并保存断点
+    def handler(signum, frame):
+        stop_event.set()
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handler)
+
+
+def create_engine(args, reporter):
+    from downloader_core import DownloadEngine
+    engine = DownloadEngine(max_workers=args.jobs, save_path=args.output, connections_per_job=args.connections,
+                            progress_interval=args.progress_interval, outtmpl=args.outtmpl,
+                            verify_archive=args.verify_archive, policy=parse_policy(args.policy) if args.policy else None,
+                            scratch_dir=args.scratch_dir)
+    if args.rate:
+        engine.set_rate_limit(int(args.rate * 1024 * 1024))
+    reporter.attach(engine)
+    return engine
+
+
+def wait_for_engine(engine, stop_event, busy=None):
+    # 等待所有任务结束；busy() 返回 True 表示还有任务会继续提交
+    while not stop_event.is_set():
+        if (busy is None or not busy()) and engine.wait_idle(0.5):
+            return True
+        stop_event.wait(0.5)
+    engine.stop_all()
+    return False
+
+
+def submit_url(engine, reporter, url, args):
+    from downloader_core import QueueFullError
+    try:
+        engine.submit(url, args.format, audio_only=args.audio_only, audio_format=args.audio_format, clip=args.clip)
+        return True
+    except QueueFullError as e:
+        reporter.event('rejected', f"无法加入队列: {url} ({e})", url=url, message=str(e))
+        return False
+
+
+def finish(reporter, completed):
+    if not completed:
+        reporter.event('stopped', "已停止，未完成的任务下次可用 queue --resume 继续。")
+        return 130
+    return 1 if reporter.failed else 0
+
+
+def cmd_info(args, reporter, stop_event):
+    from downloader_core import fetch_video_info, list_video_formats, video_summary
+    info, from_cache = fetch_video_info(args.url)
+    summary = video_summary(info, from_cache)
+    formats = list_video_formats(info)
+    selected = None
+    if args.policy:
+        # 按策略预览会选中的视频 + 音频组合和预计大小
+        policy = parse_policy(args.policy)
+        index = FormatIndex.from_info(info)
+        video, audio = index.select(policy)
+        selected = {
+            'policy': policy.spec,
+            'format': '+'.join(s['format_id'] for s in (video, audio) if s is not None),
+            'size': index.estimated_size(policy),
+        }
+    if args.json:
+        reporter.event('info', info=summary, formats=formats, selected=selected)
+        return 0
+    print(f"标题: {summary['title']}")
+    print(f"UP主: {summary['uploader']}")
+    print(f"时长: {summary['duration']}s" + (" (缓存)" if from_cache else ""))
+    for f in formats:
+        print(f"  {f['format_id']:>8}  {f['display']}")
+    if selected:
+        size = f"{selected['size'] / 1024 / 1024:.1f}MB" if selected['size'] else '未知'
+        print(f"策略 {selected['policy']} 选择: {selected['format'] or '无'} (预计 {size})")
+    return 0
+
+
+def cmd_download(args, reporter, stop_event):
+    from downloader_core import parse_batch_text
+    engine = create_engine(args, reporter)
+    for url in parse_batch_text('\n'.join(args.urls)):
+        submit_url(engine, reporter, url, args)
+    return finish(reporter, wait_for_engine(engine, stop_event))
+
+
+def read_batch_files(paths):
+    from downloader_core import parse_batch_text
+    text = []
+    for path in paths:
+        if path == '-':
+            text.append(sys.stdin.read())
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                text.append(f.read())
+    return parse_batch_text('\n'.join(text))
+
+
+def cmd_batch(args, reporter, stop_event):
+    from downloader_core import PlaylistExpander
+    engine = create_engine(args, reporter)
+    urls = read_batch_files(args.files)
+    reporter.event('batch', f"共 {len(urls)} 个链接，开始展开...", urls=len(urls))
+
+    expander = PlaylistExpander(urls, can_accept=engine.can_accept)
+    expander.on('entry', lambda entry: submit_url(engine, reporter, entry['url'], args))
+    expander.on('status', lambda text: reporter.event('expand', text, message=text))
+    expander.on('finished', lambda count: reporter.event('expanded', f"展开完成，共 {count} 个视频", count=count))
+    worker = threading.Thread(target=expander.run, name='expand', daemon=True)
+    worker.start()
+
+    completed = wait_for_engine(engine, stop_event, busy=worker.is_alive)
+    expander.stop()
+    return finish(reporter, completed)
+
+
+def cmd_queue(args, reporter, stop_event):
+    entries = get_download_journal().pending_entries()
+    for entry in entries:
+        reporter.event('journal', f"[{entry.state}] {entry.url} (失败 {entry.attempts} 次)"
+                       + (f" - {entry.data.get('message')}" if entry.data.get('message') else ''),
+                       key=entry.key, url=entry.url, state=entry.state, attempts=entry.attempts,
+                       save_path=entry.save_path)
+    if not args.resume:
+        if not entries:
+            reporter.event('journal_empty', "没有未完成的任务。")
+        return 0
+
+    engine = create_engine(args, reporter)
+    restored = engine.restore_from_journal()
+    reporter.event('restored', f"已恢复 {restored} 个任务", count=restored)
+    return finish(reporter, wait_for_engine(engine, stop_event))
+
+
+class InboxReader:
+    # 增量读取 inbox 文件新追加的行；文件被清空 / 替换后从头读
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read(self):
+        from downloader_core import parse_batch_text
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                f.seek(0, 2)
+                if f.tell() < self.offset:
+                    self.offset = 0
+                f.seek(self.offset)
+                text = f.read()
+                # 只处理完整的行，写了一半的行留到下一次
+                complete = text.rfind('\n') + 1
+                self.offset += len(text[:complete].encode('utf-8'))
+                return parse_batch_text(text[:complete])
+        except FileNotFoundError:
+            return []
+
+
+def cmd_daemon(args, reporter, stop_event):
+    from downloader_core import parse_batch_text
+    engine = create_engine(args, reporter)
+    restored = engine.restore_from_journal()
+    reporter.event('daemon', f"后台服务已启动，恢复了 {restored} 个任务", restored=restored,
+                   inbox=args.inbox or '-')
+
+    incoming = queue.Queue()
+    if args.inbox:
+        inbox = InboxReader(args.inbox)
+    else:
+        def read_stdin():
+            for line in sys.stdin:
+                for url in parse_batch_text(line):
+                    incoming.put(url)
+        threading.Thread(target=read_stdin, name='stdin', daemon=True).start()
+
+    backlog = []
+    while not stop_event.is_set():
+        if args.inbox:
+            backlog.extend(inbox.read())
+        while True:
+            try:
+                backlog.append(incoming.get_nowait())
+            except queue.Empty:
+                break
+        # 队列满时留在 backlog 中，下一轮再提交
+        while backlog and engine.can_accept():
+            submit_url(engine, reporter, backlog.pop(0), args)
+        stop_event.wait(args.poll)
+
+    reporter.event('stopping', "正在停止，运行中的任务会保存断点...")
+    engine.stop_all()
+    return 0
+
+
+def cmd_history(args, reporter, stop_event):
+    history = get_transfer_history()
+    if args.export:
+        count = history.export(args.export)
+        reporter.event('exported', f"已导出 {count} 条记录到 {args.export}", path=args.export, count=count)
+        return 0
+    for item in history.recent(args.limit):
+        speed = format_speed(item['mean_speed']) if item.get('mean_speed') else '-'
+        ttfb = f"{item['ttfb']:.2f}s" if item.get('ttfb') is not None else '-'
+        reporter.event('history', f"{'成功' if item.get('success') else '失败'} {item.get('url')} "
+                       f"{item.get('bytes', 0) / 1024 / 1024:.1f}MB 平均 {speed} 首字节 {ttfb} "
+                       f"停顿 {item.get('stall_seconds', 0):.1f}s", **item)
+    summary = history.aggregate()
+    reporter.event('summary', f"共 {summary['jobs']} 个任务，成功 {summary['succeeded']} 个，"
+                   f"总流量 {summary['bytes'] / 1024 / 1024:.1f}MB", **summary)
+    return 0
+
+
+def cmd_archive(args, reporter, stop_event):
+    # 列出存档；--verify 重新计算哈希，文件丢失 / 损坏的记录会被删除，下次会重新下载
+    archive = get_download_archive()
+    checked = invalid = 0
+    for record in archive.entries():
+        if stop_event.is_set():
+            break
+        ok = True
+        if args.verify:
+            checked += 1
+            ok = archive.check(record, verify=True)
+            if not ok:
+                invalid += 1
+                archive.remove(record)
+        page = f" P{record['page']}" if record['page'] else ''
+        reporter.event('archive', f"{'' if ok else '[失效] '}{record['bvid']}{page} [{record['format']}] "
+                       f"{record['path']} ({record['size'] / 1024 / 1024:.1f}MB)", valid=ok, **record)
+    if args.verify:
+        reporter.event('verified', f"已校验 {checked} 个文件，{invalid} 个失效并已从存档中删除",
+                       checked=checked, invalid=invalid)
+    return 0
+
+
+def cmd_cookies(args, reporter, stop_event):
+    from cookie_manager import CookieRefreshError, get_cookie_manager
+    manager = get_cookie_manager()
+    if args.refresh:
+        try:
+            refreshed = manager.maybe_refresh(force_check=True)
+        except (CookieRefreshError, OSError) as e:
+            reporter.event('error', f"刷新失败: {e}", message=str(e))
+            return 1
+        reporter.event('refreshed' if refreshed else 'fresh',
+                       "已刷新登录状态" if refreshed else "登录状态有效，无需刷新", refreshed=refreshed)
+    status = manager.status()
+    if not status['logged_in']:
+        reporter.event('cookies', f"未登录 (或 {manager.path} 中的 SESSDATA 已过期)，只能下载 480P 及以下画质", **status)
+        return 0
+    expires = time.strftime('%Y-%m-%d %H:%M', time.localtime(status['expires_at'])) if status['expires_at'] else '会话结束'
+    reporter.event('cookies', f"已登录 (UID {status['user_id']})，SESSDATA 有效期至 {expires}，"
+                   f"{'可以自动刷新' if status['refreshable'] else '没有 refresh_token，过期后需要重新扫码登录'}",
+                   **status)
+    return 0
+
+
+def cmd_danmaku(args, reporter, stop_event):
+    from danmaku import DanmakuExporter
+    from downloader_core import parse_batch_text
+    urls = parse_batch_text('\n'.join(args.urls)) + (read_batch_files(args.input) if args.input else [])
+    if not urls:
+        reporter.event('error', "没有要导出的链接", message="没有要导出的链接")
+        return 1
+    exporter = DanmakuExporter(workers=args.workers,
+                               on_status=lambda text: reporter.event('status', text, message=text))
+
+    def stop_on_signal():
+        # Ctrl+C 时中止正在进行的下载
+        stop_event.wait()
+        exporter.stop()
+    threading.Thread(target=stop_on_signal, name='danmaku-stop', daemon=True).start()
+    ass_options = {'width': args.width, 'height': args.height, 'fontsize': args.font_size, 'opacity': args.opacity}
+    for url in urls:
+        if stop_event.is_set():
+            break
+        try:
+            results = exporter.export(url, args.output, ass=args.ass, srt=args.srt, subtitles=not args.no_subtitles,
+                                      source=args.source, all_pages=args.all_pages, ass_options=ass_options)
+        except Exception as e:
+            if stop_event.is_set():
+                break
+            reporter.failed += 1
+            reporter.event('failed', f"导出失败: {url} ({e})", url=url, message=str(e))
+            continue
+        reporter.succeeded += 1
+        for result in results:
+            reporter.event('exported', f"{result['title']}: {result['count']} 条弹幕 -> {result['files'][0]}",
+                           url=url, **result)
+    if stop_event.is_set():
+        reporter.event('stopped', "已停止导出。")
+        return 130
+    return 1 if reporter.failed else 0
+
+
+def cmd_serve(args, reporter, stop_event):
+    import asyncio
+    from api_server import ApiServer
+
+    engine = create_engine(args, reporter)
+    restored = engine.restore_from_journal()
+    server = ApiServer(engine, host=args.host, port=args.port, token=args.token)
+
+    async def run():
+        await server.start()
+        reporter.event('serve', f"HTTP 接口已启动: http://{server.host}:{server.port}/api/jobs (恢复了 {restored} 个任务)",
+                       host=server.host, port=server.port, restored=restored)
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(0.5)
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+    reporter.event('stopping', "正在停止，运行中的任务会保存断点...")
+    engine.stop_all()
+    return 0
+
+
+def add_engine_options(parser, progress_interval=1.0):
+    parser.add_argument('-o', '--output', default='downloads', help='保存目录 (默认 downloads)')
+    parser.add_argument('-f', '--format', default=None, help='视频格式 ID (默认自动选择最佳画质)')
+    parser.add_argument('-p', '--policy', default=None,
+                        help='没有指定格式时按策略选择，如 "1080p,hevc,smallest" (见 format_selector.py)')
+    parser.add_argument('-a', '--audio-only', action='store_true', help='只下载音频流')
+    parser.add_argument('--audio-format', choices=AUDIO_FORMATS, default=None,
+                        help='音频转封装为该格式 (不转码，编码不兼容时保留原格式)')
+    parser.add_argument('--clip', default=None, metavar='START-END',
+                        help='只下载这个时间段，如 1:30-2:45 或 90- (按分片截取，精度为几秒)')
+    parser.add_argument('-j', '--jobs', type=int, default=3, help='同时下载的任务数')
+    parser.add_argument('-c', '--connections', type=int, default=4, help='每个任务的连接数')
+    parser.add_argument('--rate', type=float, default=0, help='全局限速 (MB/s)，0 表示不限速')
+    parser.add_argument('--outtmpl', default=None,
+                        help='文件名模板 (yt-dlp 语法，默认 "%%(title)s [%%(id)s].%%(ext)s")')
+    parser.add_argument('--scratch-dir', default=None, metavar='DIR',
+                        help='下载中的临时文件目录 (默认为保存目录下的 .incomplete)；放在本地磁盘时完成后复制到保存目录')
+    parser.add_argument('--verify-archive', action='store_true',
+                        help='跳过已下载的视频前先校验文件哈希 (较慢)')
+    parser.add_argument('--progress-interval', type=float, default=progress_interval,
+                        help=f'进度输出间隔 (秒，默认 {progress_interval})')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cli', description='Bilibili 视频下载器 (命令行)')
+    parser.add_argument('--json', action='store_true', help='以 JSON 行输出事件')
+    parser.add_argument('--metrics-file', metavar='FILE', help='定期把运行指标写入该文件 (Prometheus 文本格式)')
+    parser.add_argument('--metrics-interval', type=float, default=15.0, help='写入指标文件的间隔 (秒)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='在该端口提供 /metrics (只监听本机)')
+    parser.add_argument('--log-level', default='WARNING', help='日志级别 (DEBUG / INFO / WARNING / ERROR)')
+    parser.add_argument('--http2', action='store_true',
+                        help='实验性：对 https 使用 HTTP/2 (需要安装 h2，服务器不支持时连接会失败)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    info = commands.add_parser('info', help='查看视频信息和可选格式')
+    info.add_argument('url')
+    info.add_argument('-p', '--policy', default=None, help='预览该格式策略会选中的组合')
+    info.set_defaults(func=cmd_info)
+
+    download = commands.add_parser('download', help='下载视频')
+    download.add_argument('urls', nargs='+', metavar='URL', help='链接 / BV 号 / av 号')
+    add_engine_options(download)
+    download.set_defaults(func=cmd_download)
+
+    batch = commands.add_parser('batch', help='从文件批量下载 (- 表示标准输入)')
+    batch.add_argument('files', nargs='+', metavar='FILE')
+    add_engine_options(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    journal = commands.add_parser('queue', help='查看上次未完成的任务')
+    journal.add_argument('--resume', action='store_true', help='继续下载这些任务')
+    add_engine_options(journal)
+    journal.set_defaults(func=cmd_queue)
+
+    daemon = commands.add_parser('daemon', help='后台运行，持续接收新链接')
+    daemon.add_argument('--inbox', help='监视的链接文件 (不指定则从标准输入读取)')
+    daemon.add_argument('--poll', type=float, default=2.0, help='检查 inbox 的间隔 (秒)')
+    add_engine_options(daemon)
+    daemon.set_defaults(func=cmd_daemon)
+
+    history = commands.add_parser('history', help='查看 / 导出历史任务的传输统计')
+    history.add_argument('--limit', type=int, default=20, help='显示最近多少条')
+    history.add_argument('--export', metavar='FILE', help='导出到文件 (.csv 或 .json)')
+    history.set_defaults(func=cmd_history)
+
+    archive = commands.add_parser('archive', help='查看 / 校验下载存档')
+    archive.add_argument('--verify', action='store_true', help='重新计算哈希校验文件，删除失效的记录')
+    archive.set_defaults(func=cmd_archive)
+
+    cookies = commands.add_parser('cookies', help='查看登录状态 / 刷新 Cookies')
+    cookies.add_argument('--refresh', action='store_true', help='向 B 站确认，需要时立即刷新')
+    cookies.set_defaults(func=cmd_cookies)
+
+    danmaku = commands.add_parser('danmaku', help='导出弹幕和 CC 字幕')
+    danmaku.add_argument('urls', nargs='*', metavar='URL', help='链接 / BV 号 / av 号')
+    danmaku.add_argument('-i', '--input', nargs='+', metavar='FILE', help='从文件读取链接 (每行一个，- 表示标准输入)')
+    danmaku.add_argument('-o', '--output', default='downloads', help='保存目录 (默认 downloads)')
+    danmaku.add_argument('--ass', action='store_true', help='同时生成 ASS 字幕 (可以直接在播放器中显示弹幕)')
+    danmaku.add_argument('--srt', action='store_true', help='同时生成 SRT 字幕')
+    danmaku.add_argument('--no-subtitles', action='store_true', help='不下载 CC 字幕')
+    danmaku.add_argument('--source', choices=('auto', 'protobuf', 'xml'), default='auto',
+                         help='弹幕来源 (默认先用分段接口，失败时改用 XML 接口)')
+    danmaku.add_argument('--all-pages', action='store_true', help='导出多 P 视频的所有分P')
+    danmaku.add_argument('-w', '--workers', type=int, default=4, help='同时下载的弹幕分段数')
+    danmaku.add_argument('--width', type=int, default=1920, help='ASS 画面宽度')
+    danmaku.add_argument('--height', type=int, default=1080, help='ASS 画面高度')
+    danmaku.add_argument('--font-size', type=int, default=48, help='ASS 标准字号')
+    danmaku.add_argument('--opacity', type=float, default=0.8, help='ASS 弹幕不透明度 (0-1)')
+    danmaku.set_defaults(func=cmd_danmaku)
+
+    serve = commands.add_parser('serve', help='后台运行并提供 HTTP 控制接口')
+    serve.add_argument('--host', default='127.0.0.1', help='监听地址 (默认只允许本机访问)')
+    serve.add_argument('--port', type=int, default=8765, help='监听端口')
+    serve.add_argument('--token', default=None, help='访问令牌 (Authorization: Bearer <token> 或 ?token=)')
+    add_engine_options(serve, progress_interval=0.25)
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    reporter = Reporter(json_mode=args.json)
+    stop_event = threading.Event()
+    install_stop_handlers(stop_event)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    metrics_writer = None
+    try:
+        if args.http2:
+            # 必须在第一次创建连接池之前启用
+            import http_client
+            http_client.configure(http2=True)
+        if args.metrics_port or args.metrics_file:
+            import metrics
+        if args.metrics_port:
+            metrics.start_metrics_server(args.metrics_port)
+        if args.metrics_file:
+            metrics_writer = metrics.MetricsFileWriter(args.metrics_file, args.metrics_interval).start()
+        return args.func(args, reporter, stop_event)
+    except Exception as e:
+        reporter.event('error', f"出错: {e}", message=str(e))
+        return 1
+    finally:
+        if metrics_writer is not None:
+            metrics_writer.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+# 登录状态 (Cookies) 管理
+#
+# 扫码登录得到的 Cookies 写成标准的 Netscape 格式 cookies.txt (带域名、路径和过期时间，yt-dlp / curl 都能读)，
+# 程序启动后只读取一次，放进一个共享的内存 Cookie 罐：所有 yt-dlp 实例 (解析、下载) 和共享连接池都直接使用它，
+# 不再各自读文件，刷新后的 Cookies 也立即对所有任务生效。
+#
+# SESSDATA 有有效期，过期后只能拿到 480P。登录时一并保存 refresh_token，在 SESSDATA 快过期
+# (或 B 站接口提示需要刷新) 时按 B 站网页端的流程主动刷新，长时间的批量下载不会中途掉画质。
+# 刷新流程: cookie/info 检查 -> correspond 页面取 refresh_csrf -> cookie/refresh 换新 Cookies -> confirm/refresh 作废旧的。
+
+import base64
+import hashlib
+import http.cookiejar
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from yt_dlp.cookies import YoutubeDLCookieJar
+
+import http_client
+
+COOKIE_FILE = 'cookies.txt'
+STATE_FILE = 'cookies.meta.json'    # refresh_token 和上次检查时间 (不属于 Cookie，不写进 cookies.txt)
+LEGACY_FILE = 'cookies.json'        # 旧版本登录后保存的 {name: value}
+
+REFRESH_MARGIN = 3 * 24 * 3600      # SESSDATA 剩余有效期不足 3 天时刷新
+CHECK_INTERVAL = 12 * 3600          # 至少每 12 小时向 B 站确认一次是否需要刷新
+AUTO_REFRESH_INTERVAL = 1800
+
+logger = logging.getLogger('bilibili.cookies')
+
+COOKIE_INFO_URL = 'https://passport.bilibili.com/x/passport-login/web/cookie/info'
+CORRESPOND_URL = 'https://www.bilibili.com/correspond/1/{}'
+COOKIE_REFRESH_URL = 'https://passport.bilibili.com/x/passport-login/web/cookie/refresh'
+CONFIRM_REFRESH_URL = 'https://passport.bilibili.com/x/passport-login/web/confirm/refresh'
+
+# B 站网页端生成 correspondPath 用的 RSA 公钥
+REFRESH_PUBLIC_KEY = (
+    'MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQDLgd2OAkcGVtoE3ThUREbio0Eg'
+    'Uc/prcajMKXvkCKFCWhJYJcLkcM2DKKcSeFpD/j6Boy538YXnR6VhcuUJOhH2x71'
+    'nzPjfdTcqMz7djHum0qSZA0AyCBDABUqCrfNgCiJ00Ra7GmRj+YCK1NJEuewlb40'
+    'JNrRuoEUXpabUzGB8QIDAQAB'
+)
+
+
+class CookieRefreshError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# RSA-OAEP (SHA-256)：只用标准库，避免为一次加密引入密码学依赖
+# ----------------------------------------------------------------------
+
+def _der_items(data, pos, end):
+    # 解析一层 DER：返回 [(tag, 内容起始, 内容结束)]
+    items = []
+    while pos < end:
+        tag = data[pos]
+        length = data[pos + 1]
+        pos += 2
+        if length & 0x80:
+            count = length & 0x7F
+            length = int.from_bytes(data[pos:pos + count], 'big')
+            pos += count
+        items.append((tag, pos, pos + length))
+        pos += length
+    return items
+
+
+def load_public_key(b64):
+    # SubjectPublicKeyInfo -> (n, e)
+    der = base64.b64decode(b64)
+    _, start, end = _der_items(der, 0, len(der))[0]
+    _, bits_start, bits_end = _der_items(der, start, end)[1]
+    _, key_start, key_end = _der_items(der, bits_start + 1, bits_end)[0]   # 跳过 BIT STRING 的填充位数
+    modulus, exponent = _der_items(der, key_start, key_end)
+    return int.from_bytes(der[modulus[1]:modulus[2]], 'big'), int.from_bytes(der[exponent[1]:exponent[2]], 'big')
+
+
+def _mgf1(seed, length):
+    output = b''
+    counter = 0
+    while len(output) < length:
+        output += hashlib.sha256(seed + counter.to_bytes(4, 'big')).digest()
+        counter += 1
+    return output[:length]
+
+
+def rsa_oaep_encrypt(message, public_key):
+    n, e = public_key
+    k = (n.bit_length() + 7) // 8
+    h_len = hashlib.sha256().digest_size
+    if len(message) > k - 2 * h_len - 2:
+        raise ValueError("message too long")
+    db = hashlib.sha256(b'').digest() + b'\0' * (k - len(message) - 2 * h_len - 2) + b'\1' + message
+    seed = os.urandom(h_len)
+    masked_db = bytes(a ^ b for a, b in zip(db, _mgf1(seed, k - h_len - 1)))
+    masked_seed = bytes(a ^ b for a, b in zip(seed, _mgf1(masked_db, h_len)))
+    encoded = int.from_bytes(b'\0' + masked_seed + masked_db, 'big')
+    return pow(encoded, e, n).to_bytes(k, 'big')
+
+
+def correspond_path(timestamp):
+    return rsa_oaep_encrypt(f'refresh_{timestamp}'.encode(), load_public_key(REFRESH_PUBLIC_KEY)).hex()
+
+
+# ----------------------------------------------------------------------
+# Cookie 管理
+# ----------------------------------------------------------------------
+
+class CookieManager:
+    def __init__(self, path=COOKIE_FILE, state_path=STATE_FILE):
+        self.path = path
+        self.state_path = state_path
+        # YoutubeDLCookieJar 是标准 CookieJar 的子类 (内部有锁，可以多线程共用)，yt-dlp 和 requests 都能直接使用
+        self.jar = YoutubeDLCookieJar(path)
+        self.lock = threading.RLock()
+        self.state = {}
+        self.loaded = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- 读取 / 保存 ----
+
+    def load(self):
+        # 只在第一次使用时读取文件；之后所有任务共用内存中的 Cookie 罐
+        if self.loaded:
+            return self
+        with self.lock:
+            if self.loaded:
+                return self
+            self.loaded = True
+            if os.path.exists(self.path):
+                try:
+                    self.jar.load(ignore_discard=True, ignore_expires=False)
+                except (OSError, http.cookiejar.LoadError):
+                    self.jar.clear()
+            elif os.path.exists(LEGACY_FILE):
+                self._import_legacy()
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                self.state = {}
+            # 共享连接池 (封面、分段下载、接口请求) 也带上登录状态；CookieJar 按域名匹配，不会发给其他网站
+            http_client.get_session().cookies = self.jar
+            return self
+
+    def _import_legacy(self):
+        # 旧版本只保存了 {name: value}，没有域名和过期时间：按 .bilibili.com 的会话 Cookie 导入
+        try:
+            with open(LEGACY_FILE, 'r', encoding='utf-8') as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(cookies, dict) or not cookies:
+            return
+        for name, value in cookies.items():
+            self.jar.set_cookie(make_cookie(name, str(value), '.bilibili.com', None))
+        self.save()
+
+    def save(self):
+        # 先写临时文件再替换，写到一半退出也不会损坏已有的 cookies.txt
+        with self.lock:
+            temp_path = self.path + '.tmp'
+            self.jar.save(temp_path, ignore_discard=True, ignore_expires=False)
+            if os.name == 'posix':
+                os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+            self.jar.filename = self.path
+            temp_path = self.state_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(temp_path, self.state_path)
+
+    def save_login(self, cookies, refresh_token=None):
+        # 扫码登录成功：cookies 是登录会话的 CookieJar (保留域名 / 过期时间)
+        with self.lock:
+            self.load()
+            self.jar.clear()
+            for cookie in cookies:
+                self.jar.set_cookie(cookie)
+            self.state = {'refresh_token': refresh_token, 'checked_at': time.time()}
+            self.save()
+            if os.path.exists(LEGACY_FILE):
+                os.remove(LEGACY_FILE)
+
+    def attach(self, ydl):
+        # 让 yt-dlp 实例使用共享的 Cookie 罐 (代替 cookiefile 参数：不再每个实例读一次文件、退出时写回文件)
+        self.load()
+        ydl.__dict__['cookiejar'] = self.jar
+        return ydl
+
+    # ---- 状态 ----
+
+    def get(self, name, domain='.bilibili.com'):
+        for cookie in self.jar:
+            if cookie.name == name and cookie.domain.endswith(domain.lstrip('.')):
+                return cookie
+        return None
+
+    def is_logged_in(self):
+        self.load()
+        cookie = self.get('SESSDATA')
+        return cookie is not None and not cookie.is_expired()
+
+    def expires_at(self):
+        cookie = self.get('SESSDATA')
+        return cookie.expires if cookie is not None and cookie.expires else None
+
+    def status(self):
+        self.load()
+        return {
+            'logged_in': self.is_logged_in(),
+            'user_id': getattr(self.get('DedeUserID'), 'value', None),
+            'expires_at': self.expires_at(),
+            'refreshable': bool(self.state.get('refresh_token')),
+            'checked_at': self.state.get('checked_at'),
+        }
+
+    # ---- 刷新 ----
+
+    def needs_refresh(self, session=None, force_check=False):
+        # 快过期时直接刷新；否则定期询问 B 站 (服务端可能提前要求刷新)
+        expires = self.expires_at()
+        if expires and expires - time.time() < REFRESH_MARGIN:
+            return True
+        if not force_check and time.time() - (self.state.get('checked_at') or 0) < CHECK_INTERVAL:
+            return False
+        data = self._api(session or self._session(), 'get', COOKIE_INFO_URL, params={'csrf': self._csrf()})
+        self.state['checked_at'] = time.time()
+        self.save()
+        return bool(data.get('refresh'))
+
+    def maybe_refresh(self, force_check=False):
+        # 返回是否刷新了 Cookies；没有登录或没有 refresh_token 时什么也不做
+        with self.lock:
+            self.load()
+            if not self.is_logged_in() or not self.state.get('refresh_token'):
+                return False
+            session = self._session()
+            if not self.needs_refresh(session, force_check):
+                return False
+            self.refresh(session)
+            return True
+
+    def refresh(self, session=None):
+        with self.lock:
+            session = session or self._session()
+            old_token = self.state.get('refresh_token')
+            if not old_token:
+                raise CookieRefreshError("没有 refresh_token，请重新扫码登录")
+            timestamp = int(time.time() * 1000)
+            page = session.get(CORRESPOND_URL.format(correspond_path(timestamp)), timeout=15).text
+            match = re.search(r'<div id="1-name">([^<]+)</div>', page)
+            if not match:
+                raise CookieRefreshError("获取 refresh_csrf 失败，请重新扫码登录")
+            # 新的 Cookies 通过 Set-Cookie 直接写进共享的 Cookie 罐
+            data = self._api(session, 'post', COOKIE_REFRESH_URL, data={
+                'csrf': self._csrf(), 'refresh_csrf': match.group(1),
+                'source': 'main_web', 'refresh_token': old_token,
+            })
+            self.state['refresh_token'] = data.get('refresh_token') or old_token
+            self.state['checked_at'] = time.time()
+            self.save()
+            # 确认刷新，旧的 refresh_token 作废 (失败也不影响已经拿到的新 Cookies)
+            try:
+                self._api(session, 'post', CONFIRM_REFRESH_URL,
+                          data={'csrf': self._csrf(), 'refresh_token': old_token})
+            except (CookieRefreshError, OSError):
+                pass
+
+    def _session(self):
+        session = http_client.create_session()
+        session.cookies = self.jar
+        return session
+
+    def _csrf(self):
+        return getattr(self.get('bili_jct'), 'value', '')
+
+    @staticmethod
+    def _api(session, method, url, **kwargs):
+        try:
+            res = getattr(session, method)(url, timeout=15, **kwargs)
+            payload = res.json()
+        except ValueError:
+            raise CookieRefreshError(f"接口返回格式错误: {url}")
+        if payload.get('code') != 0:
+            raise CookieRefreshError(f"刷新登录状态失败: {payload.get('message')} ({payload.get('code')})")
+        return payload.get('data') or {}
+
+    # ---- 后台定时刷新 ----
+
+    def start_auto_refresh(self, interval=AUTO_REFRESH_INTERVAL):
+        # 长时间运行 (队列、后台服务) 时定期检查；只启动一个线程
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._auto_refresh, args=(interval,),
+                                            name='cookie-refresh', daemon=True)
+            self._thread.start()
+
+    def stop_auto_refresh(self):
+        self._stop.set()
+
+    def _auto_refresh(self, interval):
+        while not self._stop.is_set():
+            try:
+                if self.maybe_refresh():
+                    logger.info("登录状态已刷新，新的 SESSDATA 有效期至 %s", time.ctime(self.expires_at() or 0))
+            except Exception as e:
+                # 网络错误等下一轮再试；Cookies 真的过期后只能重新扫码登录
+                logger.warning("刷新登录状态失败: %s", e)
+            self._stop.wait(interval)
+
+
+def make_cookie(name, value, domain, expires, path='/', secure=False):
+    return http.cookiejar.Cookie(
+        0, name, value, None, False, domain, True, domain.startswith('.'), path, True,
+        secure, expires, expires is None, None, None, {})
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_cookie_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CookieManager()
+        return _manager
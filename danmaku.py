@@ -0,0 +1,747 @@
+# 弹幕 / CC 字幕导出 (不依赖 Qt 和 yt-dlp)
+#
+# 弹幕来源：
+#   protobuf  /x/v2/dm/web/seg.so，每 6 分钟一段。所有分段并发请求，但只保留一个固定大小的窗口，
+#             按顺序取结果、解析、写出，内存中最多只有 窗口大小 个分段的原始数据。
+#   xml       comment.bilibili.com/<cid>.xml (旧接口，条数有上限)，用 XMLPullParser 边下载边解析，
+#             每条处理完就从树中删掉，不会建立完整的 DOM。protobuf 接口失败时自动改用它。
+# 解析出的弹幕直接写入紧凑的 .dmk 文件 (格式见 DanmakuWriter)，不在内存中保存全部弹幕；
+# 需要时再从 .dmk 流式生成 ASS (滚动 / 顶部 / 底部分轨道排布) 或 SRT。
+# CC 字幕通过 /x/player/wbi/v2 获取列表，每种语言写成一个 .srt (部分字幕需要登录)。
+
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import http_client
+
+API_BASE = 'https://api.bilibili.com'
+COMMENT_BASE = 'https://comment.bilibili.com'
+SEGMENT_SECONDS = 360
+BLOCK_RECORDS = 4096        # .dmk 每块的弹幕条数 (写入时内存中最多缓存这么多条)
+READ_SIZE = 64 * 1024
+
+BV_RE = re.compile(r'(BV[0-9A-Za-z]{10})')
+AV_RE = re.compile(r'(?:^|/)av(\d+)', re.IGNORECASE)
+PAGE_RE = re.compile(r'_p(\d+)$')
+
+# 弹幕模式：1-3 滚动，4 底部，5 顶部，6 逆向滚动，7 高级 (定位)，8 代码，9 BAS
+SCROLL_MODES = (1, 2, 3)
+BOTTOM_MODE = 4
+TOP_MODE = 5
+REVERSE_MODE = 6
+
+
+class DanmakuError(Exception):
+    pass
+
+
+def safe_name(title):
+    return re.sub(r'[\\/:*?"<>|\r\n\t]+', '_', title).strip(' .') or 'untitled'
+
+
+def output_base(video):
+    # 和视频文件同名 (默认文件名模板 "%(title)s [%(id)s]")
+    return f"{safe_name(video['title'])} [{video['id']}]"
+
+
+# ----------------------------------------------------------------------
+# protobuf (只实现解析 DmSegMobileReply 需要的部分)
+# ----------------------------------------------------------------------
+
+# DanmakuElem 的字段号 -> 名称；progress 单位为毫秒，ctime 为发送时间 (秒)
+ELEM_FIELDS = {1: 'id', 2: 'progress', 3: 'mode', 4: 'fontsize', 5: 'color', 6: 'mid_hash', 7: 'content',
+               8: 'ctime', 9: 'weight', 11: 'pool'}
+TEXT_FIELDS = (6, 7)
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(data, pos, end):
+    # 返回 (字段号, 值)；长度分隔的字段返回 (起点, 终点)
+    while pos < end:
+        key, pos = read_varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = read_varint(data, pos)
+        elif wire == 2:
+            length, pos = read_varint(data, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire == 1:
+            value = int.from_bytes(data[pos:pos + 8], 'little')
+            pos += 8
+        elif wire == 5:
+            value = int.from_bytes(data[pos:pos + 4], 'little')
+            pos += 4
+        else:
+            raise DanmakuError(f"无法解析的弹幕数据 (wire type {wire})")
+        yield field, value
+
+
+def new_record():
+    return {'id': 0, 'progress': 0, 'mode': 1, 'fontsize': 25, 'color': 0xffffff, 'mid_hash': '',
+            'content': '', 'ctime': 0, 'weight': 0, 'pool': 0}
+
+
+def parse_segment(data):
+    # 逐条返回一个分段中的弹幕 (dict)
+    for field, value in iter_fields(data, 0, len(data)):
+        if field != 1 or not isinstance(value, tuple):
+            continue
+        record = new_record()
+        for elem_field, elem_value in iter_fields(data, *value):
+            name = ELEM_FIELDS.get(elem_field)
+            if name is None:
+                continue
+            if elem_field in TEXT_FIELDS:
+                elem_value = data[elem_value[0]:elem_value[1]].decode('utf-8', 'replace')
+            record[name] = elem_value
+        yield record
+
+
+# ----------------------------------------------------------------------
+# XML (流式解析)
+# ----------------------------------------------------------------------
+
+def parse_xml_attrs(p, text):
+    # p="出现时间(秒),模式,字号,颜色,发送时间,弹幕池,用户哈希,弹幕ID[,权重]"
+    parts = p.split(',')
+    record = new_record()
+    record.update(progress=int(round(float(parts[0]) * 1000)), mode=int(parts[1]), fontsize=int(parts[2]),
+                  color=int(parts[3]), ctime=int(parts[4]), pool=int(parts[5]), mid_hash=parts[6],
+                  id=int(parts[7]) if len(parts) > 7 and parts[7].isdigit() else 0,
+                  weight=int(parts[8]) if len(parts) > 8 and parts[8].isdigit() else 0, content=text or '')
+    return record
+
+
+def parse_xml(chunks):
+    # chunks: 字节块的可迭代对象；每解析完一个 <d> 就返回并从树中删除
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == 'd' and elem.get('p'):
+                try:
+                    yield parse_xml_attrs(elem.get('p'), elem.text)
+                except (ValueError, IndexError):
+                    pass
+            if elem is not root:
+                root.clear()
+    parser.close()
+
+
+# ----------------------------------------------------------------------
+# .dmk 文件
+# ----------------------------------------------------------------------
+
+MAGIC = b'BDMK\x01'
+BLOCK_HEADER = struct.Struct('<IIII')   # 压缩后长度, 条数, 最早 / 最晚出现时间 (毫秒)
+
+# 列：(名称, 编码)；delta 为排序后的差值，zigzag 为有符号差值，uint 为原值，text 为长度列 + 内容列
+COLUMNS = (
+    ('progress', 'delta'),
+    ('id', 'zigzag'),
+    ('ctime', 'zigzag'),
+    ('mode', 'uint'),
+    ('fontsize', 'uint'),
+    ('color', 'uint'),
+    ('weight', 'uint'),
+    ('pool', 'uint'),
+    ('mid_hash', 'text'),
+    ('content', 'text'),
+)
+
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_uints(values):
+    # 全部小于 128 (模式、字号、弹幕池大多如此) 时每个值一个字节，读取时不用逐个解析 varint
+    if all(0 <= v < 0x80 for v in values):
+        return b'\x00' + bytes(values)
+    out = bytearray(b'\x01')
+    for value in values:
+        write_varint(out, max(value, 0))
+    return bytes(out)
+
+
+def decode_uints(data, count):
+    if data[:1] == b'\x00':
+        return list(data[1:1 + count])
+    values = []
+    pos = 1
+    for _ in range(count):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def deltas(values):
+    previous = 0
+    for value in values:
+        yield value - previous
+        previous = value
+
+
+def accumulate(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+
+def encode_block(records):
+    columns = []
+    for name, kind in COLUMNS:
+        values = [record[name] for record in records]
+        if kind == 'delta':
+            columns.append(encode_uints(list(deltas(values))))
+        elif kind == 'zigzag':
+            columns.append(encode_uints([zigzag(v) for v in deltas(values)]))
+        elif kind == 'uint':
+            columns.append(encode_uints(values))
+        else:
+            encoded = [value.encode('utf-8') for value in values]
+            columns.append(encode_uints([len(value) for value in encoded]))
+            columns.append(b''.join(encoded))
+    payload = bytearray()
+    for column in columns:
+        write_varint(payload, len(column))
+        payload += column
+    return zlib.compress(bytes(payload), 6)
+
+
+def decode_block(data, count):
+    payload = zlib.decompress(data)
+    columns = []
+    pos = 0
+    while pos < len(payload):
+        length, pos = read_varint(payload, pos)
+        columns.append(payload[pos:pos + length])
+        pos += length
+    values = {}
+    index = 0
+    for name, kind in COLUMNS:
+        column = columns[index]
+        index += 1
+        if kind == 'delta':
+            values[name] = list(accumulate(decode_uints(column, count)))
+        elif kind == 'zigzag':
+            values[name] = list(accumulate(unzigzag(v) for v in decode_uints(column, count)))
+        elif kind == 'uint':
+            values[name] = decode_uints(column, count)
+        else:
+            lengths = decode_uints(column, count)
+            blob = columns[index]
+            index += 1
+            texts = []
+            pos = 0
+            for length in lengths:
+                texts.append(blob[pos:pos + length].decode('utf-8', 'replace'))
+                pos += length
+            values[name] = texts
+    names = [name for name, _ in COLUMNS]
+    return [dict(zip(names, row)) for row in zip(*(values[name] for name in names))]
+
+
+class DanmakuWriter:
+    """
+    .dmk 文件: MAGIC, varint 长度 + JSON 元数据 (视频 ID、cid、标题、来源...)，之后是若干块。
+    每块最多 BLOCK_RECORDS 条，按出现时间排序后按列存储 (时间 / ID 存差值，小整数用单字节，
+    文本为长度列 + 内容列)，再整体 zlib 压缩；块头记录条数和时间范围，读取时可以跳过或按时间归并。
+    写入先写临时文件，close() 时改名。
+    """
+
+    def __init__(self, path, meta=None, block_records=BLOCK_RECORDS):
+        self.path = path
+        self.temp = path + '.tmp'
+        self.block_records = block_records
+        self.pending = []
+        self.count = 0
+        self.blocks = 0
+        self.f = open(self.temp, 'wb')
+        header = json.dumps(meta or {}, ensure_ascii=False).encode('utf-8')
+        out = bytearray(MAGIC)
+        write_varint(out, len(header))
+        self.f.write(bytes(out) + header)
+
+    def add(self, record):
+        # 负数 (protobuf 中的 int32 按 64 位补码传输) 不会出现在正常数据里，按 0 处理
+        if not 0 <= record['progress'] < 1 << 32:
+            record['progress'] = 0
+        self.pending.append(record)
+        if len(self.pending) >= self.block_records:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        records = sorted(self.pending, key=lambda r: r['progress'])
+        self.pending = []
+        data = encode_block(records)
+        self.f.write(BLOCK_HEADER.pack(len(data), len(records), records[0]['progress'], records[-1]['progress']))
+        self.f.write(data)
+        self.count += len(records)
+        self.blocks += 1
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        os.replace(self.temp, self.path)
+        return self.count
+
+    def discard(self):
+        self.f.close()
+        if os.path.exists(self.temp):
+            os.remove(self.temp)
+
+
+class DanmakuReader:
+    def __init__(self, path):
+        self.path = path
+        self.blocks = []    # [(数据位置, 长度, 条数, 最早, 最晚)]
+        with open(path, 'rb') as f:
+            head = f.read(len(MAGIC) + 10)
+            if not head.startswith(MAGIC):
+                raise DanmakuError(f"不是弹幕文件: {path}")
+            length, pos = read_varint(head, len(MAGIC))
+            f.seek(pos)
+            self.meta = json.loads(f.read(length).decode('utf-8') or '{}')
+            while True:
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    break
+                size, count, first, last = BLOCK_HEADER.unpack(header)
+                self.blocks.append((f.tell(), size, count, first, last))
+                f.seek(size, os.SEEK_CUR)
+        self.count = sum(block[2] for block in self.blocks)
+
+    def read_block(self, f, block):
+        f.seek(block[0])
+        return decode_block(f.read(block[1]), block[2])
+
+    def __iter__(self):
+        # 按文件中的顺序
+        with open(self.path, 'rb') as f:
+            for block in self.blocks:
+                yield from self.read_block(f, block)
+
+    def iter_sorted(self):
+        # 按出现时间顺序：块内已排序，只有时间范围重叠的块需要同时解开归并
+        # (protobuf 分段按时间顺序写入，同时打开的块一般只有一个分段的量)
+        with open(self.path, 'rb') as f:
+            pending = deque(sorted(self.blocks, key=lambda block: block[3]))
+            heap = []
+            order = 0
+            while heap or pending:
+                while pending and (not heap or pending[0][3] <= heap[0][0]):
+                    records = iter(self.read_block(f, pending.popleft()))
+                    record = next(records, None)
+                    if record is not None:
+                        heapq.heappush(heap, (record['progress'], order, record, records))
+                        order += 1
+                _, _, record, records = heapq.heappop(heap)
+                yield record
+                record = next(records, None)
+                if record is not None:
+                    heapq.heappush(heap, (record['progress'], order, record, records))
+                    order += 1
+
+
+# ----------------------------------------------------------------------
+# ASS / SRT
+# ----------------------------------------------------------------------
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, \
+Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, \
+MarginV, Encoding
+Style: Danmaku,{font},{fontsize},&H{alpha}FFFFFF,&H{alpha}FFFFFF,&H{alpha}000000,&H{alpha}000000,0,0,0,0,100,100,\
+0,0,1,1,0,7,0,0,0,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def ass_time(seconds):
+    centis = int(round(seconds * 100))
+    return f"{centis // 360000}:{centis // 6000 % 60:02d}:{centis // 100 % 60:02d}.{centis % 100:02d}"
+
+
+def srt_time(seconds):
+    millis = int(round(seconds * 1000))
+    return f"{millis // 3600000:02d}:{millis // 60000 % 60:02d}:{millis // 1000 % 60:02d},{millis % 1000:03d}"
+
+
+def ass_escape(text):
+    # 反斜杠后插入零宽空格，避免被当成 ASS 的转义
+    return (text.replace('\\', '\\\u200b').replace('{', '\\{').replace('}', '\\}')
+            .replace('\r', '').replace('\n', '\\N'))
+
+
+def text_width(text, size):
+    # 估算宽度：全角字符按字号计，半角按一半
+    return sum(size if ord(c) > 0x2e7f else size * 0.55 for c in text)
+
+
+class LaneLayout:
+    # 按行分配弹幕位置：滚动弹幕要等前一条完全进入屏幕、且追不上前一条才复用该行；没有空行时用最早空出的行
+    def __init__(self, width, height, line_height, scroll_duration, fixed_duration, area=1.0):
+        self.width = width
+        self.line_height = line_height
+        self.scroll_duration = scroll_duration
+        self.fixed_duration = fixed_duration
+        rows = max(1, int(height * area // line_height))
+        self.scroll = [(0.0, 0.0)] * rows    # (前一条完全进入屏幕的时间, 前一条离开屏幕的时间)
+        self.top = [0.0] * rows
+        self.bottom = [0.0] * rows
+
+    def place_scroll(self, start, width):
+        duration = self.scroll_duration
+        # 这条到达左边缘的时间
+        reach_left = start + duration * self.width / (self.width + width)
+        best = 0
+        for row, (entered, leaves) in enumerate(self.scroll):
+            if start >= entered and reach_left >= leaves:
+                best = row
+                break
+            if entered < self.scroll[best][0]:
+                best = row
+        self.scroll[best] = (start + duration * width / (self.width + width), start + duration)
+        return best
+
+    def place_fixed(self, lanes, start):
+        best = 0
+        for row, free_at in enumerate(lanes):
+            if start >= free_at:
+                best = row
+                break
+            if free_at < lanes[best]:
+                best = row
+        lanes[best] = start + self.fixed_duration
+        return best
+
+
+def write_ass(records, path, width=1920, height=1080, font='Microsoft YaHei', fontsize=48, opacity=0.8,
+              scroll_duration=10.0, fixed_duration=5.0, area=1.0):
+    # records 需按出现时间排序 (DanmakuReader.iter_sorted())；返回写入的条数
+    # 高级 / 代码 / BAS 弹幕 (模式 7-9) 无法转换，跳过
+    scale = fontsize / 25
+    line_height = fontsize * 1.1
+    layout = LaneLayout(width, height, line_height, scroll_duration, fixed_duration, area)
+    alpha = f"{int(round((1 - opacity) * 255)):02X}"
+    written = 0
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8-sig', newline='\n') as f:
+        f.write(ASS_HEADER.format(width=width, height=height, font=font, fontsize=fontsize, alpha=alpha))
+        for record in records:
+            mode = record['mode']
+            text = record['content']
+            if not text or mode not in SCROLL_MODES + (BOTTOM_MODE, TOP_MODE, REVERSE_MODE):
+                continue
+            start = record['progress'] / 1000
+            size = record['fontsize'] * scale
+            styles = ''
+            if record['fontsize'] != 25:
+                styles += f"\\fs{int(size)}"
+            color = record['color'] & 0xffffff
+            if color != 0xffffff:
+                styles += f"\\c&H{color & 0xff:02X}{color >> 8 & 0xff:02X}{color >> 16:02X}&"
+            if mode == TOP_MODE or mode == BOTTOM_MODE:
+                end = start + fixed_duration
+                if mode == TOP_MODE:
+                    y = layout.place_fixed(layout.top, start) * line_height
+                    position = f"\\an8\\pos({width // 2},{int(y)})"
+                else:
+                    y = height - layout.place_fixed(layout.bottom, start) * line_height
+                    position = f"\\an2\\pos({width // 2},{int(y)})"
+            else:
+                end = start + scroll_duration
+                w = int(text_width(text, size))
+                y = int(layout.place_scroll(start, w) * line_height)
+                if mode == REVERSE_MODE:
+                    position = f"\\move({-w},{y},{width},{y})"
+                else:
+                    position = f"\\move({width},{y},{-w},{y})"
+            f.write(f"Dialogue: 2,{ass_time(start)},{ass_time(end)},Danmaku,,0,0,0,,"
+                    f"{{{position}{styles}}}{ass_escape(text)}\n")
+            written += 1
+    os.replace(temp, path)
+    return written
+
+
+def write_srt(entries, path):
+    # entries: (开始秒, 结束秒, 文本)
+    written = 0
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8', newline='\n') as f:
+        for start, end, text in entries:
+            written += 1
+            f.write(f"{written}\n{srt_time(start)} --> {srt_time(end)}\n{text}\n\n")
+    os.replace(temp, path)
+    return written
+
+
+def danmaku_srt_entries(records, duration=5.0):
+    for record in records:
+        if record['content'] and record['mode'] in SCROLL_MODES + (BOTTOM_MODE, TOP_MODE, REVERSE_MODE):
+            start = record['progress'] / 1000
+            yield start, start + duration, record['content'].replace('\r', '')
+
+
+def subtitle_srt_entries(body):
+    for line in body:
+        yield line.get('from', 0), line.get('to', 0), line.get('content', '')
+
+
+# ----------------------------------------------------------------------
+# 下载
+# ----------------------------------------------------------------------
+
+def parse_target(url):
+    # 返回 ({'bvid': ...} 或 {'aid': ...}, 分P 序号 或 None)
+    match = BV_RE.search(url)
+    if match:
+        query = {'bvid': match.group(1)}
+    else:
+        match = AV_RE.search(url)
+        if not match:
+            raise DanmakuError(f"无法识别的视频链接: {url}")
+        query = {'aid': match.group(1)}
+    page = None
+    parsed = urlparse(url)
+    if parsed.query:
+        page = (parse_qs(parsed.query).get('p') or [None])[0]
+    suffix = PAGE_RE.search(parsed.path or url)
+    if suffix:
+        page = suffix.group(1)
+    return query, int(page) if page and str(page).isdigit() else None
+
+
+def segment_count(duration):
+    return max(1, math.ceil((duration or 0) / SEGMENT_SECONDS))
+
+
+class DanmakuExporter:
+    # 一次导出一个视频，视频的弹幕分段并发下载；stop() 可以从其他线程中止
+    def __init__(self, session=None, workers=4, api_base=API_BASE, comment_base=COMMENT_BASE, on_status=None):
+        if session is None:
+            # 登录后才能拿到部分 CC 字幕；加载 Cookies 会让共享连接池带上登录状态
+            from cookie_manager import get_cookie_manager
+            get_cookie_manager().load()
+            session = http_client.get_session()
+        self.session = session
+        self.workers = max(1, workers)
+        self.api_base = api_base.rstrip('/')
+        self.comment_base = comment_base.rstrip('/')
+        self.on_status = on_status
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self, text):
+        if self.on_status is not None:
+            self.on_status(text)
+
+    def check_stopped(self):
+        if self.stop_event.is_set():
+            raise DanmakuError("已取消")
+
+    def api(self, path, params):
+        response = self.session.get(f"{self.api_base}{path}", params=params)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('code') != 0:
+            raise DanmakuError(f"接口返回错误 {data.get('code')}: {data.get('message')}")
+        return data.get('data') or {}
+
+    # ---- 视频 ----
+
+    def resolve(self, url, all_pages=False):
+        # 返回要导出的分P列表：{'id', 'bvid', 'aid', 'cid', 'page', 'title', 'duration'}
+        query, page = parse_target(url)
+        data = self.api('/x/web-interface/view', query)
+        pages = data.get('pages') or [{'cid': data.get('cid'), 'page': 1, 'part': '', 'duration': data.get('duration')}]
+        if not all_pages:
+            selected = [p for p in pages if p.get('page') == (page or 1)]
+            if not selected:
+                raise DanmakuError(f"视频没有第 {page} P")
+            pages = selected
+        videos = []
+        for p in pages:
+            multi = len(data.get('pages') or ()) > 1
+            title = data.get('title') or data.get('bvid')
+            if multi and p.get('part'):
+                title = f"{title} {p['part']}"
+            videos.append({
+                'id': f"{data.get('bvid')}_p{p['page']}" if multi and p.get('page', 1) > 1 else data.get('bvid'),
+                'bvid': data.get('bvid'), 'aid': data.get('aid'), 'cid': p['cid'], 'page': p.get('page', 1),
+                'title': title, 'duration': p.get('duration') or data.get('duration') or 0,
+            })
+        return videos
+
+    # ---- 弹幕 ----
+
+    def fetch_segment(self, video, index):
+        self.check_stopped()
+        response = self.session.get(f"{self.api_base}/x/v2/dm/web/seg.so",
+                                    params={'type': 1, 'oid': video['cid'], 'pid': video['aid'], 'segment_index': index})
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            data = response.json()
+            raise DanmakuError(f"弹幕接口返回错误 {data.get('code')}: {data.get('message')}")
+        return response.content
+
+    def iter_protobuf(self, video):
+        count = segment_count(video['duration'])
+        window = deque()
+        next_index = 1
+        done = 0
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='danmaku') as pool:
+            try:
+                while window or next_index <= count:
+                    while next_index <= count and len(window) < self.workers * 2:
+                        window.append(pool.submit(self.fetch_segment, video, next_index))
+                        next_index += 1
+                    data = window.popleft().result()
+                    self.check_stopped()
+                    done += 1
+                    self.status(f"弹幕分段 {done}/{count}")
+                    yield from parse_segment(data)
+            finally:
+                for future in window:
+                    future.cancel()
+
+    def iter_xml(self, video):
+        response = self.session.get(f"{self.comment_base}/{video['cid']}.xml", stream=True)
+        try:
+            response.raise_for_status()
+            for record in parse_xml(response.iter_content(READ_SIZE)):
+                self.check_stopped()
+                yield record
+        finally:
+            response.close()
+
+    def iter_danmaku(self, video, source='auto'):
+        # 返回 (来源, 弹幕迭代器)；auto 时 protobuf 的第一个分段就失败才改用 xml
+        if source == 'xml':
+            return 'xml', self.iter_xml(video)
+        records = self.iter_protobuf(video)
+        if source == 'protobuf':
+            return 'protobuf', records
+        try:
+            first = next(records, None)
+        except Exception as e:
+            if self.stop_event.is_set():
+                raise
+            self.status(f"分段弹幕接口失败 ({e})，改用 XML 接口")
+            return 'xml', self.iter_xml(video)
+
+        def chain():
+            if first is not None:
+                yield first
+            yield from records
+        return 'protobuf', chain()
+
+    # ---- CC 字幕 ----
+
+    def list_subtitles(self, video):
+        data = self.api('/x/player/wbi/v2', {'bvid': video['bvid'], 'cid': video['cid']})
+        subtitles = [s for s in ((data.get('subtitle') or {}).get('subtitles') or [])
+                     if s.get('subtitle_url') and s.get('lan')]
+        if not subtitles and data.get('need_login_subtitle'):
+            self.status("该视频的字幕需要登录后才能获取")
+        return subtitles
+
+    def fetch_subtitle(self, subtitle):
+        url = subtitle['subtitle_url']
+        if url.startswith('//'):
+            url = 'https:' + url
+        response = self.session.get(url)
+        response.raise_for_status()
+        return response.json().get('body') or []
+
+    # ---- 导出 ----
+
+    def export(self, url, output_dir, ass=False, srt=False, subtitles=True, source='auto', all_pages=False,
+               ass_options=None):
+        # 返回每个分P的结果 {'id', 'title', 'count', 'source', 'files': [...]}
+        os.makedirs(output_dir, exist_ok=True)
+        results = []
+        for video in self.resolve(url, all_pages):
+            self.check_stopped()
+            base = os.path.join(output_dir, output_base(video))
+            self.status(f"正在获取弹幕: {video['title']}")
+            meta = {key: video[key] for key in ('id', 'bvid', 'aid', 'cid', 'page', 'title', 'duration')}
+            writer = DanmakuWriter(base + '.dmk', meta)
+            try:
+                used, records = self.iter_danmaku(video, source)
+                for record in records:
+                    writer.add(record)
+            except BaseException:
+                writer.discard()
+                raise
+            count = writer.close()
+            files = [base + '.dmk']
+            if ass or srt:
+                reader = DanmakuReader(base + '.dmk')
+                if ass:
+                    write_ass(reader.iter_sorted(), base + '.danmaku.ass', **(ass_options or {}))
+                    files.append(base + '.danmaku.ass')
+                if srt:
+                    write_srt(danmaku_srt_entries(reader.iter_sorted()), base + '.danmaku.srt')
+                    files.append(base + '.danmaku.srt')
+            if subtitles:
+                for subtitle in self.list_subtitles(video):
+                    path = f"{base}.{subtitle['lan']}.srt"
+                    write_srt(subtitle_srt_entries(self.fetch_subtitle(subtitle)), path)
+                    files.append(path)
+            self.status(f"{video['title']}: {count} 条弹幕 ({used})，已写入 {len(files)} 个文件")
+            results.append({'id': video['id'], 'title': video['title'], 'count': count, 'source': used,
+                            'files': files})
+        return results
@@ -0,0 +1,117 @@
+# 按时间截取 DASH 流
+#
+# B 站的 DASH 视频 / 音频流是分片 MP4：文件头 (ftyp + moov) 之后是 sidx 分段索引，
+# 记录每个分片 (moof + mdat) 的字节数和时长。只要读取文件开头的几十 KB 解析 sidx，
+# 就能算出覆盖某个时间段的字节范围，只下载这部分，再接上文件头就是可以播放 / 合并的文件。
+# 截取精度是分片 (关键帧) 级别，通常为几秒；不重新编码。
+
+import os
+import shutil
+import struct
+
+from segmented_downloader import SegmentError
+
+HEAD_BYTES = 64 * 1024
+MAX_HEAD_BYTES = 4 * 1024 * 1024
+
+
+def iter_boxes(data, offset=0):
+    # 遍历顶层 box，返回 (类型, 起始位置, 大小)；最后一个 box 可能只读到一部分
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        if size == 1:
+            if offset + 16 > len(data):
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+        elif size == 0:
+            return
+        if size < 8:
+            raise SegmentError("MP4 数据格式错误")
+        yield box_type.decode('latin-1'), offset, size
+        offset += size
+
+
+def parse_sidx(data, offset):
+    # 返回 (timescale, 第一个分片的起始时间, 第一个分片的字节位置, [(字节数, 时长), ...])
+    size = struct.unpack_from('>I', data, offset)[0]
+    pos = offset + 8
+    version = data[pos]
+    pos += 4   # version + flags
+    _, timescale = struct.unpack_from('>II', data, pos)
+    pos += 8
+    if version == 0:
+        earliest, first_offset = struct.unpack_from('>II', data, pos)
+        pos += 8
+    else:
+        earliest, first_offset = struct.unpack_from('>QQ', data, pos)
+        pos += 16
+    _, count = struct.unpack_from('>HH', data, pos)
+    pos += 4
+    references = []
+    for _ in range(count):
+        ref, duration, _ = struct.unpack_from('>III', data, pos)
+        pos += 12
+        references.append((ref & 0x7FFFFFFF, duration))
+    return timescale, earliest, offset + size + first_offset, references
+
+
+def fetch_head(session, url, headers, length, timeout=20):
+    request_headers = dict(headers or {})
+    request_headers['Range'] = f"bytes=0-{length - 1}"
+    with session.get(url, headers=request_headers, stream=True, timeout=timeout) as res:
+        res.raise_for_status()
+        if res.status_code != 206:
+            raise SegmentError("服务器不支持 Range，无法截取片段")
+        return res.content
+
+
+def locate_clip(session, url, headers, start, end):
+    """
+    返回 {'init': 文件头字节, 'range': (首字节, 末字节), 'start': 实际开始时间, 'end': 实际结束时间}。
+    没有 sidx 的流 (如 flv、普通 mp4) 抛出 SegmentError。
+    """
+    length = HEAD_BYTES
+    while True:
+        data = fetch_head(session, url, headers, length)
+        init_end = sidx = None
+        media_found = False
+        for box_type, offset, size in iter_boxes(data):
+            if box_type == 'moov':
+                init_end = offset + size
+            elif box_type == 'sidx':
+                sidx = (offset, size)
+                break
+            elif box_type in ('moof', 'mdat'):
+                media_found = True
+                break
+        # sidx 通常紧跟在 moov 后面；没读完整时加大读取长度再试
+        if ((sidx is not None and sidx[0] + sidx[1] <= len(data)) or media_found
+                or len(data) < length or length >= MAX_HEAD_BYTES):
+            break
+        length *= 4
+    if sidx is None or init_end is None or sidx[0] + sidx[1] > len(data):
+        raise SegmentError("该流没有分段索引 (sidx)，不支持截取片段")
+
+    timescale, time, position, references = parse_sidx(data, sidx[0])
+    first = last = None
+    clip_start = clip_end = None
+    for ref_size, duration in references:
+        ref_start, ref_end = time / timescale, (time + duration) / timescale
+        if ref_end > start and (end is None or ref_start < end):
+            if first is None:
+                first, clip_start = position, ref_start
+            last, clip_end = position + ref_size - 1, ref_end
+        time += duration
+        position += ref_size
+    if first is None:
+        raise SegmentError(f"截取范围超出视频时长 ({time / timescale:.0f}s)")
+    return {'init': data[:init_end], 'range': (first, last), 'start': clip_start, 'end': clip_end}
+
+
+def write_clip(init, media_path, output_path):
+    # 文件头 + 下载到的分片 = 可以独立播放的片段
+    with open(output_path, 'wb') as out:
+        out.write(init)
+        with open(media_path, 'rb') as media:
+            shutil.copyfileobj(media, out, 1024 * 1024)
+    os.remove(media_path)
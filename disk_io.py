@@ -0,0 +1,195 @@
+# 磁盘写入：临时目录、预分配、大块对齐写入、空间检查、原子落盘
+#
+# 下载中的流 (.part)、合并前的中间文件和合并的临时输出都放在临时目录 (默认是保存目录下的 .incomplete，
+# 可以指定到本地的快速磁盘)，保存目录里只会出现完整的文件：
+#   - 开始下载前按已知大小检查剩余空间 (其他任务预留的空间也算上)，不够就直接失败，不会写到一半磁盘满；
+#   - 流文件按大小预分配，减少碎片；每个连接的数据攒够 WRITE_SIZE 再从对齐的位置一次写出；
+#   - 完成后移入保存目录：同一文件系统直接改名 (原子)；跨文件系统 (如临时目录在本地、保存目录在 NAS)
+#     边复制边计算 SHA-256，写到目标目录的隐藏临时文件并 fsync 后再改名，下载存档不用再读一遍目标文件。
+# 注意：合并在子进程中调用 finalize，本模块只能依赖标准库 (及同样只用标准库的 download_archive)。
+
+import errno
+import hashlib
+import os
+import shutil
+import threading
+
+from download_archive import file_sha256
+
+KB = 1024
+MB = 1024 * 1024
+
+SCRATCH_NAME = '.incomplete'
+ALIGN = 64 * KB          # 分段边界和每次写入的起点按此对齐
+WRITE_SIZE = 1 * MB      # 每次写盘的数据量
+COPY_SIZE = 4 * MB       # 跨文件系统复制时每次读写的数据量
+MIN_FREE = 100 * MB      # 下载完成后磁盘至少还要剩这么多
+
+
+class InsufficientSpace(OSError):
+    pass
+
+
+def scratch_dir_for(save_path, scratch_dir=None):
+    return scratch_dir or os.path.join(save_path, SCRATCH_NAME)
+
+
+def existing_parent(path):
+    # 目录可能还没创建，向上找到存在的那一级 (用于查询所在的文件系统)
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def device_of(path):
+    return os.stat(existing_parent(path)).st_dev
+
+
+def same_filesystem(a, b):
+    return device_of(a) == device_of(b)
+
+
+# ----------------------------------------------------------------------
+# 预分配与写入
+# ----------------------------------------------------------------------
+
+def preallocate(f, size):
+    # 先设置文件长度；支持的系统上再真正分配磁盘块 (尽量连续，空间不足时立即报错)
+    f.truncate(size)
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            # 文件系统不支持 (如部分网络文件系统)，保留稀疏文件
+
+
+def align_down(offset):
+    return offset // ALIGN * ALIGN
+
+
+class RangeWriter:
+    """
+    把一个分段的数据写入文件的 offset 处：小块数据先攒在内存里，够 write_size 再一次写出，
+    每次写出的长度都是 ALIGN 的整数倍 (最后一次除外)，写入起点保持对齐。
+    written 只统计已经写到文件里的字节数，重试时从这里继续。
+    """
+
+    def __init__(self, f, offset, write_size=WRITE_SIZE):
+        self.f = f
+        self.offset = offset
+        self.write_size = max(ALIGN, align_down(write_size))
+        self.buffer = bytearray()
+        self.written = 0
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.write_size:
+            self._write(align_down(len(self.buffer)))
+
+    def flush(self):
+        if self.buffer:
+            self._write(len(self.buffer))
+
+    def _write(self, length):
+        position = self.offset + self.written
+        with memoryview(self.buffer) as view:
+            if hasattr(os, 'pwrite'):
+                done = 0
+                while done < length:
+                    done += os.pwrite(self.f.fileno(), view[done:length], position + done)
+            else:
+                self.f.seek(position)
+                self.f.write(view[:length])
+        del self.buffer[:length]
+        self.written += length
+
+
+# ----------------------------------------------------------------------
+# 剩余空间检查 (进程内所有任务共用一本账)
+# ----------------------------------------------------------------------
+
+_space_lock = threading.Lock()
+_reserved = {}   # 文件系统 (st_dev) -> 已预留但还没写入的字节数
+
+
+class SpaceReservation:
+    def __init__(self, entries):
+        self.entries = entries   # [(文件系统, 字节数, 标签)]
+
+    def release(self, tag=None):
+        # 释放某个标签 (如已经预分配的流) 或全部预留的空间
+        with _space_lock:
+            keep = []
+            for device, size, entry_tag in self.entries:
+                if tag is None or entry_tag == tag:
+                    _reserved[device] = _reserved.get(device, 0) - size
+                else:
+                    keep.append((device, size, entry_tag))
+            self.entries = keep
+
+
+def reserve_space(needs, margin=MIN_FREE):
+    # needs: [(目录, 字节数, 标签)]；空间不够时抛出 InsufficientSpace，不预留任何空间
+    entries = []
+    totals = {}
+    for directory, size, tag in needs:
+        if not size:
+            continue
+        device = device_of(directory)
+        entries.append((device, size, tag))
+        totals.setdefault(device, [directory, 0])[1] += size
+    with _space_lock:
+        for device, (directory, size) in totals.items():
+            free = shutil.disk_usage(existing_parent(directory)).free - _reserved.get(device, 0)
+            if free - margin < size:
+                raise InsufficientSpace(
+                    f"磁盘空间不足: {os.path.abspath(directory)} 需要 {size / MB:.0f}MB，"
+                    f"可用 {max(free, 0) / MB:.0f}MB (另需保留 {margin / MB:.0f}MB)")
+        for device, size, _ in entries:
+            _reserved[device] = _reserved.get(device, 0) + size
+    return SpaceReservation(entries)
+
+
+# ----------------------------------------------------------------------
+# 落盘
+# ----------------------------------------------------------------------
+
+def copy_with_hash(src, dst):
+    # 边复制边计算 SHA-256，写完 fsync；返回十六进制哈希
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        preallocate(fout, os.fstat(fin.fileno()).st_size)
+        for chunk in iter(lambda: fin.read(COPY_SIZE), b''):
+            digest.update(chunk)
+            fout.write(chunk)
+        fout.flush()
+        os.fsync(fout.fileno())
+    shutil.copymode(src, dst)
+    return digest.hexdigest()
+
+
+def finalize(src, dst, digest=True):
+    # 把临时目录中完成的文件移到 dst，返回 SHA-256 (digest=False 时返回 None)
+    directory = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(directory, exist_ok=True)
+    if same_filesystem(src, directory):
+        # 刚写完的文件还在页缓存中，改名前读一遍算哈希很快
+        sha256 = file_sha256(src) if digest else None
+        os.replace(src, dst)
+        return sha256
+    temp = os.path.join(directory, f".{os.path.basename(dst)}.tmp")
+    try:
+        sha256 = copy_with_hash(src, temp)
+        os.replace(temp, dst)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    os.remove(src)
+    return sha256 if digest else None
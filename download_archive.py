@@ -0,0 +1,129 @@
+# 下载存档索引 (SQLite)
+#
+# 记录已经下载完成的视频，键为 (BV 号, 分P, 请求的格式)，同时保存文件路径、大小和 SHA-256。
+# 下载前先按链接查询 (不访问网络)，文件还在就直接跳过，重复跑大的收藏夹 / 批量列表几乎没有开销。
+# 文件被删除或大小不对时自动作废该记录；需要时可以重新计算哈希校验文件内容。
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import CACHE_DIR, normalize_video_key
+
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_key(url, format_id=None):
+    # 返回 (BV 号, 分P, 格式)；分P 为 0 表示链接没有指定分P。无法识别的链接 (如 b23.tv 短链) 返回 None
+    key = normalize_video_key(url)
+    if key is None:
+        return None
+    bvid, _, page = key.partition('_p')
+    return bvid, int(page or 0), format_id or 'auto'
+
+
+class DownloadArchive:
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or os.path.join(CACHE_DIR, 'archive.sqlite3')
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                bvid TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                format TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT,
+                title TEXT,
+                downloaded_at REAL NOT NULL,
+                PRIMARY KEY (bvid, page, format)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM archive WHERE bvid = ? AND page = ? AND format = ?", key).fetchone()
+        return dict(row) if row is not None else None
+
+    def lookup(self, url, format_id=None, verify=False):
+        # 已下载且文件仍然有效时返回记录，否则返回 None (失效的记录顺便删除)
+        record = self.get(archive_key(url, format_id))
+        if record is None:
+            return None
+        if not self.check(record, verify):
+            self.remove(record)
+            return None
+        return record
+
+    def check(self, record, verify=False):
+        # 文件存在且大小一致；verify=True 时再比对 SHA-256 (需要读取整个文件)
+        path = record['path']
+        if not os.path.isfile(path) or os.path.getsize(path) != record['size']:
+            return False
+        if verify and record.get('sha256'):
+            return file_sha256(path) == record['sha256']
+        return True
+
+    def add(self, url, format_id, path, title=None, sha256=None):
+        key = archive_key(url, format_id)
+        if key is None or not os.path.isfile(path):
+            return None
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        record = {
+            'bvid': key[0], 'page': key[1], 'format': key[2], 'path': os.path.abspath(path),
+            'size': os.path.getsize(path), 'sha256': sha256, 'title': title, 'downloaded_at': self.clock(),
+        }
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO archive (bvid, page, format, path, size, sha256, title, downloaded_at) "
+                "VALUES (:bvid, :page, :format, :path, :size, :sha256, :title, :downloaded_at)", record)
+            self.conn.commit()
+        return record
+
+    def remove(self, record):
+        with self.lock:
+            self.conn.execute("DELETE FROM archive WHERE bvid = ? AND page = ? AND format = ?",
+                              (record['bvid'], record['page'], record['format']))
+            self.conn.commit()
+
+    def entries(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM archive ORDER BY downloaded_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_download_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = DownloadArchive()
+        return _archive
@@ -0,0 +1,220 @@
+# 下载日志 (journal)
+#
+# 每个任务一个 JSON 文件，记录任务参数、每个流已完成的字节范围以及合并状态。
+# 程序重启后据此重建下载队列，并从 .part 文件中已完成的部分继续下载。
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from metadata_cache import CACHE_DIR
+
+JOURNAL_DIR = os.path.join(CACHE_DIR, 'journal')
+
+# 连续失败超过该次数的任务不再自动恢复
+MAX_ATTEMPTS = 5
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class JournalEntry:
+    def __init__(self, journal, data):
+        self.journal = journal
+        self.data = data
+        self.lock = threading.Lock()
+        self._last_save = 0.0
+
+    @property
+    def key(self):
+        return self.data['key']
+
+    @property
+    def url(self):
+        return self.data['url']
+
+    @property
+    def format_id(self):
+        return self.data.get('format_id')
+
+    @property
+    def save_path(self):
+        return self.data.get('save_path')
+
+    @property
+    def outtmpl(self):
+        return self.data.get('outtmpl')
+
+    @property
+    def priority(self):
+        return self.data.get('priority')
+
+    @property
+    def audio_only(self):
+        return bool(self.data.get('audio_only'))
+
+    @property
+    def audio_format(self):
+        return self.data.get('audio_format')
+
+    @property
+    def clip(self):
+        return self.data.get('clip')
+
+    @property
+    def state(self):
+        return self.data.get('state')
+
+    @property
+    def attempts(self):
+        return self.data.get('attempts', 0)
+
+    def set_state(self, state, message=''):
+        with self.lock:
+            self.data['state'] = state
+            self.data['message'] = message
+            self.data['updated_at'] = time.time()
+        self.save(force=True)
+
+    def record_failure(self, message):
+        with self.lock:
+            self.data['attempts'] = self.attempts + 1
+        self.set_state('failed', message)
+
+    def stream(self, format_id):
+        return self.data['streams'].get(str(format_id))
+
+    def reset_stream(self, format_id, path, size, completed=None):
+        # 流准备完成 (已探测大小) 时调用，丢弃与当前文件不一致的旧记录
+        with self.lock:
+            self.data['streams'][str(format_id)] = {
+                'path': path,
+                'size': size,
+                'completed': merge_ranges(completed or []),
+                'done': False,
+            }
+        self.save(force=True)
+
+    def mark_segment(self, format_id, start, end):
+        with self.lock:
+            stream = self.data['streams'].get(str(format_id))
+            if stream is None:
+                return
+            stream['completed'] = merge_ranges(stream['completed'] + [[start, end]])
+        self.save()
+
+    def mark_stream_done(self, format_id):
+        with self.lock:
+            stream = self.data['streams'].get(str(format_id))
+            if stream is not None:
+                stream['done'] = True
+        self.save(force=True)
+
+    def set_output(self, path):
+        with self.lock:
+            self.data['output'] = path
+        self.save(force=True)
+
+    def set_merge_status(self, status):
+        with self.lock:
+            self.data['merge'] = status
+        self.save(force=True)
+
+    def save(self, force=False):
+        # 分段完成时频繁调用，非强制保存时最多每 0.5 秒写一次盘
+        now = time.monotonic()
+        if not force and now - self._last_save < 0.5:
+            return
+        self._last_save = now
+        with self.lock:
+            payload = json.dumps(self.data, ensure_ascii=False)
+        self.journal.write(self.key, payload)
+
+
+class DownloadJournal:
+    def __init__(self, directory=JOURNAL_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def create(self, url, format_id=None, save_path="downloads", outtmpl=None, priority=None, audio_only=False,
+               audio_format=None, clip=None):
+        now = time.time()
+        entry = JournalEntry(self, {
+            'key': f"{int(now * 1000)}-{uuid.uuid4().hex[:8]}",
+            'url': url,
+            'format_id': format_id,
+            'save_path': save_path,
+            'outtmpl': outtmpl,
+            'priority': priority,
+            'audio_only': audio_only,
+            'audio_format': audio_format,
+            'clip': list(clip) if clip else None,
+            'state': 'queued',
+            'message': '',
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+            'output': None,
+            'merge': None,
+            'streams': {},
+        })
+        entry.save(force=True)
+        return entry
+
+    def write(self, key, payload):
+        # 先写临时文件再原子替换，程序中途退出也不会留下半个 JSON
+        path = self.path_for(key)
+        temp_path = path + '.tmp'
+        with self.lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+
+    def remove(self, entry):
+        with self.lock:
+            try:
+                os.remove(self.path_for(entry.key))
+            except FileNotFoundError:
+                pass
+
+    def load_all(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    entries.append(JournalEntry(self, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        entries.sort(key=lambda entry: entry.data.get('created_at', 0))
+        return entries
+
+    def pending_entries(self):
+        # 需要恢复的任务：未完成且失败次数未超过上限
+        return [entry for entry in self.load_all() if entry.attempts < MAX_ATTEMPTS]
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_download_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = DownloadJournal()
+        return _journal
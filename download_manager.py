@@ -1,17 +1,29 @@
-import os
-import yt_dlp
-import imageio_ffmpeg
-import json
-from PyQt5.QtCore import QThread, pyqtSignal
-
-# 尝试自动设置 ffmpeg 路径
-try:
-    ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
-    ffmpeg_dir = os.path.dirname(ffmpeg_path)
-    if ffmpeg_dir not in os.environ['PATH']:
-        os.environ['PATH'] += os.pathsep + ffmpeg_dir
-except Exception:
-    pass
+# 图形界面的 Qt 适配层
+#
+# 下载逻辑都在 downloader_core.py (不依赖 Qt)，这里只把核心的事件转换成 Qt 信号。
+# 核心的回调在工作线程中触发，经过信号 (排队连接) 回到主线程后再更新界面。
+#
+# downloader_core 会导入 yt-dlp 等较重的模块 (约 0.2 秒)，这里不在导入时加载：
+# DownloadQueue.start() 在后台线程中加载并创建引擎，窗口先显示出来；
+# 其他线程类在自己的 run() 中 (工作线程里) 才导入。
+
+import threading
+
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+
+from bandwidth import NORMAL
+
+# DownloadJob / QueueFullError 等在这里一并导出，界面代码只需要从本模块导入 (第一次访问时才加载核心)
+_CORE_EXPORTS = ('DownloadEngine', 'DownloadJob', 'PlaylistExpander', 'QueueFullError',
+                 'fetch_video_info', 'list_video_formats', 'video_summary')
+
+
+def __getattr__(name):
+    if name in _CORE_EXPORTS:
+        import downloader_core
+        return getattr(downloader_core, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class VideoInfoThread(QThread):
     info_signal = pyqtSignal(dict)       # 视频信息
@@ -24,189 +36,235 @@ class VideoInfoThread(QThread):
 
     def run(self):
         try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-            }
-            
-            # 加载 cookies
-            if os.path.exists('cookies.json'):
-                with open('cookies.json', 'r') as f:
-                    cookies = json.load(f)
-                    # 将 cookies 转换为 Netscape 格式字符串或 header 并不容易直接传给 yt-dlp 
-                    # 最简单的是将 json cookies 转换回 cookiejar 并保存为 cookies.txt 给 yt-dlp 用
-                    # 或者直接构造 http_headers
-                    pass
-
-            # 更好的方式是如果存在 cookies.txt 则使用
-            if os.path.exists('cookies.txt'):
-                 ydl_opts['cookiefile'] = 'cookies.txt'
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(self.url, download=False)
-                
-                # 发送基本信息
-                self.info_signal.emit({
-                    'title': info.get('title', '未知标题'),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'uploader': info.get('uploader', '未知UP主'),
-                    'duration': info.get('duration', 0)
-                })
-
-                # 发送格式列表
-                formats = info.get('formats', [])
-                # 过滤并整理格式
-                video_formats = []
-                seen_res = set()
-                
-                # 倒序遍历，通常最好的在后面
-                for f in reversed(formats):
-                    # 只要视频流或包含视频的文件
-                    if f.get('vcodec') != 'none':
-                        height = f.get('height')
-                        note = f.get('format_note', '')
-                        ext = f.get('ext', '')
-                        filesize = f.get('filesize') or f.get('filesize_approx')
-                        
-                        if height:
-                            display = f"{height}P - {note} ({ext})"
-                            if filesize:
-                                size_mb = filesize / 1024 / 1024
-                                display += f" - {size_mb:.1f}MB"
-                            
-                            # 简单的去重逻辑，优先保留高质量
-                            key = f"{height}P-{note}"
-                            # if key not in seen_res:
-                            video_formats.append({
-                                'format_id': f['format_id'],
-                                'display': display,
-                                'height': height,
-                                'ext': ext
-                            })
-                            # seen_res.add(key)
-                
-                self.formats_signal.emit(video_formats)
-
+            from downloader_core import fetch_video_info, list_video_formats, video_summary
+            info, from_cache = fetch_video_info(self.url)
+            self.info_signal.emit(video_summary(info, from_cache))
+            self.formats_signal.emit(list_video_formats(info))
         except Exception as e:
             self.error_signal.emit(str(e))
 
-class DownloadThread(QThread):
-    # 信号定义
-    progress_signal = pyqtSignal(float)  # 进度百分比
+
+class PlaylistExpandThread(QThread):
+    # 在后台线程中运行 PlaylistExpander
+    entry_signal = pyqtSignal(dict)      # {'url', 'title', 'source'}
+    status_signal = pyqtSignal(str)      # 状态文本
+    finished_signal = pyqtSignal(int)    # 展开的条目总数
+
+    def __init__(self, urls, can_accept=None):
+        super().__init__()
+        self.urls = urls
+        self.can_accept = can_accept
+        self.expander = None
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def run(self):
+        from downloader_core import PlaylistExpander
+        with self.lock:
+            if self.stopped:
+                return
+            self.expander = PlaylistExpander(self.urls, self.can_accept)
+        self.expander.on('entry', self.entry_signal.emit)
+        self.expander.on('status', self.status_signal.emit)
+        self.expander.on('finished', self.finished_signal.emit)
+        self.expander.run()
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.expander is not None:
+                self.expander.stop()
+
+
+class DanmakuExportThread(QThread):
+    # 在后台线程中导出弹幕 (.dmk + ASS) 和 CC 字幕
     status_signal = pyqtSignal(str)      # 状态文本
-    finished_signal = pyqtSignal(bool, str) # 是否成功，消息
+    finished_signal = pyqtSignal(list)   # 每个分P的结果 {'title', 'count', 'files', ...}
+    error_signal = pyqtSignal(str)       # 错误信息
 
-    def __init__(self, url, format_id=None, save_path="downloads"):
+    def __init__(self, url, save_path="downloads", ass=True, srt=False):
         super().__init__()
         self.url = url
-        self.format_id = format_id
         self.save_path = save_path
-        self.is_running = True
-        
-        # 确保下载目录存在
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
+        self.ass = ass
+        self.srt = srt
+        self.exporter = None
+        self.stopped = False
+        self.lock = threading.Lock()
 
     def run(self):
-        # yt-dlp 配置
-        if self.format_id:
-            # 如果指定了视频格式，则下载该视频 + 最佳音频
-            format_str = f"{self.format_id}+bestaudio/best"
-        else:
-            format_str = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
-
-        ydl_opts = {
-            'format': format_str,
-            'outtmpl': os.path.join(self.save_path, '%(title)s.%(ext)s'),
-            'progress_hooks': [self.progress_hook],
-            'logger': self.Logger(self.status_signal),
-            # 'quiet': True,
-        }
-        
-        # 自动使用 ffmpeg (如果环境变量已设置)
-        # 显式指定 ffmpeg 路径 (保险起见)
+        from danmaku import DanmakuExporter
+        with self.lock:
+            if self.stopped:
+                return
+            self.exporter = DanmakuExporter(on_status=self.status_signal.emit)
         try:
-             ydl_opts['ffmpeg_location'] = imageio_ffmpeg.get_ffmpeg_exe()
-        except:
-             pass
+            self.finished_signal.emit(self.exporter.export(self.url, self.save_path, ass=self.ass, srt=self.srt))
+        except Exception as e:
+            if not self.stopped:
+                self.error_signal.emit(str(e))
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.exporter is not None:
+                self.exporter.stop()
+
 
-        # 加载 Cookies
-        if os.path.exists('cookies.txt'): # 优先使用 Netscape 格式
-            ydl_opts['cookiefile'] = 'cookies.txt'
-        elif os.path.exists('cookies.json'): # 尝试从 JSON 加载 (需要转换，这里暂略，推荐用户重新登录生成 cookies.txt)
-             pass
+class EngineLoader(QThread):
+    # 在后台线程中导入 downloader_core (yt-dlp 等) 并创建下载引擎
+    loaded_signal = pyqtSignal()
+    failed_signal = pyqtSignal(str)
 
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.engine = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
         try:
-            self.status_signal.emit("初始化下载引擎...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                self.status_signal.emit(f"开始下载 (格式: {self.format_id or '自动'})...")
-                ydl.download([self.url])
-                
-            self.finished_signal.emit(True, "下载完成！")
-            self.progress_signal.emit(100)
-            
+            self.engine = self.factory()
         except Exception as e:
-            err_msg = str(e)
-            if "ffmpeg" in err_msg.lower():
-                err_msg = "未找到 FFmpeg，无法合并音视频。\n请尝试安装 FFmpeg 或选择不合并的低画质格式。"
-            self.finished_signal.emit(False, f"下载出错: {err_msg}")
-
-    def progress_hook(self, d):
-        if not self.is_running:
-            raise yt_dlp.utils.DownloadError("下载已取消")
-            
-        if d['status'] == 'downloading':
-            try:
-                # 计算进度
-                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-                downloaded = d.get('downloaded_bytes', 0)
-                
-                if total_bytes:
-                    percentage = (downloaded / total_bytes) * 100
-                    self.progress_signal.emit(percentage)
-                
-                # 构建状态信息
-                speed = d.get('speed', 0)
-                if speed:
-                    speed_str = self.format_speed(speed)
-                else:
-                    speed_str = "Calculating..."
-                    
-                eta = d.get('eta', 0)
-                self.status_signal.emit(f"下载中... 速度: {speed_str} | 剩余时间: {eta}s")
-                
-            except Exception:
-                pass
-                
-        elif d['status'] == 'finished':
-            self.status_signal.emit("下载完成，正在处理/合并文件...")
-            self.progress_signal.emit(99)
-
-    def stop(self):
-        self.is_running = False
-
-    @staticmethod
-    def format_speed(bytes_per_sec):
-        if bytes_per_sec > 1024 * 1024:
-            return f"{bytes_per_sec / 1024 / 1024:.2f} MB/s"
-        elif bytes_per_sec > 1024:
-            return f"{bytes_per_sec / 1024:.2f} KB/s"
+            self.error = e
+            self.failed_signal.emit(str(e))
         else:
-            return f"{bytes_per_sec:.2f} B/s"
+            self.loaded_signal.emit()
+        finally:
+            self.done.set()
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.engine
+
+
+class DownloadQueue(QObject):
+    """
+    DownloadEngine 的 Qt 包装：事件转成信号，吞吐量每秒汇总一次。
+    进度经过进度总线合并，每帧一个信号 (默认每秒 10 帧)，而不是每个数据块一个信号。
+    引擎由 start() 在后台加载，加载完成前设置的并发数 / 限速会保存下来，加载后再应用；
+    加载完成前就要用到引擎 (如提交任务) 时会等待加载结束。
+    """
+    job_added_signal = pyqtSignal(int)               # job_id
+    job_state_signal = pyqtSignal(int, str)          # job_id, 状态
+    progress_frame_signal = pyqtSignal(object)       # {job_id: 结构化进度}
+    job_status_signal = pyqtSignal(int, str)         # job_id, 状态文本
+    job_info_signal = pyqtSignal(int, dict)          # job_id, {'title', 'uploader'}
+    job_finished_signal = pyqtSignal(int, bool, str) # job_id, 是否成功, 消息
+    throughput_signal = pyqtSignal(float, int, int)  # 总速度 (B/s), 运行中, 排队中
+    idle_signal = pyqtSignal()                       # 所有任务处理完毕
+    ready_signal = pyqtSignal()                      # 引擎加载完成
+    load_failed_signal = pyqtSignal(str)             # 引擎加载失败
+
+    def __init__(self, max_workers=3, max_pending=500, save_path="downloads", connections_per_job=4,
+                 merge_workers=2, progress_fps=10, scratch_dir=None, parent=None):
+        super().__init__(parent)
+        self.options = {'max_workers': max_workers, 'max_pending': max_pending, 'save_path': save_path,
+                        'connections_per_job': connections_per_job, 'merge_workers': merge_workers,
+                        'progress_interval': 1.0 / progress_fps, 'scratch_dir': scratch_dir}
+        self.rate_limit = 0
+        self.loader = None
+        self.lock = threading.Lock()
+
+        # 每秒汇总一次吞吐量，避免每个进度回调都刷新界面
+        self.throughput_timer = QTimer(self)
+        self.throughput_timer.setInterval(1000)
+        self.throughput_timer.timeout.connect(self._emit_throughput)
+        self.throughput_timer.start()
+
+    def start(self):
+        # 开始在后台加载引擎 (窗口显示之后调用)；重复调用没有影响，上次加载失败时重新加载
+        with self.lock:
+            if self.loader is None or self.loader.error is not None:
+                self.loader = EngineLoader(self._create_engine)
+                self.loader.loaded_signal.connect(self._on_loaded)
+                self.loader.failed_signal.connect(self.load_failed_signal.emit)
+                self.loader.start()
+            return self.loader
+
+    def _create_engine(self):
+        # 在加载线程中执行
+        from downloader_core import DownloadEngine
+        engine = DownloadEngine(**self.options)
+        engine.on('job_added', self.job_added_signal.emit)
+        engine.on('job_state', self.job_state_signal.emit)
+        engine.on('progress_frame', self.progress_frame_signal.emit)
+        engine.on('job_status', self.job_status_signal.emit)
+        engine.on('job_info', self.job_info_signal.emit)
+        engine.on('job_finished', self.job_finished_signal.emit)
+        engine.on('idle', self.idle_signal.emit)
+        return engine
+
+    def _on_loaded(self):
+        # 加载期间界面上改过的设置在这里补上
+        engine = self.loader.engine
+        engine.set_max_workers(self.options['max_workers'])
+        if self.rate_limit:
+            engine.set_rate_limit(self.rate_limit)
+        self.ready_signal.emit()
+
+    def is_ready(self):
+        loader = self.loader
+        return loader is not None and loader.engine is not None
+
+    @property
+    def engine(self):
+        return self.start().result()
+
+    @property
+    def jobs(self):
+        return self.engine.jobs if self.is_ready() else {}
+
+    @property
+    def max_workers(self):
+        return self.engine.max_workers if self.is_ready() else self.options['max_workers']
+
+    def submit(self, url, format_id=None, journal_entry=None, priority=NORMAL, rate_limit=None, **options):
+        # options: outtmpl / audio_only / audio_format / clip，见 DownloadEngine.submit
+        return self.engine.submit(url, format_id, journal_entry, priority, rate_limit, **options)
+
+    def restore_from_journal(self):
+        return self.engine.restore_from_journal()
+
+    def can_accept(self):
+        return self.engine.can_accept()
+
+    def set_rate_limit(self, rate):
+        self.rate_limit = rate
+        if self.is_ready():
+            self.engine.set_rate_limit(rate)
+
+    def set_job_rate_limit(self, job_id, rate):
+        self.engine.set_job_rate_limit(job_id, rate)
+
+    def set_max_workers(self, count):
+        self.options['max_workers'] = count
+        if self.is_ready():
+            self.engine.set_max_workers(count)
+
+    def cancel(self, job_id):
+        if self.is_ready():
+            self.engine.cancel(job_id)
 
-    # 自定义 Logger 类用于捕获 yt-dlp 的输出
-    class Logger:
-        def __init__(self, signal):
-            self.signal = signal
+    def stop_all(self):
+        self.throughput_timer.stop()
+        if self.loader is not None:
+            self.loader.wait()
+        if self.is_ready():
+            self.engine.stop_all()
 
-        def debug(self, msg):
-            if not msg.startswith('[debug] '):
-                # self.signal.emit(msg)
-                pass
+    def overall_progress(self):
+        return self.engine.overall_progress() if self.is_ready() else 0.0
 
-        def warning(self, msg):
-            # self.signal.emit(f"Warning: {msg}")
-            pass
+    def total_speed(self):
+        return self.engine.total_speed() if self.is_ready() else 0.0
 
-        def error(self, msg):
-            self.signal.emit(f"Error: {msg}")
+    def _emit_throughput(self):
+        if not self.is_ready():
+            return
+        speed, running, pending = self.engine.throughput()
+        if running or pending:
+            self.throughput_signal.emit(speed, running, pending)
@@ -0,0 +1,1109 @@
+# 下载核心 (不依赖 Qt)
+#
+# 解析、展开列表、下载任务和任务队列都在这里实现，通过 on(event, handler) 注册回调报告进度。
+# 图形界面 (download_manager.py) 只是把这些事件转成 Qt 信号，命令行 / 后台服务 (cli.py) 直接使用。
+# 注意：事件回调在工作线程中调用，回调里不要直接操作界面。
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import yt_dlp
+from yt_dlp.utils import download_range_func
+
+import http_client
+from bandwidth import NORMAL, get_bandwidth_scheduler
+from cookie_manager import get_cookie_manager
+from dash_clip import locate_clip, write_clip
+import disk_io
+from download_archive import archive_key, get_download_archive
+from download_journal import get_download_journal
+from ffmpeg_locator import ensure_on_path, find_ffmpeg
+from job_history import get_job_history
+from format_selector import FormatIndex, FormatPolicy, policy_selector
+import metrics
+from metadata_cache import get_metadata_cache
+from postprocess import AUDIO_FORMATS, PostProcessPool, choose_audio_container, choose_container
+from progress_bus import ProgressBus
+import retry_policy
+from transfer_metrics import TransferMetrics, format_speed, get_transfer_history
+from segmented_downloader import (DownloadCancelled, SegmentedDownloader, SegmentError, StreamExpired, StreamTask,
+                                  retry_reason)
+from ydl_pool import get_ydl_pool
+
+# find_ffmpeg / format_speed 在这里一并导出 (以前定义在本模块)
+
+BV_ID_RE = re.compile(r'^(BV[0-9A-Za-z]{10}|av\d+)$', re.IGNORECASE)
+
+
+def parse_batch_text(text):
+    # 解析批量输入：每行一个链接，支持直接粘贴 BV 号 / av 号，# 开头为注释
+    urls = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if BV_ID_RE.match(line):
+            line = f"https://www.bilibili.com/video/{line}"
+        if line not in seen:
+            seen.add(line)
+            urls.append(line)
+    return urls
+
+
+# 文件名带上视频 ID (BV 号 / 分P)，同名的不同视频不会互相覆盖
+DEFAULT_OUTTMPL = '%(title)s [%(id)s].%(ext)s'
+DEFAULT_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+FORMAT_ID_RE = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+# yt-dlp 实例池的基础参数 (见 ydl_pool.py)：解析、展开列表、下载各用一组实例，任务相关的参数借出时再覆盖
+INFO_OPTIONS = {'quiet': True, 'no_warnings': True}
+EXPAND_OPTIONS = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist', 'lazy_playlist': True}
+
+
+def download_options():
+    # 显式指定 ffmpeg 路径 (保险起见)
+    ffmpeg = find_ffmpeg()
+    return {'ffmpeg_location': ffmpeg} if ffmpeg else {}
+
+
+def build_format_selector(format_id):
+    # 纯格式 ID (界面下拉框选的) 配上最佳音频；其他写法 (如 bestvideo[height<=720]+bestaudio) 原样交给 yt-dlp
+    if not format_id:
+        return DEFAULT_FORMAT
+    if FORMAT_ID_RE.match(format_id) and not format_id.startswith(('best', 'worst')):
+        return f"{format_id}+bestaudio/best"
+    return format_id
+
+
+def check_outtmpl(outtmpl):
+    # 输出模板必须是保存目录下的相对路径
+    if not outtmpl:
+        return DEFAULT_OUTTMPL
+    parts = outtmpl.replace('\\', '/').split('/')
+    if os.path.isabs(outtmpl) or '..' in parts:
+        raise ValueError(f"输出模板不能指向保存目录之外: {outtmpl}")
+    return outtmpl
+
+
+def parse_time(text):
+    # '90'、'1:30'、'01:01:30' -> 秒
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def check_clip(clip):
+    # 截取时间段：'1:30-2:45' / '90-165' / (90, 165)；结束时间为空表示到结尾
+    if not clip:
+        return None
+    try:
+        if isinstance(clip, str):
+            start, _, end = clip.partition('-')
+            clip = (parse_time(start or '0'), parse_time(end) if end.strip() else None)
+        start, end = float(clip[0]), (float(clip[1]) if clip[1] is not None else None)
+    except (ValueError, TypeError, IndexError):
+        raise ValueError(f"无法识别的时间段: {clip}")
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError(f"时间段无效: {clip}")
+    return start, end
+
+
+def clip_label(clip):
+    start, end = clip
+    return f"{start:g}-{end:g}" if end is not None else f"{start:g}-"
+
+
+def check_audio_format(audio_format):
+    if audio_format and audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"不支持的音频格式: {audio_format} (可选 {', '.join(AUDIO_FORMATS)})")
+    return audio_format or None
+
+
+def backup_urls(f):
+    # 接口返回的备用 CDN 地址 (yt-dlp 的 B 站解析器目前不保留，其他来源可能有)
+    backups = f.get('backup_url') or f.get('backupUrl') or []
+    return [backups] if isinstance(backups, str) else list(backups)
+
+
+class EventEmitter:
+    def __init__(self):
+        self._handlers = {}
+
+    def on(self, event, handler):
+        self._handlers.setdefault(event, []).append(handler)
+        return handler
+
+    def off(self, event, handler):
+        handlers = self._handlers.get(event, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def emit(self, event, *args):
+        for handler in list(self._handlers.get(event, ())):
+            handler(*args)
+
+
+# ----------------------------------------------------------------------
+# 视频信息
+# ----------------------------------------------------------------------
+
+def fetch_video_info(url):
+    # 返回 (info, 是否来自缓存)；先查元数据缓存，命中时完全跳过网络请求
+    cache = get_metadata_cache()
+    started = time.monotonic()
+    info = cache.get_for_url(url)
+    if info is not None:
+        metrics.EXTRACTION_SECONDS.observe(time.monotonic() - started, 'cache')
+        return info, True
+
+    with get_ydl_pool().borrow(INFO_OPTIONS, logger=metrics.YtdlpLogger()) as ydl:
+        info = ydl.sanitize_info(extract_info(ydl, url), True)
+    cache.put_for_url(url, info)
+    return info, False
+
+
+def extract_info(ydl, url):
+    # 解析耗时计入指标；失败时按 HTTP 状态码计数 (412 / 403 多半是触发了风控)
+    started = time.monotonic()
+    try:
+        return ydl.extract_info(url, download=False)
+    except Exception as e:
+        metrics.record_extraction_error(e)
+        raise
+    finally:
+        metrics.EXTRACTION_SECONDS.observe(time.monotonic() - started, 'network')
+
+
+def video_summary(info, from_cache=False):
+    return {
+        'title': info.get('title', '未知标题'),
+        'thumbnail': info.get('thumbnail', ''),
+        'uploader': info.get('uploader', '未知UP主'),
+        'duration': info.get('duration', 0),
+        'from_cache': from_cache,
+    }
+
+
+def list_video_formats(info):
+    # 每个 (分辨率, 帧率, 编码) 只列一项 (同档位取体积最小的)，从高画质到低画质排列
+    return FormatIndex.from_info(info).choices()
+
+
+# ----------------------------------------------------------------------
+# 批量展开
+# ----------------------------------------------------------------------
+
+class PlaylistExpander(EventEmitter):
+    """
+    批量解析：将多行链接 / 分P视频 / 合集 / 收藏夹 / UP主空间逐条展开。
+    使用 yt-dlp 的 flat 解析，只拉取列表不拉取每个视频的详细信息，
+    解析出一条就发送一条，队列满时暂停展开等待空位。
+
+    事件: entry({'url', 'title', 'source'}), status(str), finished(条目总数)
+    """
+    MAX_DEPTH = 3
+
+    def __init__(self, urls, can_accept=None):
+        super().__init__()
+        self.urls = list(urls)
+        self.can_accept = can_accept
+        self.is_running = True
+        self.count = 0
+
+    def run(self):
+        with get_ydl_pool().borrow(EXPAND_OPTIONS) as ydl:
+            for url in self.urls:
+                if not self.is_running:
+                    break
+                self.emit('status', f"正在展开: {url}")
+                try:
+                    self.expand(ydl, url, url, None, 0)
+                except Exception as e:
+                    self.emit('status', f"展开失败: {url} ({e})")
+
+        self.emit('finished', self.count)
+        return self.count
+
+    def expand(self, ydl, url, source, ie_key, depth):
+        # process=False: 不解析每个条目的格式，entries 保持为惰性迭代器 / 分页列表
+        result = ydl.extract_info(url, download=False, ie_key=ie_key, process=False)
+        result_type = result.get('_type', 'video')
+
+        if result_type in ('url', 'url_transparent') and depth < self.MAX_DEPTH:
+            # 短链接 / 跳转，继续解析目标地址
+            self.expand(ydl, result['url'], source, result.get('ie_key'), depth + 1)
+        elif result_type in ('playlist', 'multi_video'):
+            for entry in result.get('entries') or []:
+                if not self.is_running:
+                    return
+                if not entry:
+                    continue
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if entry_url:
+                    self.emit_entry(entry_url, entry.get('title'), source)
+        else:
+            self.emit_entry(result.get('webpage_url') or url, result.get('title'), source)
+
+    def emit_entry(self, url, title, source):
+        # 背压：队列已满时等待下载腾出空位，而不是把所有条目一次性塞进内存
+        while self.is_running and self.can_accept is not None and not self.can_accept():
+            time.sleep(0.2)
+        if not self.is_running:
+            return
+        self.count += 1
+        self.emit('entry', {'url': url, 'title': title or url, 'source': source})
+
+    def stop(self):
+        self.is_running = False
+
+
+# ----------------------------------------------------------------------
+# 单个下载任务
+# ----------------------------------------------------------------------
+
+class DownloadTask(EventEmitter):
+    """
+    下载一个视频。run() 阻塞直到下载结束，由调用方决定放在哪个线程执行。
+
+    事件: progress({'progress', 'downloaded', 'total', 'speed', 'eta'}，由 TransferMetrics 合并所有流并平滑),
+          status(阶段性的文本), phase(阶段), info({'title', 'uploader'}，拿到视频信息后发出一次),
+          merge(合并参数，由队列交给后处理进程池), finished(是否成功, 消息)
+    """
+
+    def __init__(self, url, format_id=None, save_path="downloads", segmented=True, connections=4,
+                 journal_entry=None, job_id=None, priority=NORMAL, outtmpl=None, verify_archive=False, policy=None,
+                 audio_only=False, audio_format=None, clip=None, scratch_dir=None):
+        super().__init__()
+        self.url = url
+        self.format_id = format_id
+        # 没有指定格式时按策略 (format_selector.FormatPolicy) 自动选择；存档按策略区分
+        self.policy = policy if not format_id else None
+        if audio_only:
+            # 只下载音频流，指定的视频格式不再适用
+            self.format_id = None
+            self.policy = FormatPolicy(max_abr=policy.max_abr if policy else None, audio_only=True)
+        self.audio_only = audio_only
+        self.audio_format = check_audio_format(audio_format)
+        self.clip = check_clip(clip)
+        self.format_key = self.format_id or (self.policy.spec if self.policy else None)
+        if self.clip:
+            self.format_key = f"{self.format_key or 'auto'}@{clip_label(self.clip)}"
+        self.save_path = save_path
+        # 下载中的流和合并前的中间文件放在临时目录，完成后再移入保存目录 (见 disk_io.py)
+        self.scratch_dir = disk_io.scratch_dir_for(save_path, scratch_dir)
+        self.space = None    # 预留的磁盘空间 (disk_io.SpaceReservation)，合并时交给队列
+        self.outtmpl = check_outtmpl(outtmpl)
+        self.segmented = segmented
+        self.connections = connections
+        self.journal_entry = journal_entry
+        self.is_running = True
+        self.pending_merge = None
+        self.metrics = TransferMetrics(job_id, url)
+        self.archive = get_download_archive()
+        self.verify_archive = verify_archive
+        self.output = None   # 下载完成的文件，用于写入存档索引
+        self.retry_policy = retry_policy.get_retry_policy()
+        self.retries = 0     # 重试 / 换 CDN 的次数，显示在界面上
+
+        # 所有下载流量都向带宽调度器申请令牌
+        self.job_id = job_id
+        self.priority = priority
+        self.throttle = get_bandwidth_scheduler().throttle_for(
+            job_id, priority, cancel_check=lambda: not self.is_running)
+        self._hook_bytes = {}
+
+        # 确保下载目录存在 (模板中的子目录由 yt-dlp 创建)
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path)
+
+    def run(self):
+        # yt-dlp 配置：指定了视频格式时下载该视频 + 最佳音频，否则按策略选择
+        outtmpl = self.outtmpl
+        if self.clip and outtmpl.endswith('.%(ext)s'):
+            # 片段的文件名带上时间段，不和完整视频冲突
+            outtmpl = f"{outtmpl[:-len('.%(ext)s')]} [{clip_label(self.clip)}].%(ext)s"
+        ydl_opts = {
+            'format': policy_selector(self.policy) if self.policy else build_format_selector(self.format_id),
+            'outtmpl': outtmpl,
+            # yt-dlp 自带下载器的 .part 和合并前的文件同样放在临时目录
+            'paths': {'home': self.save_path, 'temp': self.scratch_dir},
+            'progress_hooks': [self.progress_hook],
+            'postprocessor_hooks': [self.postprocessor_hook],
+            'logger': metrics.YtdlpLogger(lambda msg: self.emit('status', msg)),
+            # yt-dlp 自带下载器的重试也使用带抖动的退避 (默认是立即重试)
+            'retry_sleep_functions': {
+                'http': lambda n: self.retry_policy.delay('transient', n + 1),
+                'fragment': lambda n: self.retry_policy.delay('transient', n + 1),
+            },
+        }
+
+        if self.clip:
+            # 交给 yt-dlp 下载的流 (非 DASH) 由它用 ffmpeg 按时间段截取
+            ydl_opts['download_ranges'] = download_range_func(None, [(self.clip[0], self.clip[1] or float('inf'))])
+
+        try:
+            # 先查存档索引 (不访问网络)，已下载过的视频直接跳过
+            record = self.archive.lookup(self.url, self.format_key, verify=self.verify_archive)
+            if record is not None:
+                self.skip_archived(record)
+                return
+
+            self.emit('status', "初始化下载引擎...")
+            if self.journal_entry is not None:
+                self.journal_entry.set_state(DownloadJob.RUNNING)
+            # 从实例池借一个 yt-dlp 实例，套上本任务的参数
+            with get_ydl_pool().borrow(download_options(), **ydl_opts) as ydl:
+                self.emit('status', f"开始下载 (格式: {self.format_id or (self.policy and self.policy.spec) or '自动'})...")
+                self.download_with_cache(ydl)
+
+            if self.pending_merge is not None:
+                # 合并在后处理进程池中进行，这里只交出合并参数，下载槽位随即释放
+                self.emit('merge', self.pending_merge)
+                return
+
+            self.add_to_archive()
+            if self.journal_entry is not None:
+                self.journal_entry.journal.remove(self.journal_entry)
+            self.emit('progress', {'progress': 100.0, 'speed': 0.0, 'eta': 0})
+            self.emit('finished', True, "下载完成！")
+
+        except Exception as e:
+            if isinstance(e, DownloadCancelled) or not self.is_running:
+                # 手动停止 / 退出程序：保留日志和 .part 文件，下次启动时继续
+                if self.journal_entry is not None:
+                    self.journal_entry.set_state('paused', "下载已取消")
+                self.emit('finished', False, "下载已取消")
+                return
+            err_msg = str(e)
+            if "ffmpeg" in err_msg.lower():
+                err_msg = "未找到 FFmpeg，无法合并音视频。\n请尝试安装 FFmpeg 或选择不合并的低画质格式。"
+            if self.journal_entry is not None:
+                self.journal_entry.record_failure(err_msg)
+            self.emit('finished', False, f"下载出错: {err_msg}")
+        finally:
+            if self.space is not None and self.pending_merge is None:
+                self.space.release()
+
+    def skip_archived(self, record):
+        metrics.ARCHIVE_SKIPS.inc()
+        if self.journal_entry is not None:
+            self.journal_entry.journal.remove(self.journal_entry)
+        self.emit('progress', {'progress': 100.0, 'speed': 0.0, 'eta': 0})
+        self.emit('finished', True, f"已下载过，跳过: {record['path']}")
+
+    def set_output(self, info, path):
+        # 链接无法识别 (如短链) 时用解析出的视频 ID 作为存档的键
+        if path and info.get('_type', 'video') == 'video':
+            self.output = {
+                'archive_url': self.url if archive_key(self.url) else info.get('id'),
+                'format': self.format_key,
+                'title': info.get('title'),
+                'path': path,
+            }
+
+    def add_to_archive(self):
+        if self.output is None:
+            return
+        try:
+            self.archive.add(self.output['archive_url'], self.format_key, self.output['path'], self.output['title'],
+                             self.output.get('sha256'))
+        except (OSError, sqlite3.Error) as e:
+            self.emit('status', f"写入下载存档失败: {e}")
+
+    def download_with_cache(self, ydl):
+        cache = get_metadata_cache()
+        info = cache.get_for_url(self.url)
+        if info is not None:
+            # 复用解析阶段缓存的 info dict，由 process_ie_result 直接选格式并下载
+            self.emit('status', "使用缓存的视频信息，跳过解析")
+        reextracted = 0
+        while True:
+            processed = info is None
+            if processed:
+                info = self.extract_with_retry(ydl)
+                cache.put_for_url(self.url, ydl.sanitize_info(info, True))
+            if not reextracted:
+                self.emit('info', {'title': info.get('title'), 'uploader': info.get('uploader')})
+            try:
+                self.download_info(ydl, info, processed)
+                return
+            except (yt_dlp.utils.DownloadError, SegmentError) as e:
+                if not self.is_running:
+                    raise
+                if not processed:
+                    # 缓存中的视频流地址可能已失效，丢弃缓存重新解析
+                    metrics.STREAM_REEXTRACTIONS.inc(1, 'cache')
+                    self.emit('status', "缓存的视频地址已失效，重新解析...")
+                elif self.stream_expired(e) and reextracted < self.retry_policy.max_reextract:
+                    # 签名地址在下载途中过期 (所有 CDN 都拒绝)：重新解析拿新地址，已下载的分段从下载日志继续
+                    reextracted += 1
+                    metrics.STREAM_REEXTRACTIONS.inc(1, 'expired')
+                    self.emit('status', f"视频地址已过期，重新解析 ({reextracted}/{self.retry_policy.max_reextract})...")
+                else:
+                    raise
+                cache.invalidate_url(self.url)
+                info = None
+
+    @staticmethod
+    def stream_expired(error):
+        return isinstance(error, StreamExpired) or retry_policy.classify(error) == 'expired'
+
+    def extract_with_retry(self, ydl):
+        # 解析被限流 (412) 或网络出错时按退避时间重试；同一主机连续失败时熔断，所有任务一起暂停解析
+        breaker = retry_policy.get_breaker(metrics.host_of(self.url))
+        attempt = 0
+        while True:
+            delay = breaker.wait_time()
+            if delay > 0:
+                self.emit('status', f"{breaker.host} 暂时不可用，{delay:.0f} 秒后再解析...")
+                if not retry_policy.wait(min(delay, 5.0), lambda: not self.is_running):
+                    raise DownloadCancelled("下载已取消")
+                continue
+            try:
+                info = extract_info(ydl, self.url)
+                breaker.record_success()
+                return info
+            except Exception as e:
+                kind = retry_policy.classify(e)
+                if kind not in ('throttled', 'transient'):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                attempt += 1
+                if not self.is_running or not self.retry_policy.should_retry(kind, attempt):
+                    raise
+                delay = self.retry_policy.delay(kind, attempt)
+                self.on_retry({
+                    'format_id': None, 'host': breaker.host, 'reason': retry_reason(e), 'attempt': attempt,
+                    'max_attempts': self.retry_policy.max_attempts, 'delay': delay, 'switched_to': None,
+                })
+                if not retry_policy.wait(delay, lambda: not self.is_running):
+                    raise DownloadCancelled("下载已取消")
+
+    def on_retry(self, info):
+        self.retries += 1
+        self.emit('progress', {'retries': self.retries})
+        if info['switched_to']:
+            self.emit('status', f"{info['host']} 不可用 ({info['reason']})，切换到 {info['switched_to']}")
+        else:
+            self.emit('status', f"{info['host']} 请求失败 ({info['reason']})，{info['delay']:.1f} 秒后重试 "
+                                f"({info['attempt']}/{info['max_attempts']})")
+
+    def download_info(self, ydl, info, processed):
+        if self.segmented:
+            if not processed:
+                # 只做格式选择，得到 requested_formats 后由分段下载引擎接手
+                info = ydl.process_ie_result(info, download=False)
+            if self.download_segmented(ydl, info):
+                return
+        info = ydl.process_ie_result(info, download=True)
+        downloads = info.get('requested_downloads') or [{}]
+        self.set_output(info, downloads[0].get('filepath') or info.get('filepath'))
+
+    def download_segmented(self, ydl, info):
+        # 分P列表、m3u8 / 分段 flv 等情况交给 yt-dlp 默认下载器
+        if info.get('_type', 'video') != 'video':
+            return False
+        formats = info.get('requested_formats') or [info]
+        if any(f.get('protocol') not in ('http', 'https') or not f.get('url') for f in formats):
+            return False
+
+        final_path = ydl.prepare_filename(info)
+        root, ext = os.path.splitext(final_path)
+        vcodec = next((f.get('vcodec') for f in formats if f.get('vcodec') not in (None, 'none')), None)
+        acodec = next((f.get('acodec') for f in formats if f.get('acodec') not in (None, 'none')), None)
+        if len(formats) > 1:
+            # 选一个能流复制容纳这些编码的容器，保证合并时不重新编码
+            final_path = f"{root}.{choose_container(vcodec, acodec, ext.lstrip('.'))}"
+        elif vcodec is None and self.audio_format:
+            final_path = f"{root}.{choose_audio_container(acodec, self.audio_format)}"
+            if not final_path.endswith('.' + self.audio_format):
+                self.emit('status', f"音频编码 {acodec} 不能直接存为 {self.audio_format}，保存为 "
+                                    f"{os.path.splitext(final_path)[1].lstrip('.')} (不转码)")
+        # 合并、转封装和截取的片段都要经过 ffmpeg，先下载到中间文件
+        postprocess = len(formats) > 1 or bool(vcodec is None and self.audio_format) or bool(self.clip)
+        self.set_output(info, final_path)
+        if os.path.exists(final_path):
+            self.emit('status', f"文件已存在: {os.path.basename(final_path)}")
+            return True
+        os.makedirs(os.path.dirname(final_path) or '.', exist_ok=True)
+
+        entry = self.journal_entry
+        if entry is not None:
+            entry.set_output(final_path)
+
+        clips = {}
+        if self.clip:
+            # 读取每个流开头的分段索引，算出覆盖时间段的字节范围
+            session = http_client.get_session()
+            for f in formats:
+                clips[f['format_id']] = locate_clip(session, f['url'], f.get('http_headers'), *self.clip)
+
+        # 流文件放在临时目录，文件名和最终文件对应
+        base = os.path.join(self.scratch_dir, os.path.basename(os.path.splitext(final_path)[0]))
+        scratch_path = os.path.join(self.scratch_dir, os.path.basename(final_path))
+        tasks = []
+        for f in formats:
+            path = f"{base}.f{f['format_id']}.{f['ext']}" if postprocess else scratch_path
+            stream = entry.stream(f['format_id']) if entry is not None else None
+            if stream and stream.get('done') and stream.get('path') == path and os.path.exists(path):
+                # 该流上次已下载完成 (可能只差合并)
+                continue
+            clip = clips.get(f['format_id'])
+            if clip is not None:
+                task = StreamTask(f['url'], path + '.clip', f.get('http_headers'), format_id=f['format_id'],
+                                  byte_range=clip['range'], backups=backup_urls(f))
+            else:
+                task = StreamTask(f['url'], path, f.get('http_headers'), f.get('filesize'), format_id=f['format_id'],
+                                  backups=backup_urls(f))
+            if stream and stream.get('path') == task.path:
+                task.size = stream.get('size') or task.size
+                task.completed = stream.get('completed') or []
+            tasks.append(task)
+
+        self.reserve_space(tasks, formats, final_path, postprocess)
+        if tasks:
+            resumed = sum(1 for task in tasks if task.completed)
+            self.emit('status',
+                      f"分段下载 {len(tasks)} 个流 ({self.connections} 个连接)"
+                      + (f"，其中 {resumed} 个从断点继续" if resumed else "") + "...")
+            downloader = SegmentedDownloader(
+                connections=self.connections,
+                progress_callback=self.segment_progress,
+                cancel_check=lambda: not self.is_running,
+                prepared_callback=self.on_stream_prepared,
+                segment_callback=self.on_segment_done,
+                throttle=self.throttle,
+                retries=self.retry_policy.max_attempts,
+                retry_callback=self.on_retry,
+            )
+            downloader.download_all(tasks)
+            for task in tasks:
+                clip = clips.get(task.format_id)
+                if clip is not None:
+                    path = task.path[:-len('.clip')]
+                    write_clip(clip['init'], task.path, path)
+                    if entry is not None:
+                        size = os.path.getsize(path)
+                        entry.reset_stream(task.format_id, path, size, [[0, size - 1]])
+                if entry is not None:
+                    entry.mark_stream_done(task.format_id)
+        self.emit('progress', {'speed': 0.0})
+
+        if not postprocess and os.path.exists(scratch_path):
+            # 移入保存目录 (同一文件系统直接改名，否则边复制边算哈希)
+            self.output['sha256'] = disk_io.finalize(scratch_path, final_path)
+        if postprocess:
+            self.pending_merge = {
+                'inputs': [f"{base}.f{f['format_id']}.{f['ext']}" for f in formats],
+                'output': final_path,
+                'vcodec': vcodec,
+                'archive': self.output,
+                'space': self.space,
+                # 片段的时间戳整体平移到 0
+                'time_offset': min(clip['start'] for clip in clips.values()) if clips else None,
+            }
+            self.emit('progress', {'progress': 99.0})
+            if entry is not None:
+                entry.set_merge_status('pending')
+        return True
+
+    def reserve_space(self, tasks, formats, final_path, postprocess):
+        # 开始写盘前检查剩余空间：流文件按格式 ID 预留 (预分配之后释放)；
+        # 合并的临时输出和复制到其他文件系统的部分一直预留到任务结束
+        if self.space is not None:
+            self.space.release()   # 重新解析后再次下载
+            self.space = None
+        sizes = {}
+        for task in tasks:
+            if os.path.exists(task.part_path):
+                sizes[task.format_id] = 0   # 断点续传，文件已经分配过
+            elif task.byte_range is not None:
+                sizes[task.format_id] = task.byte_range[1] - task.byte_range[0] + 1
+            else:
+                sizes[task.format_id] = task.size or 0
+        if self.clip:
+            output = sum(sizes.values())
+        else:
+            output = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+        needs = [(self.scratch_dir, size, format_id) for format_id, size in sizes.items()]
+        if postprocess:
+            needs.append((self.scratch_dir, output, 'output'))
+        destination = os.path.dirname(final_path) or '.'
+        if not disk_io.same_filesystem(self.scratch_dir, destination):
+            needs.append((destination, output, 'output'))
+        self.space = disk_io.reserve_space(needs)
+
+    def on_stream_prepared(self, task):
+        self.metrics.resume('segmented', task.downloaded)
+        if self.space is not None:
+            # 流文件已经按大小预分配，不用再为它预留
+            self.space.release(task.format_id)
+        if self.journal_entry is not None:
+            self.journal_entry.reset_stream(task.format_id, task.path, task.size, task.completed)
+
+    def on_segment_done(self, task, start, end):
+        if self.journal_entry is not None:
+            self.journal_entry.mark_segment(task.format_id, start, end)
+
+    def segment_progress(self, downloaded, total, speed):
+        # 分段下载器已把所有流合在一起统计；只报告结构化的数值，由界面自行格式化
+        self.emit('progress', self.metrics.update('segmented', downloaded, total))
+
+    def progress_hook(self, d):
+        if not self.is_running:
+            raise yt_dlp.utils.DownloadError("下载已取消")
+
+        if d['status'] == 'downloading':
+            try:
+                # 计算进度
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                downloaded = d.get('downloaded_bytes', 0)
+
+                # yt-dlp 自带下载器：在回调里按新增字节数申请令牌，阻塞即限速
+                filename = d.get('tmpfilename') or d.get('filename')
+                delta = downloaded - self._hook_bytes.get(filename, 0)
+                self._hook_bytes[filename] = downloaded
+                info = d.get('info_dict') or {}
+                if delta > 0:
+                    self.throttle(delta)
+                    metrics.DOWNLOADED_BYTES.inc(delta, metrics.host_of(info.get('url')))
+
+                # yt-dlp 逐个下载各个流：先登记所有流的预估大小，切换到音频流时进度不会倒退
+                for f in info.get('requested_formats') or []:
+                    self.metrics.expect(f.get('format_id'), f.get('filesize') or f.get('filesize_approx'))
+                key = info.get('format_id') or filename
+                self.emit('progress', self.metrics.update(key, downloaded, total_bytes))
+
+            except Exception:
+                pass
+
+        elif d['status'] == 'finished':
+            self.emit('status', "下载完成，正在处理/合并文件...")
+            self.emit('progress', dict(self.metrics.fields(), speed=0.0, eta=None))
+
+    def postprocessor_hook(self, d):
+        # 合并音视频阶段单独标记，方便队列区分 running / merging
+        if d.get('postprocessor') == 'Merger' and d['status'] == 'started':
+            self.emit('phase', DownloadJob.MERGING)
+
+    def stop(self):
+        self.is_running = False
+
+
+# ----------------------------------------------------------------------
+# 任务队列
+# ----------------------------------------------------------------------
+
+class QueueFullError(Exception):
+    pass
+
+
+class DownloadJob:
+    # 任务状态
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    MERGING = 'merging'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, job_id, url, format_id=None, journal_entry=None, priority=NORMAL, rate_limit=None,
+                 outtmpl=None, audio_only=False, audio_format=None, clip=None):
+        self.job_id = job_id
+        self.url = url
+        self.format_id = format_id
+        self.journal_entry = journal_entry
+        self.priority = priority
+        self.rate_limit = rate_limit   # 单任务限速 (B/s)，None 表示不限
+        self.outtmpl = outtmpl
+        self.audio_only = audio_only
+        self.audio_format = audio_format
+        self.clip = clip               # (开始秒数, 结束秒数或 None)
+        self.state = DownloadJob.QUEUED
+        self.progress = 0.0
+        self.speed = 0.0
+        self.message = ''
+        self.transfer = {}    # 最近一次的结构化进度 (downloaded / total / eta ...)
+        self.metrics = None   # TransferMetrics，任务开始后才有
+        self.summary = None   # 结束时的传输统计
+        self.task = None      # DownloadTask
+        self.worker = None    # 执行 task 的线程
+        self.cancelled = False
+        self.merge_stats = None
+        self.title = None     # 解析出视频信息后才有
+        self.uploader = None
+        self.created_at = time.time()
+
+    @property
+    def is_active(self):
+        return self.state in (DownloadJob.RUNNING, DownloadJob.MERGING)
+
+    @property
+    def is_finished(self):
+        return self.state in (DownloadJob.DONE, DownloadJob.FAILED)
+
+    def to_dict(self):
+        return {
+            'id': self.job_id,
+            'url': self.url,
+            'title': self.title,
+            'uploader': self.uploader,
+            'created_at': round(self.created_at, 3),
+            'format': self.format_id,
+            'priority': self.priority,
+            'outtmpl': self.outtmpl,
+            'audio_only': self.audio_only,
+            'audio_format': self.audio_format,
+            'clip': list(self.clip) if self.clip else None,
+            'state': self.state,
+            'progress': round(self.progress, 2),
+            'speed': round(self.speed, 1),
+            'downloaded': self.transfer.get('downloaded'),
+            'total': self.transfer.get('total'),
+            'eta': self.transfer.get('eta'),
+            'retries': self.transfer.get('retries', 0),
+            'message': self.message,
+            'output': self.journal_entry.data.get('output') if self.journal_entry is not None else None,
+        }
+
+
+class DownloadEngine(EventEmitter):
+    """
+    下载任务队列：固定数量的工作线程并发下载，其余任务排队等待。
+    排队数量达到 max_pending 时拒绝新任务 (QueueFullError)，由调用方决定稍后重试。
+
+    事件: job_added(job_id), job_state(job_id, 状态), job_status(job_id, 文本),
+          progress_frame({job_id: 字段})  每 progress_interval 秒最多一帧，见 progress_bus.py
+          job_info(job_id, {'title', 'uploader'}), job_finished(job_id, 是否成功, 消息), idle()
+    结束的任务写入下载历史 (job_history.py)。
+    """
+
+    def __init__(self, max_workers=3, max_pending=500, save_path="downloads", connections_per_job=4,
+                 merge_workers=2, progress_interval=0.1, outtmpl=None, verify_archive=False, policy=None,
+                 scratch_dir=None):
+        super().__init__()
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max_pending
+        self.save_path = save_path
+        self.scratch_dir = scratch_dir   # 下载中的临时文件目录，默认为保存目录下的 .incomplete
+        self.connections_per_job = connections_per_job
+        self.outtmpl = check_outtmpl(outtmpl)
+        self.verify_archive = verify_archive
+        self.policy = policy   # 未指定格式的任务使用的格式策略 (FormatPolicy)
+        self.journal = get_download_journal()
+        self.archive = get_download_archive()
+        self.bandwidth = get_bandwidth_scheduler()
+        self.postprocess_pool = PostProcessPool(merge_workers)
+        ensure_on_path()   # ffmpeg 所在目录加入 PATH (第一次使用时查找，结果有磁盘缓存)
+        self.progress_bus = ProgressBus(progress_interval)
+        self.progress_bus.subscribe(lambda frame: self.emit('progress_frame', frame))
+        self.history = get_transfer_history()
+        self.job_history = get_job_history()
+        self.lock = threading.RLock()
+        self.idle_event = threading.Event()
+        self.idle_event.set()
+        self.jobs = {}
+        self.pending = deque()
+        self._next_id = 1
+
+        # 队列长度 / 槽位占用在抓取指标时才计算 (一个进程只有一个引擎)
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.pending))
+        metrics.WORKERS_BUSY.set_function(lambda: len(self.network_jobs()))
+        metrics.WORKERS_MAX.set_function(lambda: self.max_workers)
+        metrics.MERGES_RUNNING.set_function(
+            lambda: sum(1 for job in list(self.jobs.values()) if job.state == DownloadJob.MERGING))
+
+        # 队列可能运行很久：后台定期检查登录状态，SESSDATA 快过期时自动刷新，避免中途掉到 480P
+        self.cookies = get_cookie_manager()
+        self.cookies.start_auto_refresh()
+
+        # 后台预热 yt-dlp 实例 (解析器正则编译、网络栈)，每个下载槽位都能借到空闲实例
+        self.ydl_pool = get_ydl_pool()
+        self.ydl_pool.max_idle = max(self.ydl_pool.max_idle, self.max_workers)
+        self.ydl_pool.prewarm(download_options())
+
+    def submit(self, url, format_id=None, journal_entry=None, priority=NORMAL, rate_limit=None, outtmpl=None,
+               audio_only=False, audio_format=None, clip=None):
+        # 日志里记下实际使用的模板，恢复任务时文件名不受之后修改默认模板的影响
+        outtmpl = check_outtmpl(outtmpl) if outtmpl else self.outtmpl
+        audio_format = check_audio_format(audio_format)
+        clip = check_clip(clip)
+        with self.lock:
+            if not self.can_accept():
+                raise QueueFullError(f"队列已满 (最多排队 {self.max_pending} 个任务)")
+
+            # 任务一入队就写入下载日志，程序重启后可以重建队列
+            if journal_entry is None:
+                journal_entry = self.journal.create(url, format_id, self.save_path, outtmpl, priority,
+                                                    audio_only, audio_format, clip)
+            job = DownloadJob(self._next_id, url, format_id, journal_entry, priority, rate_limit, outtmpl,
+                              audio_only, audio_format, clip)
+            self._next_id += 1
+            self.jobs[job.job_id] = job
+            self.pending.append(job)
+            self.idle_event.clear()
+            self.emit('job_added', job.job_id)
+            self._schedule()
+            return job
+
+    def restore_from_journal(self):
+        # 启动时恢复上次未完成的任务 (包括还在排队的)，返回恢复的数量
+        restored = 0
+        for entry in self.journal.pending_entries():
+            if not self.can_accept():
+                break
+            if entry.save_path and entry.save_path != self.save_path:
+                continue
+            self.submit(entry.url, entry.format_id, journal_entry=entry, priority=entry.priority or NORMAL,
+                        outtmpl=entry.outtmpl, audio_only=entry.audio_only, audio_format=entry.audio_format,
+                        clip=entry.clip)
+            restored += 1
+        return restored
+
+    def can_accept(self):
+        return len(self.pending) < self.max_pending
+
+    def set_rate_limit(self, rate):
+        # 全局限速 (B/s)，0 / None 表示不限
+        self.bandwidth.set_global_rate(rate)
+
+    def set_job_rate_limit(self, job_id, rate):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.rate_limit = rate or None
+            self.bandwidth.set_job_rate(job_id, job.rate_limit)
+
+    def set_max_workers(self, count):
+        with self.lock:
+            self.max_workers = max(1, int(count))
+            self.ydl_pool.max_idle = max(self.ydl_pool.max_idle, self.max_workers)
+            self._schedule()
+
+    def cancel(self, job_id):
+        # 返回是否真的取消了任务：已结束、已不在队列里 (空闲后清理) 或已交给后处理进程池合并的任务无法取消
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.is_finished:
+                return False
+            if job.state == DownloadJob.QUEUED:
+                job.cancelled = True
+                self.pending.remove(job)
+                if job.journal_entry is not None:
+                    self.journal.remove(job.journal_entry)
+                self._finish(job, False, "已取消")
+                return True
+            if job.task is not None:
+                job.cancelled = True
+                job.task.stop()
+                return True
+            return False
+
+    def stop_all(self, timeout=5.0):
+        # 退出程序时调用：排队中的任务保留在下载日志里，运行中的任务停止后从断点继续
+        with self.lock:
+            self.pending.clear()
+            running = self.network_jobs()
+            for job in running:
+                job.task.stop()
+        self.postprocess_pool.shutdown()
+        self.progress_bus.stop()
+        self.cookies.stop_auto_refresh()
+        self.ydl_pool.close()
+        deadline = time.monotonic() + timeout
+        for job in running:
+            worker = job.worker
+            if worker is not None:
+                worker.join(max(deadline - time.monotonic(), 0))
+
+    def wait_idle(self, timeout=None):
+        # 阻塞直到队列中的任务全部结束 (命令行 / 后台服务使用)
+        return self.idle_event.wait(timeout)
+
+    def running_jobs(self):
+        return [job for job in list(self.jobs.values()) if job.is_active]
+
+    def network_jobs(self):
+        # 占用下载槽位的任务：工作线程还在执行 task 的都算。合并交给后处理进程池时 task 已释放，不占槽位；
+        # yt-dlp 兜底路径在工作线程里直接调用 ffmpeg 合并，状态虽是 merging，线程仍被占用
+        return [job for job in list(self.jobs.values()) if job.is_active and job.task is not None]
+
+    def total_speed(self):
+        return sum(job.speed for job in self.running_jobs())
+
+    def overall_progress(self):
+        # 本批次 (自上次空闲以来) 所有任务的平均进度
+        jobs = list(self.jobs.values())
+        if not jobs:
+            return 0.0
+        total = sum(100.0 if job.is_finished else job.progress for job in jobs)
+        return total / len(jobs)
+
+    def throughput(self):
+        # (总速度 B/s, 运行中, 排队中)
+        return self.total_speed(), len(self.running_jobs()), len(self.pending)
+
+    def _schedule(self):
+        with self.lock:
+            while self.pending and len(self.network_jobs()) < self.max_workers:
+                self._start(self.pending.popleft())
+
+    def _start(self, job):
+        self.bandwidth.register_job(job.job_id, job.rate_limit, job.priority)
+        task = DownloadTask(job.url, job.format_id, self.save_path, connections=self.connections_per_job,
+                            journal_entry=job.journal_entry, job_id=job.job_id, priority=job.priority,
+                            outtmpl=job.outtmpl, verify_archive=self.verify_archive, policy=self.policy,
+                            audio_only=job.audio_only, audio_format=job.audio_format, clip=job.clip,
+                            scratch_dir=self.scratch_dir)
+        job.task = task
+        job.metrics = task.metrics
+        job.state = DownloadJob.RUNNING
+        job_id = job.job_id
+
+        # 每个任务独立注册回调，避免多个线程互相覆盖
+        task.on('progress', lambda fields: self._on_progress(job_id, fields))
+        task.on('status', lambda text: self.emit('job_status', job_id, text))
+        task.on('phase', lambda phase: self._set_state(job_id, phase))
+        task.on('info', lambda summary: self._on_info(job_id, summary))
+        task.on('finished', lambda ok, msg: self._on_task_finished(job_id, ok, msg))
+        task.on('merge', lambda spec: self._on_merge_requested(job_id, spec))
+
+        self.emit('job_state', job_id, job.state)
+        job.worker = threading.Thread(target=task.run, name=f"download-{job_id}", daemon=True)
+        job.worker.start()
+
+    def _on_progress(self, job_id, fields):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.transfer.update(fields)
+        job.progress = fields.get('progress', job.progress)
+        job.speed = fields.get('speed', job.speed)
+        self.progress_bus.publish(job_id, **fields)
+
+    def _on_info(self, job_id, summary):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.title = summary.get('title') or job.title
+            job.uploader = summary.get('uploader') or job.uploader
+            self.emit('job_info', job_id, summary)
+
+    def _set_state(self, job_id, state):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.state != state:
+                job.state = state
+                job.speed = 0.0
+                self.progress_bus.publish(job_id, phase=state, speed=0.0)
+                self.emit('job_state', job_id, state)
+
+    def _release_task(self, job):
+        self.bandwidth.unregister_job(job.job_id)
+        job.task = None
+
+    def _on_task_finished(self, job_id, success, msg):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            self._release_task(job)
+            if job.cancelled and job.journal_entry is not None:
+                # 用户主动取消的任务不再恢复
+                self.journal.remove(job.journal_entry)
+            self._finish(job, success, msg)
+            self._schedule()
+
+    def _on_merge_requested(self, job_id, spec):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            self._release_task(job)
+            self._set_state(job_id, DownloadJob.MERGING)
+            self.emit('job_status', job_id, "下载完成，正在处理/合并文件...")
+            if job.journal_entry is not None:
+                job.journal_entry.set_merge_status('running')
+
+            self.postprocess_pool.submit_merge(
+                spec['inputs'], spec['output'], find_ffmpeg() or 'ffmpeg', spec.get('vcodec'),
+                callback=lambda result, error: self._on_merge_done(
+                    job_id, dict(spec, **(result or {})), str(error) if error else ''),
+                time_offset=spec.get('time_offset'),
+            )
+            # 下载槽位已释放，立即开始下一个任务
+            self._schedule()
+
+    def _on_merge_done(self, job_id, result, error):
+        # 在进程池的回调线程中调用
+        if result.get('space') is not None:
+            result['space'].release()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            entry = job.journal_entry
+            if error:
+                if entry is not None:
+                    entry.set_merge_status('failed')
+                    entry.record_failure(error)
+                self._finish(job, False, f"下载出错: {error}")
+                return
+
+            job.merge_stats = result
+            metrics.MERGE_SECONDS.observe(result['seconds'])
+            for path in result['inputs']:
+                if os.path.exists(path):
+                    os.remove(path)
+            archive = result.get('archive')
+            if archive is not None:
+                try:
+                    self.archive.add(archive['archive_url'], archive['format'], result['output'], archive['title'],
+                                     result.get('sha256'))
+                except (OSError, sqlite3.Error) as e:
+                    self.emit('job_status', job_id, f"写入下载存档失败: {e}")
+            if entry is not None:
+                self.journal.remove(entry)
+            self._finish(job, True, f"下载完成！合并耗时 {result['seconds']:.2f}s "
+                                    f"({format_speed(result['bytes_per_sec'])})")
+
+    def _record_history(self, job, state, msg):
+        output = job.merge_stats.get('output') if job.merge_stats else None
+        if output is None and job.journal_entry is not None:
+            output = job.journal_entry.data.get('output')
+        size = job.summary['bytes'] if job.summary is not None else job.transfer.get('total')
+        try:
+            self.job_history.add(job.url, state, job.title, job.uploader, size, job.created_at, output, msg)
+        except sqlite3.Error as e:
+            self.emit('job_status', job.job_id, f"写入下载历史失败: {e}")
+
+    def _finish(self, job, success, msg):
+        job.state = DownloadJob.DONE if success else DownloadJob.FAILED
+        job.speed = 0.0
+        job.message = msg
+        if success:
+            job.progress = 100.0
+        if job.metrics is not None:
+            merge_seconds = job.merge_stats.get('seconds') if job.merge_stats else None
+            job.summary = job.metrics.finish(success, msg, merge_seconds)
+            self.history.record(job.summary)
+        result = 'success' if success else ('cancelled' if job.cancelled or msg.endswith('已取消') else 'failed')
+        metrics.JOBS.inc(1, result)
+        if job.summary is not None:
+            metrics.JOB_SECONDS.observe(job.summary['duration'], result)
+        self._record_history(job, 'done' if success else result, msg)
+        # 最后一帧进度先发出，保证 job_finished 之后不会再收到该任务的进度
+        self.progress_bus.publish(job.job_id, phase=job.state, progress=job.progress, speed=0.0)
+        self.progress_bus.discard(job.job_id)
+        self.emit('job_state', job.job_id, job.state)
+        self.emit('job_finished', job.job_id, success, msg)
+
+        if not self.pending and not self.running_jobs():
+            # 一批任务结束后清空记录，下一批重新统计整体进度
+            self.jobs.clear()
+            self.idle_event.set()
+            self.emit('idle')
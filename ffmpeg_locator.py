@@ -0,0 +1,83 @@
+# ffmpeg 路径查找 (带磁盘缓存)
+#
+# imageio_ffmpeg.get_ffmpeg_exe() 第一次调用要导入 imageio_ffmpeg 并检查可执行文件，
+# 以前在 downloader_core 导入时就执行，还会修改 PATH，拖慢启动。
+# 现在第一次真正用到 ffmpeg 时才查找，结果写入 cache/ffmpeg.json；
+# 下次启动先校验缓存 (文件存在、可执行、大小和修改时间没变)，通过就直接使用，不再导入 imageio_ffmpeg。
+
+import json
+import os
+import shutil
+import threading
+
+from metadata_cache import CACHE_DIR
+
+CACHE_FILE = os.path.join(CACHE_DIR, 'ffmpeg.json')
+
+_lock = threading.Lock()
+_found = None       # 进程内只查找一次 (每个下载 / 合并任务都要用)；(路径,) 表示已查找过，路径可能是 None
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def _load_cached(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        path = data['path']
+        # 用户改了 IMAGEIO_FFMPEG_EXE 后重新查找
+        if data.get('env') != os.environ.get('IMAGEIO_FFMPEG_EXE'):
+            return None
+        if not os.access(path, os.X_OK) or _stat_key(path) != data.get('stat'):
+            return None
+        return path
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_cached(cache_file, path):
+    try:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp = cache_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'stat': _stat_key(path), 'env': os.environ.get('IMAGEIO_FFMPEG_EXE')}, f)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+
+
+def _discover():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which('ffmpeg')
+
+
+def find_ffmpeg(refresh=False, cache_file=None):
+    # 返回 ffmpeg 可执行文件路径，找不到时返回 None；refresh=True 忽略缓存重新查找
+    global _found
+    cache_file = cache_file or CACHE_FILE
+    with _lock:
+        if _found is not None and not refresh:
+            return _found[0]
+        path = None if refresh else _load_cached(cache_file)
+        if path is None:
+            path = _discover()
+            if path:
+                _save_cached(cache_file, path)
+        _found = (path,)
+        return path
+
+
+def ensure_on_path():
+    # 把 ffmpeg 所在目录加入 PATH (yt-dlp 的后处理器也能找到 ffprobe 等)
+    path = find_ffmpeg()
+    if path:
+        directory = os.path.dirname(path)
+        if directory not in os.environ.get('PATH', '').split(os.pathsep):
+            os.environ['PATH'] = os.environ.get('PATH', '') + os.pathsep + directory
+    return path
@@ -0,0 +1,254 @@
+# 格式选择
+#
+# 把 yt-dlp 的格式列表整理成紧凑的索引：视频流按 (分辨率, 帧率, 编码) 分组，每组只保留体积最小的一条，
+# 音频流按码率排序。再按用户策略 (如 "1080p,hevc,smallest" = 最高 1080P、优先 HEVC、同画质选最小)
+# 自动挑出视频 + 音频组合，批量下载不需要逐个选择清晰度，也不会多下载用不到的码率。
+#
+# 策略写法 (逗号分隔，顺序无关):
+#   1080p / 720p ...        最高分辨率
+#   60fps / 30fps           最高帧率
+#   hevc / av1 / avc        编码偏好，写多个时按先后排序；加 only 表示只接受这些编码
+#   smallest / best         同一分辨率内选体积最小 (默认) 还是码率最高
+#   128k / 192k ...         音频最高码率 (默认选最好的音频)
+#   audio                   只下载音频流
+
+import re
+
+CODEC_NAMES = {
+    'avc1': 'avc', 'avc3': 'avc', 'h264': 'avc',
+    'hev1': 'hevc', 'hvc1': 'hevc', 'hevc': 'hevc', 'h265': 'hevc',
+    'av01': 'av1', 'av1': 'av1',
+    'mp4a': 'aac', 'aac': 'aac', 'ec-3': 'eac3', 'eac3': 'eac3', 'flac': 'flac',
+}
+CODEC_LABELS = {'avc': 'AVC', 'hevc': 'HEVC', 'av1': 'AV1'}
+VIDEO_CODECS = ('avc', 'hevc', 'av1')
+
+HEIGHT_RE = re.compile(r'^(\d+)p$')
+FPS_RE = re.compile(r'^(\d+)fps$')
+ABR_RE = re.compile(r'^(\d+)k$')
+
+
+def codec_name(codec):
+    family = (codec or '').split('.')[0]
+    return CODEC_NAMES.get(family, CODEC_NAMES.get(family.lower(), family.lower()))
+
+
+def is_video(f):
+    return f.get('vcodec') not in (None, 'none') and bool(f.get('height'))
+
+
+def is_audio_only(f):
+    return f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')
+
+
+def stream_size(f, duration=None):
+    size = f.get('filesize') or f.get('filesize_approx')
+    if not size and f.get('tbr') and duration:
+        size = int(f['tbr'] * 1000 / 8 * duration)
+    return size
+
+
+class FormatPolicy:
+    def __init__(self, max_height=None, max_fps=None, codecs=(), only=False, prefer='smallest', max_abr=None,
+                 audio_only=False):
+        self.audio_only = audio_only
+        self.max_height = max_height
+        self.max_fps = max_fps
+        self.codecs = tuple(codecs)
+        self.only = only
+        self.prefer = prefer
+        self.max_abr = max_abr
+
+    @property
+    def spec(self):
+        parts = ['audio'] if self.audio_only else []
+        if self.max_height:
+            parts.append(f"{self.max_height}p")
+        if self.max_fps:
+            parts.append(f"{self.max_fps}fps")
+        parts += self.codecs
+        if self.only:
+            parts.append('only')
+        parts.append(self.prefer)
+        if self.max_abr:
+            parts.append(f"{self.max_abr}k")
+        return ','.join(parts)
+
+    def codec_rank(self, codec):
+        return self.codecs.index(codec) if codec in self.codecs else len(self.codecs)
+
+    def accepts(self, stream):
+        if self.max_height and stream['height'] > self.max_height:
+            return False
+        if self.max_fps and (stream['fps'] or 0) > self.max_fps:
+            return False
+        if self.only and self.codecs and stream['codec'] not in self.codecs:
+            return False
+        return True
+
+
+def parse_policy(text):
+    # 解析失败抛出 ValueError (命令行 / 接口直接把消息返回给用户)
+    policy = FormatPolicy()
+    codecs = []
+    for token in (text or '').lower().replace(' ', '').split(','):
+        if not token:
+            continue
+        if HEIGHT_RE.match(token):
+            policy.max_height = int(HEIGHT_RE.match(token).group(1))
+        elif FPS_RE.match(token):
+            policy.max_fps = int(FPS_RE.match(token).group(1))
+        elif ABR_RE.match(token):
+            policy.max_abr = int(ABR_RE.match(token).group(1))
+        elif token in VIDEO_CODECS:
+            codecs.append(token)
+        elif token == 'audio':
+            policy.audio_only = True
+        elif token == 'only':
+            policy.only = True
+        elif token in ('smallest', 'best'):
+            policy.prefer = token
+        else:
+            raise ValueError(f"无法识别的格式策略: {token}")
+    policy.codecs = tuple(codecs)
+    return policy
+
+
+class FormatIndex:
+    def __init__(self, formats, duration=None):
+        self.duration = duration
+        groups = {}
+        self.audio = []
+        for f in formats:
+            if is_audio_only(f):
+                self.audio.append({
+                    'format_id': f['format_id'],
+                    'codec': codec_name(f.get('acodec')),
+                    'abr': f.get('abr') or f.get('tbr') or 0,
+                    'size': stream_size(f, duration),
+                    'format': f,
+                })
+            elif is_video(f):
+                stream = {
+                    'format_id': f['format_id'],
+                    'height': f['height'],
+                    'fps': round(f['fps']) if f.get('fps') else None,
+                    'codec': codec_name(f.get('vcodec')),
+                    'tbr': f.get('vbr') or f.get('tbr') or 0,
+                    'size': stream_size(f, duration),
+                    'ext': f.get('ext', ''),
+                    'note': f.get('format_note', ''),
+                    'has_audio': f.get('acodec') not in (None, 'none'),
+                    'format': f,
+                }
+                key = (stream['height'], stream['fps'], stream['codec'], stream['has_audio'])
+                current = groups.get(key)
+                if current is None or self._weight(stream) < self._weight(current):
+                    groups[key] = stream
+        # 分辨率 / 帧率从高到低，同档位内按体积从小到大
+        self.video = sorted(groups.values(), key=lambda s: (-s['height'], -(s['fps'] or 0), self._weight(s)))
+        self.audio.sort(key=lambda s: -s['abr'])
+
+    @classmethod
+    def from_info(cls, info):
+        return cls(info.get('formats') or [], info.get('duration'))
+
+    @staticmethod
+    def _weight(stream):
+        # 同一视频各条流时长相同，没有文件大小时用码率比较
+        return stream['size'] or stream['tbr'] * 1e9
+
+    def choices(self):
+        # 界面下拉框用：每个 (分辨率, 帧率, 编码) 一项，已去重
+        result = []
+        for s in self.video:
+            fps = f"{s['fps']}" if s['fps'] and s['fps'] > 30 else ''
+            display = f"{s['height']}P{fps} {CODEC_LABELS.get(s['codec'], s['codec'].upper())}"
+            if s['note']:
+                display += f" - {s['note']}"
+            display += f" ({s['ext']})"
+            if s['tbr']:
+                display += f" - {s['tbr']:.0f}kbps"
+            if s['size']:
+                display += f" - {s['size'] / 1024 / 1024:.1f}MB"
+            result.append({
+                'format_id': s['format_id'], 'display': display, 'height': s['height'], 'ext': s['ext'],
+                'codec': s['codec'], 'fps': s['fps'], 'size': s['size'],
+            })
+        return result
+
+    def select_video(self, policy):
+        candidates = [s for s in self.video if policy.accepts(s)]
+        if not candidates:
+            # 没有符合上限的流时退而求其次，选最低的一档，不让任务直接失败
+            candidates = self.video[-1:]
+        if not candidates:
+            return None
+        # 画质目标 = 允许范围内最高的分辨率 + 帧率，在这一档里按编码偏好和体积 / 码率挑选
+        target = (candidates[0]['height'], candidates[0]['fps'])
+        tier = [s for s in candidates if (s['height'], s['fps']) == target]
+        if policy.prefer == 'best':
+            return min(tier, key=lambda s: (policy.codec_rank(s['codec']), -s['tbr']))
+        return min(tier, key=lambda s: (policy.codec_rank(s['codec']), self._weight(s)))
+
+    def select_audio(self, policy):
+        candidates = [a for a in self.audio if not policy.max_abr or a['abr'] <= policy.max_abr]
+        if not candidates:
+            candidates = self.audio[-1:]
+        return candidates[0] if candidates else None
+
+    def select(self, policy):
+        # 返回 (视频流, 音频流)，视频自带音频或没有独立音频时音频为 None
+        if policy.audio_only and self.audio:
+            return None, self.select_audio(policy)
+        video = self.select_video(policy)
+        if video is None or video['has_audio']:
+            return video, None
+        return video, self.select_audio(policy)
+
+    def estimated_size(self, policy):
+        video, audio = self.select(policy)
+        sizes = [s['size'] for s in (video, audio) if s is not None]
+        return sum(sizes) if sizes and all(sizes) else None
+
+
+def merge_formats(v, a):
+    # 和 yt-dlp 的 YoutubeDL._merge 相同：画面字段取自视频流，声音字段取自音频流，
+    # 否则排序、文件名模板 (%(height)s、%(vcodec)s) 和后处理拿到的都是空值
+    return {
+        'requested_formats': [v, a],
+        'format': '+'.join(f['format'] for f in (v, a) if f.get('format')),
+        'format_id': f"{v['format_id']}+{a['format_id']}",
+        'ext': v['ext'],
+        'protocol': f"{v.get('protocol')}+{a.get('protocol')}",
+        'language': a.get('language') or v.get('language'),
+        'format_note': '+'.join(f['format_note'] for f in (v, a) if f.get('format_note')) or None,
+        'filesize_approx': sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in (v, a)) or None,
+        'tbr': sum(f.get('tbr') or f.get('vbr') or f.get('abr') or 0 for f in (v, a)),
+        'width': v.get('width'),
+        'height': v.get('height'),
+        'resolution': v.get('resolution') or (f"{v['width']}x{v['height']}" if v.get('width') and v.get('height') else None),
+        'fps': v.get('fps'),
+        'dynamic_range': v.get('dynamic_range'),
+        'vcodec': v.get('vcodec'),
+        'vbr': v.get('vbr'),
+        'stretched_ratio': v.get('stretched_ratio'),
+        'aspect_ratio': v.get('aspect_ratio'),
+        'acodec': a.get('acodec'),
+        'abr': a.get('abr'),
+        'asr': a.get('asr'),
+        'audio_channels': a.get('audio_channels'),
+    }
+
+
+def policy_selector(policy):
+    # 作为 yt-dlp 的 'format' 参数 (自定义格式选择函数)，在每个视频的格式列表上执行策略
+    def select_format(ctx):
+        index = FormatIndex(ctx.get('formats') or [])
+        video, audio = index.select(policy)
+        if video is None or audio is None:
+            if video is not None or audio is not None:
+                yield (video or audio)['format']
+            return
+        yield merge_formats(video['format'], audio['format'])
+    return select_format
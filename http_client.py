@@ -0,0 +1,194 @@
+# 共享的 HTTP 连接池
+#
+# 所有模块 (封面、登录轮询、分段下载等) 都从这里拿 Session，
+# 同一主机的 TCP/TLS 连接保持 keep-alive 并在各模块之间复用，
+# 同时按主机统计请求数与新建连接数，便于观察连接复用情况。
+
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+import metrics
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://www.bilibili.com/',
+}
+
+
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def _host(self, host):
+        return self.hosts.setdefault(host, {'requests': 0, 'connections': 0})
+
+    def record_request(self, host):
+        with self.lock:
+            self._host(host)['requests'] += 1
+
+    def record_connection(self, host):
+        with self.lock:
+            self._host(host)['connections'] += 1
+
+    def snapshot(self):
+        # 每个主机：请求数、新建连接数、复用次数与复用率
+        with self.lock:
+            result = {}
+            for host, data in self.hosts.items():
+                reused = max(data['requests'] - data['connections'], 0)
+                result[host] = dict(data, reused=reused,
+                                    reuse_ratio=reused / data['requests'] if data['requests'] else 0.0)
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.hosts.clear()
+
+
+STATS = ConnectionStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        STATS.record_connection(self.host)
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        STATS.record_connection(self.host)
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).hostname or ''
+        STATS.record_request(host)
+        response = super().send(request, **kwargs)
+        # 按状态码计数 (412 / 403 说明触发了 B 站的风控)
+        metrics.HTTP_RESPONSES.inc(1, host, response.status_code)
+        return response
+
+
+class CountingRetry(Retry):
+    # urllib3 内部的自动重试 (连接失败、5xx / 429) 也计入指标
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        # 重试次数用完时上面会抛出异常，这里只统计真正发生的重试
+        host = _pool.host if _pool is not None else ''
+        reason = str(response.status) if response is not None and response.status else type(error).__name__
+        metrics.HTTP_RETRIES.inc(1, host, reason)
+        return retry
+
+
+class PooledSession(requests.Session):
+    def __init__(self, timeout=None):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        # 没有显式指定 timeout 的请求使用默认超时，避免无限等待
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+
+class HttpClient:
+    def __init__(self, pool_connections=16, pool_maxsize=64, timeout=(5, 30), retries=3, backoff_factor=0.5):
+        self.timeout = timeout
+        retry = CountingRetry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET', 'HEAD', 'OPTIONS'),
+            raise_on_status=False,
+        )
+        # 所有 Session 共用同一个 adapter，也就共用同一组连接池
+        self.adapter = PooledAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        # 分段 / 流下载用的 adapter 关闭 urllib3 的自动重试 (状态码和读取错误都直接交给调用方)，
+        # 重试、退避、熔断和切换镜像全部由 retry_policy 决定，避免两层重试叠加
+        self.download_adapter = PooledAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                              max_retries=Retry(total=0, read=False, raise_on_status=False))
+        self.session = self.create_session()
+        self.download_session = self.create_session(adapter=self.download_adapter)
+
+    def create_session(self, headers=None, adapter=None):
+        # 独立的 cookie / headers，但底层连接与其他 Session 共享
+        session = PooledSession(self.timeout)
+        session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            session.headers.update(headers)
+        session.mount('http://', adapter or self.adapter)
+        session.mount('https://', adapter or self.adapter)
+        return session
+
+
+def enable_http2():
+    # 实验性：安装了 h2 时让 urllib3 通过 ALPN 使用 HTTP/2。
+    # 这是进程级的全局开关，只对 https 生效，服务器不支持 h2 时会连接失败，默认不开启。
+    try:
+        from urllib3.http2 import inject_into_urllib3
+        inject_into_urllib3()
+        return True
+    except ImportError:
+        return False
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure(http2=False, **kwargs):
+    # 修改连接池参数 (需要在第一次使用前调用)；http2=True 时先启用 HTTP/2，之后创建的连接池才会生效
+    global _client
+    with _client_lock:
+        if http2 and not enable_http2():
+            raise RuntimeError("启用 HTTP/2 需要安装 h2 (pip install h2)")
+        _client = HttpClient(**kwargs)
+        return _client
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get_session():
+    return get_client().session
+
+
+def create_session(headers=None):
+    return get_client().create_session(headers)
+
+
+def get_download_session():
+    # 不带 urllib3 自动重试的共享 Session，供 SegmentedDownloader 使用
+    return get_client().download_session
+
+
+def create_download_session(headers=None):
+    client = get_client()
+    return client.create_session(headers, adapter=client.download_adapter)
+
+
+def connection_stats():
+    return STATS.snapshot()
@@ -0,0 +1,93 @@
+# 下载历史 (SQLite)
+#
+# 每个结束的任务 (完成 / 失败 / 取消) 记录一行：链接、标题、UP主、结果、大小、添加和结束时间、文件路径、消息。
+# 图形界面的任务列表启动时加载最近的记录，命令行和后台服务下载的任务也会记下来。
+# 和下载存档 (download_archive.py) 不同，历史只用来查看，不影响是否重新下载。
+
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import CACHE_DIR
+
+COLUMNS = ('id', 'url', 'title', 'uploader', 'state', 'bytes', 'created_at', 'finished_at', 'output', 'message')
+
+
+class JobHistory:
+    def __init__(self, path=None, max_rows=200000, clock=time.time):
+        self.path = path or os.path.join(CACHE_DIR, 'history.sqlite3')
+        self.max_rows = max_rows    # 超出后删除最早的记录
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.added = 0
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                uploader TEXT,
+                state TEXT NOT NULL,
+                bytes INTEGER,
+                created_at REAL NOT NULL,
+                finished_at REAL NOT NULL,
+                output TEXT,
+                message TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_finished ON history (finished_at)")
+        self.conn.commit()
+
+    def add(self, url, state, title=None, uploader=None, size=None, created_at=None, output=None, message=None):
+        now = self.clock()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO history (url, title, uploader, state, bytes, created_at, finished_at, output, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, title, uploader, state, size, created_at or now, now, output, message))
+            self.added += 1
+            if self.added % 1000 == 0:
+                self._prune()
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def _prune(self):
+        self.conn.execute("DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?", (self.max_rows,))
+
+    def recent(self, limit=50000):
+        # 最近的 limit 条，按时间从早到晚；返回元组 (字段顺序见 COLUMNS)，大量记录时比 dict 省内存
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM history ORDER BY finished_at DESC, id DESC LIMIT ?",
+                (limit,)).fetchall()
+        rows.reverse()
+        return rows
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM history")
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_job_history():
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = JobHistory()
+        return _history
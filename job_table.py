@@ -0,0 +1,507 @@
+# 任务列表 (model / view)
+#
+# 当前队列和下载历史显示在同一张表里，几万行也不卡：
+# - 数据放在 JobStore 中，每一列是一个紧凑的数组，而不是每个任务一个对象或一组控件；
+#   QTableView 只为可见的几十行调用 data()。
+# - 进度帧 (progress_bus.py 已按帧合并) 只更新变化的行，相邻的行合并成一次 dataChanged；
+#   变化的行很分散时合并成一个范围，视图只重绘其中可见的部分。
+# - 排序和筛选在模型内部完成：对行号数组按列排序 (sorted + 数组的 __getitem__ 作为 key)，
+#   不经过 QSortFilterProxyModel 为每次比较回调 Python。
+#   进度、速度变化不会触发重新排序 (行不会跳来跳去)；新任务按当前排序插入到对应位置，
+#   状态变化后如果影响筛选结果，稍后统一刷新一次。
+
+import time
+from array import array
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (QAbstractItemView, QApplication, QComboBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit,
+                             QMenu, QMessageBox, QPushButton, QStyle, QStyledItemDelegate, QStyleOptionProgressBar,
+                             QTableView, QVBoxLayout, QWidget)
+
+from transfer_metrics import format_speed
+
+STATES = ('queued', 'running', 'merging', 'done', 'failed', 'cancelled')
+STATE_LABELS = ('排队中', '下载中', '合并中', '已完成', '失败', '已取消')
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+FINISHED = frozenset(STATE_INDEX[state] for state in ('done', 'failed', 'cancelled'))
+
+TITLE, UPLOADER, STATE, PROGRESS, SPEED, SIZE, CREATED = range(7)
+HEADERS = ('标题', 'UP主', '状态', '进度', '速度', '大小', '添加时间')
+PROGRESS_ROLE = Qt.UserRole
+
+MAX_RANGES = 32           # 一帧中不相邻的变化超过这么多段时，合并成一个 dataChanged 范围
+REFILTER_DELAY = 500      # 状态变化后刷新筛选结果的延迟 (毫秒)
+HISTORY_ROWS = 50000      # 启动时加载的历史记录数
+
+# 状态筛选：(显示文本, 包含的状态)
+STATE_FILTERS = (
+    ('全部状态', None),
+    ('进行中', ('queued', 'running', 'merging')),
+    ('已完成', ('done',)),
+    ('失败', ('failed',)),
+    ('已取消', ('cancelled',)),
+)
+# 时间筛选：(显示文本, 天数；0 表示今天)
+DATE_FILTERS = (('全部时间', None), ('今天', 0), ('最近 7 天', 7), ('最近 30 天', 30))
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+def finished_state(success, message):
+    return 'done' if success else ('cancelled' if message.endswith('已取消') else 'failed')
+
+
+class JobStore:
+    # 按列存储：第 i 行的数据是各个数组的第 i 项
+    def __init__(self):
+        self.job_ids = array('q')      # 本次运行中的任务 ID；历史记录为 0
+        self.states = array('b')
+        self.progress = array('f')
+        self.speed = array('f')
+        self.sizes = array('q')
+        self.created = array('d')
+        self.titles = []
+        self.uploaders = []
+        self.urls = []
+        self.messages = []
+        self.rows = {}                 # 未结束的任务 ID -> 行号
+
+    def __len__(self):
+        return len(self.states)
+
+    def append(self, job_id, url, title=None, uploader=None, state='queued', progress=0.0, size=0, created=None,
+               message=''):
+        row = len(self.states)
+        self.job_ids.append(job_id or 0)
+        self.states.append(STATE_INDEX.get(state, 0))
+        self.progress.append(progress)
+        self.speed.append(0.0)
+        self.sizes.append(size or 0)
+        self.created.append(created or time.time())
+        self.titles.append(title or '')
+        self.uploaders.append(uploader or '')
+        self.urls.append(url)
+        self.messages.append(message or '')
+        if job_id and STATE_INDEX.get(state, 0) not in FINISHED:
+            self.rows[job_id] = row
+        return row
+
+    def copy_row(self, other, row):
+        return self.append(other.job_ids[row], other.urls[row], other.titles[row], other.uploaders[row],
+                           STATES[other.states[row]], other.progress[row], other.sizes[row], other.created[row],
+                           other.messages[row])
+
+
+class JobTableModel(QAbstractTableModel):
+    count_changed = pyqtSignal(int, int)     # 显示的行数, 总行数
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = JobStore()
+        self.order = array('l')         # 第 i 个显示行对应的 store 行号
+        self.positions = array('l')     # store 行号 -> 显示行号 (-1 表示被筛掉)，需要时才重建
+        self.positions_dirty = False
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        self.filter_states = None       # None 或状态编号的集合
+        self.filter_text = ''
+        self.filter_since = None
+
+        self.refilter_timer = QTimer(self)
+        self.refilter_timer.setSingleShot(True)
+        self.refilter_timer.setInterval(REFILTER_DELAY)
+        self.refilter_timer.timeout.connect(self.refresh)
+
+    # -- QAbstractTableModel ----------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        store = self.store
+        row = self.order[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == TITLE:
+                return store.titles[row] or store.urls[row]
+            if column == UPLOADER:
+                return store.uploaders[row]
+            if column == STATE:
+                return STATE_LABELS[store.states[row]]
+            if column == PROGRESS:
+                return f"{store.progress[row]:.1f}%"
+            if column == SPEED:
+                return format_speed(store.speed[row]) if store.speed[row] > 0 else ''
+            if column == SIZE:
+                return format_size(store.sizes[row]) if store.sizes[row] > 0 else ''
+            if column == CREATED:
+                return time.strftime('%Y-%m-%d %H:%M', time.localtime(store.created[row]))
+        elif role == PROGRESS_ROLE and column == PROGRESS:
+            return store.progress[row]
+        elif role == Qt.ToolTipRole:
+            return '\n'.join(text for text in (store.urls[row], store.messages[row]) if text)
+        elif role == Qt.TextAlignmentRole and column in (SPEED, SIZE):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        elif role == Qt.ForegroundRole and column == STATE and store.states[row] == STATE_INDEX['failed']:
+            return QColor('#c0392b')
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.refresh()
+
+    # -- 筛选 / 排序 --------------------------------------------------------
+
+    def set_filter(self, states=None, text='', since=None):
+        self.filter_states = {STATE_INDEX[state] for state in states} if states else None
+        self.filter_text = text.strip().lower()
+        self.filter_since = since
+        self.refresh()
+
+    def _sort_key(self):
+        store = self.store
+        return {
+            TITLE: store.titles.__getitem__, UPLOADER: store.uploaders.__getitem__,
+            STATE: store.states.__getitem__, PROGRESS: store.progress.__getitem__,
+            SPEED: store.speed.__getitem__, SIZE: store.sizes.__getitem__, CREATED: store.created.__getitem__,
+        }.get(self.sort_column)
+
+    def _accepts(self, row):
+        store = self.store
+        if self.filter_states is not None and store.states[row] not in self.filter_states:
+            return False
+        if self.filter_since is not None and store.created[row] < self.filter_since:
+            return False
+        text = self.filter_text
+        return not text or text in store.uploaders[row].lower() or text in store.titles[row].lower()
+
+    def _visible_rows(self):
+        rows = range(len(self.store))
+        if self.filter_states is not None or self.filter_since is not None or self.filter_text:
+            accepts = self._accepts
+            rows = [row for row in rows if accepts(row)]
+        key = self._sort_key()
+        if key is not None:
+            return sorted(rows, key=key, reverse=self.sort_order == Qt.DescendingOrder)
+        return rows
+
+    def _insert_position(self, row):
+        # 按当前排序二分查找插入位置 (相等时排在后面，和 sorted 的稳定排序一致)
+        key = self._sort_key()
+        if key is None:
+            return len(self.order)
+        value = key(row)
+        descending = self.sort_order == Qt.DescendingOrder
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            other = key(self.order[middle])
+            if (value > other) if descending else (value < other):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _rebuild_positions(self):
+        positions = array('l', [-1]) * len(self.store)
+        for position, row in enumerate(self.order):
+            positions[row] = position
+        self.positions = positions
+        self.positions_dirty = False
+
+    def refresh(self):
+        # 重新筛选和排序；选中的行 (持久索引) 跟着移动
+        self.refilter_timer.stop()
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        rows = [self.order[index.row()] for index in persistent]
+        self.order = array('l', self._visible_rows())
+        self._rebuild_positions()
+        self.changePersistentIndexList(persistent, [
+            self.index(self.positions[row], index.column()) if self.positions[row] >= 0 else QModelIndex()
+            for index, row in zip(persistent, rows)])
+        self.layoutChanged.emit()
+        self._emit_count()
+
+    def _schedule_refilter(self):
+        # 状态变化只在按状态筛选 / 排序时才影响显示顺序
+        if self.filter_states is not None or self.sort_column == STATE:
+            if not self.refilter_timer.isActive():
+                self.refilter_timer.start()
+
+    def _emit_count(self):
+        self.count_changed.emit(len(self.order), len(self.store))
+
+    # -- 数据更新 -----------------------------------------------------------
+
+    def load_history(self, rows):
+        # rows 为 JobHistory.recent() 返回的元组
+        self.beginResetModel()
+        for _, url, title, uploader, state, size, created, _, _, message in rows:
+            self.store.append(0, url, title, uploader, state, 100.0 if state == 'done' else 0.0, size, created,
+                              message)
+        self.order = array('l', self._visible_rows())
+        self.positions_dirty = True
+        self.endResetModel()
+        self._emit_count()
+
+    def add_job(self, job_id, url, title=None, uploader=None, created=None):
+        row = self.store.append(job_id, url, title, uploader, created=created)
+        self.positions_dirty = True
+        if self._accepts(row):
+            position = self._insert_position(row)
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.order.insert(position, row)
+            self.endInsertRows()
+        self._emit_count()
+
+    def update_job(self, job_id, title=None, uploader=None):
+        row = self.store.rows.get(job_id)
+        if row is None:
+            return
+        if title:
+            self.store.titles[row] = title
+        if uploader:
+            self.store.uploaders[row] = uploader
+        self._rows_changed([row])
+
+    def set_state(self, job_id, state):
+        row = self.store.rows.get(job_id)
+        if row is not None and self._set_state_row(row, state):
+            self._rows_changed([row])
+            self._schedule_refilter()
+
+    def _set_state_row(self, row, state):
+        index = STATE_INDEX.get(state)
+        if index is None or self.store.states[row] == index:
+            return False
+        self.store.states[row] = index
+        if index != STATE_INDEX['running']:
+            self.store.speed[row] = 0.0
+        return True
+
+    def apply_frame(self, frame):
+        # 一帧进度 {job_id: 字段}，见 progress_bus.py
+        store = self.store
+        changed = []
+        state_changed = False
+        for job_id, fields in frame.items():
+            row = store.rows.get(job_id)
+            if row is None:
+                continue
+            if 'progress' in fields:
+                store.progress[row] = fields['progress']
+            if 'speed' in fields:
+                store.speed[row] = fields['speed'] or 0.0
+            if fields.get('total'):
+                store.sizes[row] = int(fields['total'])
+            if 'phase' in fields:
+                state_changed = self._set_state_row(row, fields['phase']) or state_changed
+            changed.append(row)
+        self._rows_changed(changed)
+        if state_changed:
+            self._schedule_refilter()
+
+    def finish(self, job_id, success, message):
+        row = self.store.rows.pop(job_id, None)
+        if row is None:
+            return
+        store = self.store
+        store.states[row] = STATE_INDEX[finished_state(success, message)]
+        store.speed[row] = 0.0
+        store.messages[row] = message
+        if success:
+            store.progress[row] = 100.0
+        self._rows_changed([row])
+        self._schedule_refilter()
+
+    def clear_history(self):
+        # 删除已结束的行，保留排队中 / 运行中的任务
+        old = self.store
+        self.beginResetModel()
+        self.store = JobStore()
+        for row in range(len(old)):
+            if old.states[row] not in FINISHED:
+                self.store.copy_row(old, row)
+        self.order = array('l', self._visible_rows())
+        self.positions_dirty = True
+        self.endResetModel()
+        self._emit_count()
+
+    def _rows_changed(self, rows):
+        if not rows:
+            return
+        if self.positions_dirty:
+            self._rebuild_positions()
+        positions = self.positions
+        visible = sorted({positions[row] for row in rows if positions[row] >= 0})
+        if not visible:
+            return
+        last = len(HEADERS) - 1
+        if len(visible) > MAX_RANGES:
+            self.dataChanged.emit(self.index(visible[0], 0), self.index(visible[-1], last))
+            return
+        start = previous = visible[0]
+        for position in visible[1:]:
+            if position != previous + 1:
+                self.dataChanged.emit(self.index(start, 0), self.index(previous, last))
+                start = position
+            previous = position
+        self.dataChanged.emit(self.index(start, 0), self.index(previous, last))
+
+    def store_row(self, position):
+        return self.order[position]
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    # 进度列画成进度条 (只画可见的行，不为每行创建 QProgressBar)
+    def paint(self, painter, option, index):
+        progress = index.data(PROGRESS_ROLE)
+        if progress is None:
+            super().paint(painter, option, index)
+            return
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(4, 5, -4, -5)
+        bar.minimum = 0
+        bar.maximum = 1000
+        bar.progress = int(progress * 10)
+        bar.text = f"{progress:.1f}%"
+        bar.textVisible = True
+        bar.textAlignment = Qt.AlignCenter
+        bar.state = option.state
+        style.drawControl(QStyle.CE_ProgressBar, bar, painter, option.widget)
+
+
+class JobTableWidget(QWidget):
+    """
+    任务列表 + 筛选栏。history 为 JobHistory (启动时加载、清除历史时清空)，
+    cancel(job_id) 用于右键菜单中的 "取消任务"。
+    """
+
+    def __init__(self, history=None, cancel=None, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.cancel = cancel
+        self.model = JobTableModel(self)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        self.state_combo = QComboBox()
+        for label, states in STATE_FILTERS:
+            self.state_combo.addItem(label, states)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("按 UP主 / 标题筛选")
+        self.search_input.setClearButtonEnabled(True)
+        self.date_combo = QComboBox()
+        for label, days in DATE_FILTERS:
+            self.date_combo.addItem(label, days)
+        self.count_label = QLabel("")
+        self.count_label.setObjectName("VideoInfo")
+        self.clear_btn = QPushButton("清除历史")
+        self.clear_btn.setObjectName("SecondaryBtn")
+        self.clear_btn.clicked.connect(self.clear_history)
+
+        filter_layout.addWidget(self.state_combo)
+        filter_layout.addWidget(self.search_input)
+        filter_layout.addWidget(self.date_combo)
+        filter_layout.addWidget(self.count_label)
+        filter_layout.addStretch()
+        filter_layout.addWidget(self.clear_btn)
+        layout.addLayout(filter_layout)
+
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setItemDelegateForColumn(PROGRESS, ProgressDelegate(self.view))
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setWordWrap(False)
+        self.view.setAlternatingRowColors(True)
+        self.view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self.show_context_menu)
+        # 行高固定：视图不需要逐行计算高度 (不要用 ResizeToContents，它会遍历所有行)
+        vertical = self.view.verticalHeader()
+        vertical.setVisible(False)
+        vertical.setSectionResizeMode(QHeaderView.Fixed)
+        vertical.setDefaultSectionSize(28)
+        header = self.view.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(TITLE, QHeaderView.Stretch)
+        for column, width in ((UPLOADER, 110), (STATE, 70), (PROGRESS, 120), (SPEED, 90), (SIZE, 80),
+                              (CREATED, 140)):
+            header.resizeSection(column, width)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(CREATED, Qt.DescendingOrder)
+        layout.addWidget(self.view)
+
+        # 输入关键字时稍等再筛选，不必每个字符都过滤一遍
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.apply_filter)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.state_combo.currentIndexChanged.connect(self.apply_filter)
+        self.date_combo.currentIndexChanged.connect(self.apply_filter)
+        self.model.count_changed.connect(self.update_count)
+
+        if history is not None:
+            self.model.load_history(history.recent(HISTORY_ROWS))
+
+    def apply_filter(self):
+        days = self.date_combo.currentData()
+        since = None
+        if days is not None:
+            # 从今天 0 点往前推
+            midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+            since = midnight - days * 86400
+        self.model.set_filter(self.state_combo.currentData(), self.search_input.text(), since)
+
+    def update_count(self, shown, total):
+        self.count_label.setText(f"{shown} / {total} 个任务" if shown != total else f"{total} 个任务")
+
+    def selected_rows(self):
+        return [self.model.store_row(index.row()) for index in self.view.selectionModel().selectedRows()]
+
+    def show_context_menu(self, pos):
+        rows = self.selected_rows()
+        if not rows:
+            return
+        store = self.model.store
+        active = [store.job_ids[row] for row in rows if store.rows.get(store.job_ids[row]) == row]
+        menu = QMenu(self)
+        copy_action = menu.addAction("复制链接")
+        cancel_action = menu.addAction(f"取消任务 ({len(active)})") if active and self.cancel else None
+        action = menu.exec_(self.view.viewport().mapToGlobal(pos))
+        if action is copy_action:
+            QApplication.clipboard().setText('\n'.join(store.urls[row] for row in rows))
+        elif action is not None and action is cancel_action:
+            for job_id in active:
+                self.cancel(job_id)
+
+    def clear_history(self):
+        if QMessageBox.question(self, "清除历史", "删除所有已结束任务的记录 (不会删除下载的文件)？") != QMessageBox.Yes:
+            return
+        if self.history is not None:
+            self.history.clear()
+        self.model.clear_history()
@@ -1,13 +1,13 @@
 import sys
 import time
 import qrcode
-import requests
-import json
-import os
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QLabel, QPushButton, QMessageBox)
 from PyQt5.QtCore import QThread, pyqtSignal, Qt
 from PyQt5.QtGui import QPixmap, QImage
 
+import http_client
+from cookie_manager import get_cookie_manager
+
 class LoginThread(QThread):
     qr_signal = pyqtSignal(QPixmap, str) # 二维码图片, url
     status_signal = pyqtSignal(str)      # 状态文本
@@ -16,7 +16,8 @@ class LoginThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = True
-        self.session = requests.Session()
+        # 独立的 cookie，连接池与其他模块共享
+        self.session = http_client.create_session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com/'
@@ -64,9 +65,9 @@ class LoginThread(QThread):
                 
                 if code == 0: # 登录成功
                     self.status_signal.emit("登录成功！")
-                    # 获取 cookies
-                    cookies = self.session.cookies.get_dict()
-                    self.success_signal.emit(cookies)
+                    # 保存为 Netscape 格式的 cookies.txt (保留域名和过期时间)，refresh_token 用于到期前自动刷新
+                    get_cookie_manager().save_login(self.session.cookies, check_data['data'].get('refresh_token'))
+                    self.success_signal.emit(self.session.cookies.get_dict())
                     break
                 elif code == 86101: # 未扫码
                     pass 
@@ -125,20 +126,11 @@ class LoginDialog(QDialog):
         self.status_label.setText(text)
 
     def on_success(self, cookies):
+        # Cookies 已由 LoginThread 写入 cookies.txt 并更新共享的 Cookie 罐
         self.cookies = cookies
-        self.save_cookies_to_netscape_format(cookies)
         QMessageBox.information(self, "成功", "登录成功！")
         self.accept()
 
-    def save_cookies_to_netscape_format(self, cookies):
-        # yt-dlp 支持 Netscape 格式的 cookies.txt
-        # 这里简单处理，将 key=value 写入 cookies.txt
-        # 注意：这只是一个简化的写入，标准的 Netscape 格式更复杂
-        # 但 yt-dlp 也可以通过 --cookies-from-browser 读取，或者我们可以直接传 cookie header
-        # 为了兼容性，我们这里保存一个 json 文件方便程序读取
-        with open('cookies.json', 'w') as f:
-            json.dump(cookies, f)
-
     def closeEvent(self, event):
         self.login_thread.stop()
         super().closeEvent(event)
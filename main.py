@@ -1,22 +1,29 @@
 import sys
 import os
-import requests
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLineEdit, QPushButton, QLabel, 
-                             QProgressBar, QTextEdit, QFrame, QMessageBox, 
-                             QComboBox, QDialog)
-from PyQt5.QtCore import Qt, pyqtSlot
+                             QProgressBar, QPlainTextEdit, QFrame, QMessageBox, 
+                             QComboBox, QDialog, QSpinBox, QDoubleSpinBox, QCheckBox)
+from PyQt5.QtCore import Qt, QTimer, pyqtSlot
 from PyQt5.QtGui import QPixmap, QImage
 
 from style import MAIN_STYLE
-from download_manager import DownloadThread, VideoInfoThread
-from login_dialog import LoginDialog
+# 启动时只导入显示窗口需要的模块；yt-dlp / requests / 登录相关的模块在后台或第一次用到时才加载
+from download_manager import DanmakuExportThread, DownloadQueue, PlaylistExpandThread, VideoInfoThread
+from job_history import get_job_history
+from job_table import JobTableWidget
+from metadata_cache import get_metadata_cache
+from thumbnail_loader import ThumbnailLoader
+from transfer_metrics import format_speed
+
+# 日志区域最多保留的行数，超出后丢弃最早的行
+LOG_MAX_LINES = 1000
 
 class BilibiliDownloader(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Bilibili 视频下载器")
-        self.resize(800, 650)
+        self.resize(900, 860)
         
         # 应用样式
         self.setStyleSheet(MAIN_STYLE)
@@ -30,10 +37,47 @@ class BilibiliDownloader(QMainWindow):
         self.main_layout.setSpacing(20)
         self.main_layout.setContentsMargins(30, 30, 30, 30)
         
+        # 下载队列 (多个任务并发，超出并发数的排队等待)
+        self.download_queue = DownloadQueue(max_workers=3)
+        self.download_queue.job_added_signal.connect(self.on_job_added)
+        self.download_queue.progress_frame_signal.connect(self.update_progress)
+        self.download_queue.job_status_signal.connect(self.update_status)
+        self.download_queue.job_state_signal.connect(self.on_job_state)
+        self.download_queue.job_info_signal.connect(self.on_job_info)
+        self.download_queue.job_finished_signal.connect(self.on_finished)
+        self.download_queue.throughput_signal.connect(self.update_throughput)
+        self.download_queue.idle_signal.connect(self.on_queue_idle)
+        self.download_queue.ready_signal.connect(self.on_engine_ready)
+        self.download_queue.load_failed_signal.connect(self.on_engine_failed)
+
         self.init_ui()
         
-        self.download_thread = None
         self.info_thread = None
+        self.expand_threads = []
+        self.danmaku_thread = None
+
+        # 封面在后台线程加载并缩放，带内存 / 磁盘缓存
+        self.current_thumbnail = ''
+        self.thumbnail_loader = ThumbnailLoader(160, 90, parent=self)
+        self.thumbnail_loader.loaded_signal.connect(self.on_thumbnail_loaded)
+        self.thumbnail_loader.failed_signal.connect(self.on_thumbnail_failed)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # 窗口显示之后再在后台加载下载引擎，加载完成后检查登录状态、恢复未完成的下载 (见 on_engine_ready)
+        QTimer.singleShot(0, self.download_queue.start)
+
+    @pyqtSlot()
+    def on_engine_ready(self):
+        self.check_login_status()
+        # 恢复上次未完成的下载
+        restored = self.download_queue.restore_from_journal()
+        if restored:
+            self.log(f"已恢复 {restored} 个未完成的下载任务。")
+
+    @pyqtSlot(str)
+    def on_engine_failed(self, err):
+        self.log(f"下载引擎加载失败: {err}")
 
     def init_ui(self):
         # 1. 顶部栏 (标题 + 登录)
@@ -71,8 +115,15 @@ class BilibiliDownloader(QMainWindow):
         self.analyze_btn.setFixedWidth(120)
         self.analyze_btn.clicked.connect(self.start_analysis)
         
+        self.batch_btn = QPushButton("批量添加")
+        self.batch_btn.setObjectName("SecondaryBtn")
+        self.batch_btn.setCursor(Qt.PointingHandCursor)
+        self.batch_btn.setFixedWidth(100)
+        self.batch_btn.clicked.connect(self.show_batch_dialog)
+
         input_layout.addWidget(self.url_input)
         input_layout.addWidget(self.analyze_btn)
+        input_layout.addWidget(self.batch_btn)
         self.main_layout.addWidget(input_container)
 
         # 3. 视频信息卡片 (默认隐藏)
@@ -111,13 +162,27 @@ class BilibiliDownloader(QMainWindow):
         
         action_layout.addWidget(QLabel("选择清晰度:"))
         action_layout.addWidget(self.format_combo)
+        self.danmaku_btn = QPushButton("导出弹幕/字幕")
+        self.danmaku_btn.setCursor(Qt.PointingHandCursor)
+        self.danmaku_btn.clicked.connect(self.start_danmaku_export)
+
         action_layout.addStretch()
+        action_layout.addWidget(self.danmaku_btn)
         action_layout.addWidget(self.download_btn)
+
+        # 只要音频 / 只要一段时间：只下载需要的流和字节范围
+        mode_layout = QHBoxLayout()
+        self.audio_only_check = QCheckBox("仅音频 (m4a)")
+        self.clip_input = QLineEdit()
+        self.clip_input.setPlaceholderText("截取时间段，如 1:30-2:45 (留空下载完整视频)")
+        mode_layout.addWidget(self.audio_only_check)
+        mode_layout.addWidget(self.clip_input)
         
         text_info_layout.addWidget(self.video_title)
         text_info_layout.addWidget(self.video_uploader)
         text_info_layout.addSpacing(10)
         text_info_layout.addLayout(action_layout)
+        text_info_layout.addLayout(mode_layout)
         text_info_layout.addStretch()
         
         info_layout.addWidget(self.thumbnail_label)
@@ -132,32 +197,94 @@ class BilibiliDownloader(QMainWindow):
         self.progress_bar.setValue(0)
         self.progress_bar.setTextVisible(True)
         self.main_layout.addWidget(self.progress_bar)
+        self.progress_detail_label = QLabel("")
+        self.progress_detail_label.setObjectName("VideoInfo")
+        self.main_layout.addWidget(self.progress_detail_label)
+
+        # 并发数 & 总速度
+        queue_layout = QHBoxLayout()
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(self.download_queue.max_workers)
+        self.workers_spin.valueChanged.connect(self.download_queue.set_max_workers)
+        self.rate_spin = QDoubleSpinBox()
+        self.rate_spin.setRange(0, 1000)
+        self.rate_spin.setDecimals(1)
+        self.rate_spin.setSuffix(" MB/s")
+        self.rate_spin.setSpecialValueText("不限速")
+        self.rate_spin.valueChanged.connect(
+            lambda value: self.download_queue.set_rate_limit(value * 1024 * 1024))
+        self.throughput_label = QLabel("空闲")
+        self.throughput_label.setObjectName("VideoInfo")
 
-        # 5. 状态/日志
-        self.log_area = QTextEdit()
+        queue_layout.addWidget(QLabel("同时下载:"))
+        queue_layout.addWidget(self.workers_spin)
+        queue_layout.addSpacing(10)
+        queue_layout.addWidget(QLabel("限速:"))
+        queue_layout.addWidget(self.rate_spin)
+        queue_layout.addStretch()
+        queue_layout.addWidget(self.throughput_label)
+        self.main_layout.addLayout(queue_layout)
+
+        # 5. 任务列表 (当前队列 + 下载历史，可排序、筛选)
+        self.job_table = JobTableWidget(get_job_history(), cancel=self.download_queue.cancel)
+        self.main_layout.addWidget(self.job_table, 1)
+
+        # 6. 状态/日志
+        self.log_area = QPlainTextEdit()
         self.log_area.setReadOnly(True)
+        self.log_area.setMaximumBlockCount(LOG_MAX_LINES)
         self.log_area.setPlaceholderText("等待任务开始...")
         self.log_area.setMaximumHeight(150)
         self.main_layout.addWidget(self.log_area)
 
-        # 底部留白
-        self.main_layout.addStretch()
-
-        # 检查登录状态
-        self.check_login_status()
-
     def check_login_status(self):
-        if os.path.exists('cookies.json'): # 简单检查
+        # SESSDATA 存在且未过期才算已登录 (过期后可以重新扫码)；引擎加载完成后调用，这时 cookie_manager 已经导入
+        from cookie_manager import get_cookie_manager
+        if get_cookie_manager().is_logged_in():
              self.login_btn.setText("已登录")
              self.login_btn.setEnabled(False) # 暂时不支持登出
 
     def show_login_dialog(self):
+        from login_dialog import LoginDialog
         dialog = LoginDialog(self)
         if dialog.exec_() == QDialog.Accepted:
             self.login_btn.setText("已登录")
             self.login_btn.setEnabled(False)
             self.log("登录成功！")
 
+    def show_batch_dialog(self):
+        from batch_dialog import BatchDialog
+        dialog = BatchDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+
+        urls = dialog.urls()
+        self.log(f"开始批量解析 {len(urls)} 个链接...")
+
+        # 列表逐条展开，解析出一条就加入下载队列
+        thread = PlaylistExpandThread(urls, can_accept=self.download_queue.can_accept)
+        thread.entry_signal.connect(self.on_batch_entry)
+        thread.status_signal.connect(self.log)
+        thread.finished_signal.connect(lambda count: self.on_batch_finished(thread, count))
+        self.expand_threads.append(thread)
+        thread.start()
+
+    @pyqtSlot(dict)
+    def on_batch_entry(self, entry):
+        from download_manager import QueueFullError
+        try:
+            job = self.download_queue.submit(entry['url'])
+        except QueueFullError as e:
+            self.log(f"跳过 {entry['title']}: {e}")
+            return
+        # 展开列表时已经知道标题，下载开始前就能在任务列表里显示
+        self.job_table.model.update_job(job.job_id, title=entry['title'])
+
+    def on_batch_finished(self, thread, count):
+        self.log(f"批量解析完成，共加入 {count} 个视频。")
+        thread.finished.connect(lambda: self.expand_threads.remove(thread))
+
     def start_analysis(self):
         url = self.url_input.text().strip()
         if not url:
@@ -181,32 +308,64 @@ class BilibiliDownloader(QMainWindow):
         format_data = self.format_combo.currentData()
         
         format_id = format_data['format_id'] if format_data else None
-        
-        self.download_btn.setEnabled(False)
-        self.format_combo.setEnabled(False)
-        self.log("正在初始化下载...")
+        audio_only = self.audio_only_check.isChecked()
+
+        from download_manager import QueueFullError
+        try:
+            self.download_queue.submit(url, format_id, audio_only=audio_only,
+                                       audio_format='m4a' if audio_only else None,
+                                       clip=self.clip_input.text().strip() or None)
+        except (QueueFullError, ValueError) as e:
+            QMessageBox.warning(self, "提示", str(e))
+
+    def start_danmaku_export(self):
+        # 弹幕 (.dmk + ASS) 和 CC 字幕保存到下载目录，和视频文件同名
+        url = self.url_input.text().strip()
+        if not url:
+            return
+        self.danmaku_btn.setEnabled(False)
+        self.danmaku_thread = DanmakuExportThread(url, self.download_queue.options['save_path'])
+        self.danmaku_thread.status_signal.connect(self.log)
+        self.danmaku_thread.finished_signal.connect(self.on_danmaku_exported)
+        self.danmaku_thread.error_signal.connect(self.on_danmaku_failed)
+        self.danmaku_thread.finished.connect(lambda: self.danmaku_btn.setEnabled(True))
+        self.danmaku_thread.start()
+
+    @pyqtSlot(list)
+    def on_danmaku_exported(self, results):
+        for result in results:
+            self.log(f"弹幕导出完成: {result['title']} ({result['count']} 条，{len(result['files'])} 个文件)")
 
-        self.download_thread = DownloadThread(url, format_id)
-        self.download_thread.progress_signal.connect(self.update_progress)
-        self.download_thread.status_signal.connect(self.update_status)
-        self.download_thread.finished_signal.connect(self.on_finished)
-        self.download_thread.start()
+    @pyqtSlot(str)
+    def on_danmaku_failed(self, err):
+        self.log(f"弹幕导出失败: {err}")
 
     @pyqtSlot(dict)
     def update_info_ui(self, info):
         self.info_card.setVisible(True)
         self.video_title.setText(info['title'])
         self.video_uploader.setText(f"UP主: {info['uploader']}")
+
+        stats = get_metadata_cache().stats()
+        self.log(f"元数据缓存{'命中' if info.get('from_cache') else '未命中'} "
+                 f"(累计命中 {stats['hits']} / 未命中 {stats['misses']})")
         
         # 异步加载封面
+        self.current_thumbnail = info['thumbnail']
+        self.thumbnail_label.clear()
         if info['thumbnail']:
-            try:
-                response = requests.get(info['thumbnail'])
-                image = QImage()
-                image.loadFromData(response.content)
-                self.thumbnail_label.setPixmap(QPixmap.fromImage(image))
-            except Exception as e:
-                self.log(f"封面加载失败: {e}")
+            self.thumbnail_loader.request(info['thumbnail'])
+
+    @pyqtSlot(str, QImage)
+    def on_thumbnail_loaded(self, url, image):
+        # 只显示当前视频的封面，忽略之前的请求晚到的结果
+        if url == self.current_thumbnail:
+            self.thumbnail_label.setPixmap(QPixmap.fromImage(image))
+
+    @pyqtSlot(str, str)
+    def on_thumbnail_failed(self, url, err):
+        if url == self.current_thumbnail:
+            self.log(f"封面加载失败: {err}")
 
     @pyqtSlot(list)
     def update_formats_ui(self, formats):
@@ -230,32 +389,85 @@ class BilibiliDownloader(QMainWindow):
         QMessageBox.critical(self, "错误", f"解析失败: {err}")
         self.log(f"解析失败: {err}")
 
-    @pyqtSlot(float)
-    def update_progress(self, val):
-        self.progress_bar.setValue(int(val))
+    @pyqtSlot(int)
+    def on_job_added(self, job_id):
+        job = self.download_queue.jobs[job_id]
+        self.job_table.model.add_job(job_id, job.url, job.title, job.uploader, job.created_at)
+        self.log(f"[#{job_id}] 已加入下载队列: {job.url}")
 
-    @pyqtSlot(str)
-    def update_status(self, text):
-        self.log(text)
+    @pyqtSlot(int, str)
+    def on_job_state(self, job_id, state):
+        self.job_table.model.set_state(job_id, state)
 
-    @pyqtSlot(bool, str)
-    def on_finished(self, success, msg):
-        self.download_btn.setEnabled(True)
-        self.format_combo.setEnabled(True)
-        
+    @pyqtSlot(int, dict)
+    def on_job_info(self, job_id, summary):
+        self.job_table.model.update_job(job_id, summary.get('title'), summary.get('uploader'))
+
+    @pyqtSlot(object)
+    def update_progress(self, frame):
+        # 每帧调用一次 (已合并)：进度条显示本批次整体进度，下方显示本帧各任务的详情，任务列表只刷新变化的行
+        self.progress_bar.setValue(int(self.download_queue.overall_progress()))
+        self.job_table.model.apply_frame(frame)
+        details = []
+        for job_id, fields in sorted(frame.items())[:4]:
+            if fields.get('phase') in ('done', 'failed'):
+                continue
+            text = f"#{job_id} {fields.get('progress', 0):.1f}%"
+            if fields.get('speed'):
+                text += f" {format_speed(fields['speed'])}"
+            if fields.get('eta') is not None:
+                text += f" 剩余 {int(fields['eta'])}s"
+            if fields.get('retries'):
+                text += f" 重试 {fields['retries']} 次"
+            if fields.get('phase') == 'merging':
+                text += " 合并中"
+            details.append(text)
+        if details:
+            self.progress_detail_label.setText(" | ".join(details))
+
+    @pyqtSlot(int, str)
+    def update_status(self, job_id, text):
+        self.log(f"[#{job_id}] {text}")
+
+    @pyqtSlot(float, int, int)
+    def update_throughput(self, speed, running, pending):
+        self.throughput_label.setText(
+            f"总速度: {format_speed(speed)} | 下载中: {running} | 排队: {pending}")
+
+    @pyqtSlot(int, bool, str)
+    def on_finished(self, job_id, success, msg):
+        # 批量下载时不再逐个弹窗，结果记录在日志和任务列表中 (失败信息已包含 FFmpeg 相关的友好提示)
+        self.job_table.model.finish(job_id, success, msg)
         if success:
-            QMessageBox.information(self, "完成", msg)
-            self.log(f"任务结束: {msg}")
+            self.log(f"[#{job_id}] 任务结束: {msg}")
         else:
-            # 这里的 msg 已经包含了 FFmpeg 相关的友好提示
-            QMessageBox.critical(self, "错误", msg)
-            self.log(f"任务失败: {msg}")
+            self.log(f"[#{job_id}] 任务失败: {msg}")
+        self.progress_bar.setValue(int(self.download_queue.overall_progress()))
+
+    @pyqtSlot()
+    def on_queue_idle(self):
+        self.progress_bar.setValue(100)
+        self.progress_detail_label.setText("")
+        self.throughput_label.setText("空闲")
+        self.log("队列中的任务已全部处理完毕。")
+
+        import http_client
+        stats = http_client.connection_stats()
+        if stats:
+            summary = ", ".join(f"{host} {data['reused']}/{data['requests']}" for host, data in stats.items())
+            self.log(f"连接复用 (复用/请求): {summary}")
+
+    def closeEvent(self, event):
+        for thread in self.expand_threads:
+            thread.stop()
+        if self.danmaku_thread is not None:
+            self.danmaku_thread.stop()
+        self.download_queue.stop_all()
+        super().closeEvent(event)
 
     def log(self, text):
-        self.log_area.append(text)
-        cursor = self.log_area.textCursor()
-        cursor.movePosition(cursor.End)
-        self.log_area.setTextCursor(cursor)
+        # QPlainTextEdit 按行存储，超过 LOG_MAX_LINES 自动丢弃最早的行；停在底部时自动滚动
+        self.log_area.appendPlainText(text)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
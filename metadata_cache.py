@@ -0,0 +1,200 @@
+# 视频元数据磁盘缓存 (SQLite)
+#
+# 以规范化后的 BV 号 + 分P 作为键保存 yt-dlp 的 info dict，
+# 再次解析或下载同一视频时直接复用，不再请求网络。
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+CACHE_DIR = 'cache'
+
+BV_RE = re.compile(r'BV([0-9A-Za-z]{10})', re.IGNORECASE)
+AV_RE = re.compile(r'\bav(\d+)', re.IGNORECASE)
+PART_ID_RE = re.compile(r'_p(\d+)$')
+
+# av 号 -> BV 号 (B 站公开的转换算法)
+_XOR_CODE = 23442827791579
+_MAX_AID = 1 << 51
+_BASE = 58
+_ALPHABET = 'FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf'
+
+
+def av_to_bv(aid):
+    chars = list('BV1000000000')
+    index = len(chars) - 1
+    tmp = (_MAX_AID | int(aid)) ^ _XOR_CODE
+    while tmp > 0:
+        chars[index] = _ALPHABET[tmp % _BASE]
+        tmp //= _BASE
+        index -= 1
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return ''.join(chars)
+
+
+def normalize_video_key(url):
+    # 返回 'BVxxxxxxxxxx' 或 'BVxxxxxxxxxx_p2'，无法识别时返回 None (如 b23.tv 短链)
+    if not url:
+        return None
+    parsed = urlparse(url)
+    target = parsed.path if parsed.scheme else url
+
+    match = BV_RE.search(target)
+    if match:
+        bvid = 'BV' + match.group(1)
+    else:
+        match = AV_RE.search(target)
+        if not match:
+            return None
+        bvid = av_to_bv(match.group(1))
+
+    page = None
+    part = PART_ID_RE.search(target)
+    if part:
+        page = part.group(1)
+    else:
+        p = parse_qs(parsed.query).get('p')
+        if p and p[-1].isdigit():
+            page = p[-1]
+
+    # 与 yt-dlp 的 id 规则保持一致：未指定分P时为 BV 号本身 (可能是整个分P列表)
+    return f"{bvid}_p{int(page)}" if page else bvid
+
+
+def stream_deadline(info):
+    # B 站的视频流地址带有 deadline 参数，过期后地址失效，缓存不能比它活得更久
+    deadlines = []
+    for f in info.get('formats') or []:
+        query = parse_qs(urlparse(f.get('url') or '').query)
+        value = (query.get('deadline') or [''])[0]
+        if value.isdigit():
+            deadlines.append(int(value))
+    return min(deadlines) if deadlines else None
+
+
+class MetadataCache:
+    def __init__(self, path=None, ttl=1800, max_bytes=64 * 1024 * 1024, clock=time.time):
+        self.path = path or os.path.join(CACHE_DIR, 'metadata.sqlite3')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_accessed ON metadata (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = self.clock()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, expires_at FROM metadata WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self.conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE metadata SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, info):
+        # 只缓存单个视频，分P列表 / 合集等 playlist 结果不缓存
+        if key is None or not info or info.get('_type', 'video') != 'video':
+            return
+        now = self.clock()
+        expires_at = now + self.ttl
+        deadline = stream_deadline(info)
+        if deadline:
+            expires_at = min(expires_at, deadline - 60)
+        if expires_at <= now:
+            return
+
+        data = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, data, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), expires_at, now))
+            self._evict(now)
+            self.conn.commit()
+
+    def get_for_url(self, url):
+        return self.get(normalize_video_key(url))
+
+    def put_for_url(self, url, info):
+        self.put(normalize_video_key(url), info)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def invalidate_url(self, url):
+        key = normalize_video_key(url)
+        if key is not None:
+            self.invalidate(key)
+
+    def _evict(self, now):
+        # 先清理过期条目，再按最近访问时间淘汰直到总大小低于上限
+        self.conn.execute("DELETE FROM metadata WHERE expires_at <= ?", (now,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM metadata ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM metadata").fetchone()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache()
+        return _cache
@@ -0,0 +1,339 @@
+# 运行指标 (Prometheus 文本格式)
+#
+# 计数器 / 仪表 / 直方图都只依赖标准库，线程安全。
+# 通过 HTTP 接口 (api_server 的 /metrics，或 start_metrics_server 单独开的端口) 暴露，
+# 命令行模式下也可以定期写到文件 (node_exporter 的 textfile collector 可以直接读取)。
+
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        return tuple(str(value) for value in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return lines
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def labels(self, *labels):
+        return BoundMetric(self, labels)
+
+    def get(self, *labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.function = None
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, *labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_function(self, function):
+        # 抓取时才计算 (如队列长度)，不需要在每次变化时更新
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                return [f"{self.name} {format_value(self.function())}"]
+            except Exception:
+                return []
+        return super()._samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def labels(self, *labels):
+        return BoundMetric(self, labels)
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def _samples(self):
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        lines = []
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = format_labels(self.labelnames, key, [('le', format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {count}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class BoundMetric:
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def inc(self, amount=1):
+        self.metric.inc(amount, *self.labels)
+
+    def observe(self, value):
+        self.metric.observe(value, *self.labels)
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.monotonic() - self.started, *self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        # 先写临时文件再替换，读取方不会读到写了一半的内容
+        temp_path = path + '.tmp'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+REGISTRY = Registry()
+
+EXTRACTION_SECONDS = REGISTRY.register(Histogram(
+    'bili_extraction_seconds', '解析视频信息耗时 (秒)', ['source']))
+EXTRACTION_ERRORS = REGISTRY.register(Counter(
+    'bili_extraction_errors_total', '解析失败次数，按 HTTP 状态码 (412/403 通常是风控)', ['status']))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    'bili_downloaded_bytes_total', '下载的字节数，按主机', ['host']))
+HTTP_RESPONSES = REGISTRY.register(Counter(
+    'bili_http_responses_total', 'HTTP 响应数，按主机和状态码', ['host', 'status']))
+HTTP_RETRIES = REGISTRY.register(Counter(
+    'bili_http_retries_total', '重试次数，按主机和原因', ['host', 'reason']))
+MERGE_SECONDS = REGISTRY.register(Histogram(
+    'bili_merge_seconds', '音视频合并耗时 (秒)'))
+JOB_SECONDS = REGISTRY.register(Histogram(
+    'bili_job_seconds', '任务从开始到结束的耗时 (秒)', ['result'],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)))
+JOBS = REGISTRY.register(Counter(
+    'bili_jobs_total', '结束的任务数', ['result']))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'bili_queue_depth', '排队中的任务数'))
+WORKERS_BUSY = REGISTRY.register(Gauge(
+    'bili_workers_busy', '正在下载的任务数 (占用下载槽位)'))
+WORKERS_MAX = REGISTRY.register(Gauge(
+    'bili_workers_max', '下载槽位数'))
+MERGES_RUNNING = REGISTRY.register(Gauge(
+    'bili_merges_running', '正在合并的任务数'))
+ARCHIVE_SKIPS = REGISTRY.register(Counter(
+    'bili_archive_skips_total', '存档中已有、直接跳过的任务数'))
+CIRCUIT_OPENED = REGISTRY.register(Counter(
+    'bili_circuit_opened_total', '熔断次数 (某主机连续失败后暂停访问)', ['host']))
+STREAM_REEXTRACTIONS = REGISTRY.register(Counter(
+    'bili_stream_reextractions_total', '视频流地址过期后重新解析的次数', ['reason']))
+LOG_MESSAGES = REGISTRY.register(Counter(
+    'bili_ytdlp_messages_total', 'yt-dlp 输出的警告 / 错误条数', ['level']))
+
+
+def host_of(url):
+    return urlparse(url or '').hostname or ''
+
+
+def http_status_of(error):
+    # 从 yt-dlp 的异常链里找出 HTTP 状态码 (DownloadError -> ExtractorError -> HTTPError)
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for attr in ('status', 'code'):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                return value
+        response = getattr(error, 'response', None)
+        for attr in ('status', 'status_code'):
+            if isinstance(getattr(response, attr, None), int):
+                return getattr(response, attr)
+        exc_info = getattr(error, 'exc_info', None)
+        error = (getattr(error, 'cause', None) or error.__cause__
+                 or (exc_info[1] if exc_info and len(exc_info) > 1 else None))
+    return None
+
+
+def record_extraction_error(error):
+    status = http_status_of(error)
+    EXTRACTION_ERRORS.inc(1, status if status is not None else 'none')
+
+
+class YtdlpLogger:
+    # 交给 yt-dlp 的 logger：输出转到 logging 模块 (默认不显示 debug)，警告 / 错误计数，
+    # error 另外交给 callback (例如显示在界面的状态栏)
+    def __init__(self, callback=None, name='bilibili.yt_dlp'):
+        self.callback = callback
+        self.logger = logging.getLogger(name)
+
+    def debug(self, msg):
+        if msg.startswith('[debug] '):
+            self.logger.debug(msg)
+        else:
+            self.logger.info(msg)
+
+    def info(self, msg):
+        self.logger.info(msg)
+
+    def warning(self, msg):
+        LOG_MESSAGES.inc(1, 'warning')
+        self.logger.warning(msg)
+
+    def error(self, msg):
+        LOG_MESSAGES.inc(1, 'error')
+        self.logger.error(msg)
+        if self.callback is not None:
+            self.callback(f"Error: {msg}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=9108, host='127.0.0.1'):
+    # 单独的 /metrics 端口 (图形界面 / 不开 HTTP 控制接口时使用)，在后台线程运行
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+class MetricsFileWriter:
+    # 命令行模式：每隔 interval 秒把指标写到文件，停止时再写一次
+    def __init__(self, path, interval=15.0, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-file', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.registry.dump(self.path)
+        except OSError as e:
+            logging.getLogger('bilibili').warning("写入指标文件失败: %s", e)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+        self._write()
@@ -0,0 +1,125 @@
+# 后处理 (音视频合并) 进程池
+#
+# 网络下载线程只负责把各个流下载到本地，合并交给独立的进程池完成，
+# 下载槽位可以立即开始下一个任务。合并 / 转封装一律使用流复制 (-c copy)，不重新编码。
+# 合并的临时输出写在输入文件所在的临时目录，完成后由 disk_io.finalize 移入保存目录。
+# 注意：本模块会在子进程中被导入，只能依赖标准库 (及同样只用标准库的 disk_io / download_archive)。
+
+import multiprocessing
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import disk_io
+
+# mp4 容器可以直接容纳 (流复制) 的编码，其余组合改用 mkv
+MP4_VIDEO_CODECS = ('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'hevc', 'h265', 'av01', 'av1')
+MP4_AUDIO_CODECS = ('mp4a', 'aac', 'ec-3', 'eac3', 'ac-3', 'ac3', 'mp3')
+
+
+def codec_family(codec):
+    return (codec or '').lower().split('.')[0]
+
+
+def choose_container(vcodec, acodec, preferred_ext='mp4'):
+    # 返回能以流复制方式合并这两个编码的容器扩展名
+    video = codec_family(vcodec)
+    audio = codec_family(acodec)
+    video_ok = not video or video == 'none' or video in MP4_VIDEO_CODECS
+    audio_ok = not audio or audio == 'none' or audio in MP4_AUDIO_CODECS
+    if preferred_ext in ('mp4', 'm4a', 'mov') and not (video_ok and audio_ok):
+        return 'mkv'
+    return preferred_ext
+
+
+# 仅音频下载可选的封装格式
+AUDIO_FORMATS = ('m4a', 'opus', 'flac', 'mka')
+
+
+def choose_audio_container(acodec, preferred='m4a'):
+    # 只转封装不转码：目标格式装不下这个编码时 (如 AAC 要求存为 opus) 改用编码本身对应的格式
+    audio = codec_family(acodec)
+    compatible = {
+        'm4a': audio in MP4_AUDIO_CODECS,
+        'opus': audio == 'opus',
+        'flac': audio == 'flac',
+        'mka': True,
+    }
+    if compatible.get(preferred):
+        return preferred
+    if audio in MP4_AUDIO_CODECS:
+        return 'm4a'
+    if audio in ('opus', 'flac'):
+        return audio
+    return 'mka'
+
+
+def build_merge_command(ffmpeg, inputs, output, vcodec=None, time_offset=None):
+    cmd = [ffmpeg, '-y', '-nostdin', '-loglevel', 'error']
+    for path in inputs:
+        if time_offset:
+            # 截取的片段时间戳从片段在原视频中的位置开始，整体平移到 0 (各路流平移相同的量，保持同步)
+            cmd += ['-itsoffset', f"{-time_offset:.3f}"]
+        cmd += ['-i', path]
+    for index in range(len(inputs)):
+        cmd += ['-map', str(index)]
+    cmd += ['-c', 'copy']
+    if output.endswith('.mp4') and codec_family(vcodec) in ('hev1', 'hevc', 'h265'):
+        # HEVC 用 hvc1 标签，兼容 Apple 系播放器 (仍是流复制)
+        cmd += ['-tag:v', 'hvc1']
+    return cmd
+
+
+def merge_streams(inputs, output, ffmpeg='ffmpeg', vcodec=None, time_offset=None):
+    # 在子进程中执行：合并并返回耗时与吞吐量统计
+    started = time.monotonic()
+    root, ext = os.path.splitext(os.path.basename(output))
+    temp_output = os.path.join(os.path.dirname(inputs[0]), f"{root}.temp{ext}")
+    cmd = build_merge_command(ffmpeg, inputs, output, vcodec, time_offset) + [temp_output]
+    result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+    if result.returncode != 0:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        raise RuntimeError(f"ffmpeg 合并失败: {result.stderr.strip()[-500:]}")
+    # 顺便在子进程里算好哈希 (跨文件系统时边复制边算)，供下载存档校验使用
+    sha256 = disk_io.finalize(temp_output, output)
+
+    seconds = max(time.monotonic() - started, 1e-6)
+    input_bytes = sum(os.path.getsize(path) for path in inputs)
+    return {
+        'output': output,
+        'seconds': seconds,
+        'bytes': input_bytes,
+        'bytes_per_sec': input_bytes / seconds,
+        'sha256': sha256,
+    }
+
+
+class PostProcessPool:
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.executor = None
+
+    def submit_merge(self, inputs, output, ffmpeg, vcodec=None, callback=None, time_offset=None):
+        # callback(result, error) 在进程池的回调线程中调用
+        if self.executor is None:
+            # 用 spawn 而不是 fork：主进程里有 Qt 和多个下载线程，fork 出的子进程状态不可靠
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        future = self.executor.submit(merge_streams, list(inputs), output, ffmpeg, vcodec, time_offset)
+        if callback is not None:
+            def on_done(f):
+                # 只捕获合并本身的异常；回调自己出错时不能再当作合并失败回调一次
+                try:
+                    result, error = f.result(), None
+                except Exception as e:
+                    result, error = None, e
+                callback(result, error)
+            future.add_done_callback(on_done)
+        return future
+
+    def shutdown(self, wait=False):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
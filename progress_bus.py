@@ -0,0 +1,85 @@
+# 进度事件总线
+#
+# 下载线程每收到一块数据都可能报告一次进度 (每秒几十次)，直接转发会淹没界面的事件循环。
+# 这里按任务合并：只保留每个任务最新的一组字段，固定频率 (默认每秒 10 帧) 统一发出一帧，
+# 一帧里包含这段时间内有变化的所有任务。字段是结构化的数值，由界面 / 命令行自行格式化。
+#
+# 常用字段: progress (百分比), downloaded, total (字节), speed (B/s), eta (秒), phase (阶段)
+
+import threading
+import time
+
+
+class ProgressBus:
+    def __init__(self, interval=0.1, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.deliver_lock = threading.Lock()   # 保证各帧按顺序送达，不会有旧帧晚于新帧
+        self.latest = {}     # job_id -> 最新字段
+        self.dirty = set()   # 上一帧之后有变化的任务
+        self.handlers = []
+        self.frames = 0
+        self.updates = 0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def subscribe(self, handler):
+        # handler(frame)，frame 为 {job_id: 字段}，在总线线程中调用
+        self.handlers.append(handler)
+        return handler
+
+    def publish(self, job_id, **fields):
+        with self.lock:
+            self.latest.setdefault(job_id, {}).update(fields)
+            self.dirty.add(job_id)
+            self.updates += 1
+        self._ensure_thread()
+
+    def snapshot(self, job_id):
+        with self.lock:
+            return dict(self.latest.get(job_id, {}))
+
+    def discard(self, job_id):
+        # 任务结束后调用：先把未发出的更新发出去，再清除记录
+        self.flush()
+        with self.lock:
+            self.latest.pop(job_id, None)
+
+    def flush(self):
+        with self.deliver_lock:
+            with self.lock:
+                if not self.dirty:
+                    return None
+                frame = {job_id: dict(self.latest[job_id]) for job_id in self.dirty if job_id in self.latest}
+                self.dirty.clear()
+                self.frames += 1
+            for handler in list(self.handlers):
+                handler(frame)
+            return frame
+
+    def stats(self):
+        # 收到的更新数 / 实际发出的帧数，可以看出合并掉了多少次刷新
+        return {'updates': self.updates, 'frames': self.frames}
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self.lock:
+                if self._thread is None:
+                    self._stopped.clear()
+                    self._thread = threading.Thread(target=self._run, name='progress-bus', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        next_frame = self.clock() + self.interval
+        while not self._stopped.wait(max(next_frame - self.clock(), 0)):
+            next_frame += self.interval
+            self.flush()
+
+    def stop(self):
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(1.0)
+        self._thread = None
+        self.flush()
@@ -0,0 +1,191 @@
+# 重试 / 退避 / 熔断策略
+#
+# 下载出错时按错误类型分别处理，而不是直接让任务失败：
+#   throttled  412 / 429，被 B 站风控限流：长时间退避，并计入该主机的熔断器
+#   expired    403 / 404 / 410，带签名的视频流地址过期或被拒：换备用 CDN，全部失败后重新解析
+#   transient  超时、连接重置、5xx、数据不完整：短时间退避后重试
+#   fatal      其他错误 (如磁盘写入失败、视频不存在)：不重试
+#
+# 退避使用 "full jitter" (0 到上限之间的随机值)，避免多个连接在同一时刻一起重试。
+# 熔断器按主机统计连续失败，超过阈值后暂停访问该主机一段时间，再放一个请求试探是否恢复。
+# 时钟、sleep 和随机数都可以替换，便于配合本地的故障注入服务器测试。
+
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+import requests
+from yt_dlp.networking.exceptions import TransportError
+
+import metrics
+
+THROTTLE_STATUSES = (412, 429)
+EXPIRED_STATUSES = (403, 404, 410)
+# 可以重试的网络层错误 (超时、连接重置、读取中断)
+TRANSIENT_ERRORS = (requests.RequestException, TransportError, ConnectionError, TimeoutError)
+
+# B 站 upos CDN 的几个镜像节点：同一路径和签名在这些主机上通用
+MIRROR_HOSTS = (
+    'upos-sz-mirrorcos.bilivideo.com',
+    'upos-sz-mirrorali.bilivideo.com',
+    'upos-sz-mirrorhw.bilivideo.com',
+)
+MIRROR_HOST_RE = re.compile(r'^(upos-[\w-]+\.bilivideo\.com|[\w-]+\.mcdn\.bilivideo\.cn|[\w-]+\.szbdyd\.com)$')
+
+
+def classify(error):
+    status = metrics.http_status_of(error)
+    if status in THROTTLE_STATUSES:
+        return 'throttled'
+    if status in EXPIRED_STATUSES:
+        return 'expired'
+    if status is not None:
+        return 'transient' if status >= 500 or status == 408 else 'fatal'
+    # 沿异常链找网络层错误；yt-dlp 把它们包在 DownloadError / ExtractorError 里
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, TRANSIENT_ERRORS):
+            return 'transient'
+        exc_info = getattr(error, 'exc_info', None)
+        error = (getattr(error, 'cause', None) or error.__cause__ or error.__context__
+                 or (exc_info[1] if exc_info and len(exc_info) > 1 else None))
+    return 'fatal'
+
+
+def mirror_urls(url, backups=()):
+    # 原地址在前，其次是接口返回的备用地址，最后是换成镜像主机的地址 (只对 B 站 CDN 生效)
+    urls = [url] + [backup for backup in backups or () if backup]
+    parsed = urlparse(url)
+    if MIRROR_HOST_RE.match(parsed.hostname or ''):
+        for host in MIRROR_HOSTS:
+            urls.append(urlunparse(parsed._replace(netloc=host)))
+    result = []
+    for candidate in urls:
+        if candidate not in result:
+            result.append(candidate)
+    return result
+
+
+class Backoff:
+    def __init__(self, base=0.5, cap=8.0, rng=random.random):
+        self.base = base
+        self.cap = cap
+        self.rng = rng
+
+    def delay(self, attempt):
+        # attempt 从 1 开始
+        return self.rng() * min(self.cap, self.base * 2 ** (attempt - 1))
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=6, transient=None, throttled=None, max_reextract=2):
+        self.max_attempts = max_attempts
+        self.backoffs = {
+            'transient': transient or Backoff(0.5, 8.0),
+            'throttled': throttled or Backoff(5.0, 60.0),
+            'expired': Backoff(0.2, 1.0),
+        }
+        self.max_reextract = max_reextract   # 视频流地址过期后重新解析的次数
+
+    def should_retry(self, kind, attempt):
+        return kind != 'fatal' and attempt < self.max_attempts
+
+    def delay(self, kind, attempt):
+        backoff = self.backoffs.get(kind)
+        return backoff.delay(attempt) if backoff is not None else 0.0
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def wait_time(self):
+        # 还需要等待多久才能访问该主机；0 表示可以访问 (半开状态下只放行一个试探请求)
+        with self.lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if self.state == CircuitBreaker.OPEN and remaining > 0:
+                return remaining
+            if self.trial_running:
+                return min(1.0, self.reset_timeout)
+            self.state = CircuitBreaker.HALF_OPEN
+            self.trial_running = True
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def release(self):
+        # 试探请求没有得出结论 (被取消、地址失效)，放行下一个试探请求
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CircuitBreaker.OPEN:
+                    metrics.CIRCUIT_OPENED.inc(1, self.host)
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = self.clock()
+                self.trial_running = False
+
+    def snapshot(self):
+        with self.lock:
+            return {'host': self.host, 'state': self.state, 'failures': self.failures}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def breaker_states():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+
+_policy = RetryPolicy()
+
+
+def get_retry_policy():
+    return _policy
+
+
+def wait(seconds, cancel_check=None, sleep=time.sleep, step=0.2):
+    # 分段等待，期间可以取消；返回 False 表示被取消
+    deadline = time.monotonic() + seconds
+    while True:
+        if cancel_check is not None and cancel_check():
+            return False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        sleep(min(step, remaining))
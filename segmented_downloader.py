@@ -0,0 +1,432 @@
+# 多连接分段下载引擎
+#
+# 把一个 (或多个) HTTP 流按字节范围切分，由固定数量的连接并行拉取并写入预分配的文件。
+# 多个流 (DASH 视频 + 音频) 共用同一组连接，因此会同时下载而不是先后下载。
+# 分段边界按 disk_io.ALIGN 对齐，每个连接的数据攒成大块后再写盘 (见 disk_io.RangeWriter)。
+
+import os
+import threading
+import time
+
+import disk_io
+import http_client
+import metrics
+import retry_policy
+
+KB = 1024
+MB = 1024 * 1024
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class SegmentError(Exception):
+    pass
+
+
+class StreamExpired(SegmentError):
+    # 视频流地址 (及所有备用地址) 都已失效，需要重新解析视频拿新的签名地址
+    pass
+
+
+def retry_reason(error):
+    # 重试原因：HTTP 状态码，或异常类型 (超时、连接重置等)
+    status = metrics.http_status_of(error)
+    return str(status) if status is not None else type(error).__name__
+
+
+class StreamTask:
+    def __init__(self, url, path, headers=None, size=None, completed=None, format_id=None, byte_range=None,
+                 backups=None):
+        self.url = url
+        # 当前地址失效 (403 / 404 / 410) 或所在主机被熔断时，依次换用备用地址和 CDN 镜像
+        self.urls = retry_policy.mirror_urls(url, backups)
+        self.url_index = 0
+        # 只下载远端文件中的一段 (首字节, 末字节)，本地文件从 0 开始写 (截取片段时使用)
+        self.byte_range = byte_range
+        self.offset = byte_range[0] if byte_range else 0
+        self.host = metrics.host_of(url)
+        self.path = path
+        self.part_path = path + '.part'
+        self.headers = dict(headers or {})
+        self.size = size
+        self.format_id = format_id
+        self.completed = [list(r) for r in completed or []]  # 上次已完成的字节范围 (断点续传)
+        self.gaps = []         # 尚未分配给连接的字节范围
+        self.accept_ranges = True
+        self.downloaded = 0
+        self.assigned = False  # 不支持 Range 的流只能整体分配一次
+
+    @property
+    def remaining(self):
+        if self.size is None or not self.accept_ranges:
+            return 0 if self.assigned else 1
+        return sum(end - start + 1 for start, end in self.gaps)
+
+    def switch_url(self, failed_url):
+        # 调用方持有下载器的锁；其他连接已经换过地址时直接沿用新地址
+        if self.url != failed_url:
+            return True
+        if self.url_index + 1 >= len(self.urls):
+            return False
+        self.url_index += 1
+        self.url = self.urls[self.url_index]
+        self.host = metrics.host_of(self.url)
+        return True
+
+    def compute_gaps(self):
+        gaps = []
+        position = 0
+        for start, end in sorted(self.completed):
+            if start > position:
+                gaps.append([position, start - 1])
+            position = max(position, end + 1)
+        if position < self.size:
+            gaps.append([position, self.size - 1])
+        self.gaps = gaps
+        self.downloaded = self.size - self.remaining
+
+
+class SegmentedDownloader:
+    def __init__(self, session=None, connections=4, min_segment_size=1 * MB, max_segment_size=32 * MB,
+                 initial_segment_size=4 * MB, target_segment_seconds=3.0, retries=5,
+                 chunk_size=256 * KB, write_size=disk_io.WRITE_SIZE, timeout=20, progress_callback=None, cancel_check=None,
+                 prepared_callback=None, segment_callback=None, throttle=None, policy=None, retry_callback=None):
+        self.connections = max(1, int(connections))
+        self.min_segment_size = min_segment_size
+        self.max_segment_size = max_segment_size
+        self.segment_size = initial_segment_size
+        self.target_segment_seconds = target_segment_seconds
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.write_size = write_size    # 每个连接攒够这么多数据再写盘
+        self.timeout = timeout
+        self.progress_callback = progress_callback
+        self.cancel_check = cancel_check
+        # 断点续传用：流准备完成 / 每段下载完成时通知调用方 (如写入下载日志)
+        self.prepared_callback = prepared_callback
+        self.segment_callback = segment_callback
+        # 限速：每读到一块数据调用 throttle(nbytes)，由带宽调度器决定是否需要等待
+        self.throttle = throttle
+        # 重试：退避时长由重试策略决定，每次重试 / 换地址通知 retry_callback({'host', 'reason', 'attempt', 'delay', ...})
+        self.policy = policy or retry_policy.get_retry_policy()
+        self.retry_callback = retry_callback
+
+        # 默认使用全局共享的连接池，多个任务访问同一 CDN 时复用连接；
+        # 这个 Session 关闭了 urllib3 的自动重试，所有重试都经过 _with_retry
+        self.session = session or http_client.get_download_session()
+
+        self.lock = threading.Lock()
+        self.tasks = []
+        self._error = None
+        self._speed_samples = []
+        self._last_report = 0.0
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def download(self, url, path, headers=None, size=None):
+        return self.download_all([StreamTask(url, path, headers, size)])[0]
+
+    def download_all(self, tasks):
+        self.tasks = list(tasks)
+        self._error = None
+        for task in self.tasks:
+            self._prepare(task)
+
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.connections)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if self._error is not None:
+            raise self._error
+
+        for task in self.tasks:
+            os.replace(task.part_path, task.path)
+        self._report(force=True)
+        return [task.path for task in self.tasks]
+
+    def total_size(self):
+        return sum(task.size or 0 for task in self.tasks)
+
+    def total_downloaded(self):
+        return sum(task.downloaded for task in self.tasks)
+
+    # ------------------------------------------------------------------
+    # 准备阶段：探测大小与 Range 支持，预分配文件
+    # ------------------------------------------------------------------
+
+    def _prepare(self, task):
+        size, accept_ranges = self._with_retry(task, lambda url: self.probe(url, task.headers), "探测")
+        if task.byte_range is not None:
+            if not accept_ranges:
+                raise SegmentError("服务器不支持 Range，无法只下载片段")
+            size = task.byte_range[1] - task.byte_range[0] + 1
+        resumable = (
+            task.completed and accept_ranges and size is not None and size == task.size
+            and os.path.exists(task.part_path) and os.path.getsize(task.part_path) == size
+        )
+        if not resumable:
+            # 文件大小变了或 .part 丢失，旧的进度作废
+            task.completed = []
+        if size is not None:
+            task.size = size
+        task.accept_ranges = accept_ranges and task.size is not None
+
+        if os.path.dirname(task.part_path):
+            os.makedirs(os.path.dirname(task.part_path), exist_ok=True)
+        if not resumable:
+            with open(task.part_path, 'wb') as f:
+                if task.size and task.accept_ranges:
+                    disk_io.preallocate(f, task.size)
+        if task.accept_ranges:
+            task.compute_gaps()
+
+        if self.prepared_callback is not None:
+            self.prepared_callback(task)
+
+    def probe(self, url, headers=None):
+        # 用 Range: bytes=0-0 代替 HEAD，部分 CDN 不允许 HEAD 请求
+        probe_headers = dict(headers or {})
+        probe_headers['Range'] = 'bytes=0-0'
+        with self.session.get(url, headers=probe_headers, stream=True, timeout=self.timeout) as res:
+            res.raise_for_status()
+            if res.status_code == 206:
+                content_range = res.headers.get('Content-Range', '')
+                total = content_range.rpartition('/')[2]
+                return (int(total) if total.isdigit() else None), True
+            length = res.headers.get('Content-Length')
+            return (int(length) if length and length.isdigit() else None), False
+
+    # ------------------------------------------------------------------
+    # 分段调度
+    # ------------------------------------------------------------------
+
+    def _next_segment(self):
+        with self.lock:
+            if self._error is not None:
+                return None
+            # 优先分配剩余字节最多的流，使视频和音频同时推进
+            candidates = [task for task in self.tasks if task.remaining > 0]
+            if not candidates:
+                return None
+            task = max(candidates, key=lambda t: t.remaining)
+
+            if not task.accept_ranges:
+                task.assigned = True
+                return task, 0, None
+
+            size = self.segment_size
+            # 尾部切小，避免最后一段拖慢整个下载
+            active = max(1, self.connections)
+            tail = -(-task.remaining // active)
+            size = max(self.min_segment_size, min(size, tail))
+            gap = task.gaps[0]
+            start = gap[0]
+            end = min(gap[1], start + size - 1)
+            if end < gap[1] and disk_io.align_down(end + 1) > start:
+                # 分段边界对齐，后续分段的写入起点也落在对齐的位置
+                end = disk_io.align_down(end + 1) - 1
+            if end == gap[1]:
+                task.gaps.pop(0)
+            else:
+                gap[0] = end + 1
+            return task, start, end
+
+    def _adapt_segment_size(self, nbytes, elapsed):
+        if elapsed <= 0 or nbytes <= 0:
+            return
+        # 按单连接实际速度调整分段大小，使每段耗时接近 target_segment_seconds
+        ideal = nbytes / elapsed * self.target_segment_seconds
+        with self.lock:
+            size = int(self.segment_size * 0.5 + ideal * 0.5)
+            self.segment_size = max(self.min_segment_size, min(self.max_segment_size, size))
+
+    def _worker(self):
+        while True:
+            if self._cancelled():
+                self._fail(DownloadCancelled("下载已取消"))
+                return
+            segment = self._next_segment()
+            if segment is None:
+                return
+            task, start, end = segment
+            try:
+                started = time.monotonic()
+                nbytes = self._fetch_segment(task, start, end)
+                self._adapt_segment_size(nbytes, time.monotonic() - started)
+                if self.segment_callback is not None and task.accept_ranges:
+                    self.segment_callback(task, start, end)
+            except Exception as e:
+                self._fail(e)
+                return
+
+    def _fail(self, error):
+        with self.lock:
+            if self._error is None:
+                self._error = error
+
+    def _cancelled(self):
+        return self.cancel_check is not None and self.cancel_check()
+
+    def _should_stop(self):
+        # 退避等待期间：被取消，或者其他连接已经失败 (整个下载都会失败，不用再等)
+        return self._cancelled() or self._error is not None
+
+    # ------------------------------------------------------------------
+    # 单段下载 (带重试，重试时从已写入的位置继续)
+    # ------------------------------------------------------------------
+
+    def _fetch_segment(self, task, start, end):
+        progress = {'written': 0}
+
+        def fetch(url):
+            self._fetch_range(task, url, start, end, progress)
+            return progress['written']
+
+        def reset():
+            if not task.accept_ranges and progress['written']:
+                # 不支持 Range 的流只能从头再来
+                with self.lock:
+                    task.downloaded -= progress['written']
+                progress['written'] = 0
+
+        return self._with_retry(task, fetch, f"分段 {start}-{end if end is not None else ''}", reset)
+
+    def _with_retry(self, task, operation, label, on_retry=None):
+        # operation(url) 失败时按错误类型处理：地址失效换镜像，限流 / 网络错误按退避时间重试，其他错误直接失败
+        attempt = 0
+        while True:
+            url = task.url
+            breaker = retry_policy.get_breaker(metrics.host_of(url))
+            self._wait_for_host(task, breaker)
+            if task.url != url:
+                continue
+            try:
+                result = operation(url)
+                breaker.record_success()
+                return result
+            except DownloadCancelled:
+                breaker.release()
+                raise
+            except Exception as e:
+                kind = 'transient' if isinstance(e, SegmentError) else retry_policy.classify(e)
+                if kind in ('expired', 'fatal'):
+                    # 地址失效 / 本地错误与主机是否健康无关
+                    breaker.release()
+                if self._error is not None or kind == 'fatal':
+                    raise
+                reason = retry_reason(e)
+                if kind == 'expired':
+                    with self.lock:
+                        switched = task.switch_url(url)
+                    if not switched:
+                        raise StreamExpired(f"视频地址已失效 (HTTP {reason})") from e
+                    if on_retry is not None:
+                        on_retry()
+                    self._notify_retry(task, metrics.host_of(url), reason, attempt, 0.0, switched_to=task.host)
+                    continue
+                breaker.record_failure()
+                attempt += 1
+                if attempt > self.retries:
+                    raise SegmentError(f"{label} 下载失败: {e}") from e
+                metrics.HTTP_RETRIES.inc(1, metrics.host_of(url), reason)
+                if on_retry is not None:
+                    on_retry()
+                delay = self.policy.delay(kind, attempt)
+                self._notify_retry(task, metrics.host_of(url), reason, attempt, delay)
+                if not retry_policy.wait(delay, self._should_stop):
+                    raise DownloadCancelled("下载已取消")
+
+    def _wait_for_host(self, task, breaker):
+        # 主机被熔断：有其他镜像时直接换过去，否则等熔断器放行 (可以取消)
+        while True:
+            delay = breaker.wait_time()
+            if delay <= 0:
+                return
+            with self.lock:
+                failed_url = task.url
+                switched = metrics.host_of(failed_url) == breaker.host and task.switch_url(failed_url)
+            if switched:
+                self._notify_retry(task, breaker.host, 'circuit_open', 0, 0.0, switched_to=task.host)
+                return
+            if not retry_policy.wait(min(delay, 5.0), self._should_stop):
+                raise DownloadCancelled("下载已取消")
+
+    def _notify_retry(self, task, host, reason, attempt, delay, switched_to=None):
+        if self.retry_callback is not None:
+            self.retry_callback({
+                'format_id': task.format_id, 'host': host, 'reason': reason,
+                'attempt': attempt, 'max_attempts': self.retries, 'delay': delay, 'switched_to': switched_to,
+            })
+
+    def _fetch_range(self, task, url, start, end, progress):
+        # 已写入文件的字节数记在 progress['written']，失败重试时从这里继续
+        written = progress['written']
+        headers = dict(task.headers)
+        if task.accept_ranges:
+            headers['Range'] = f"bytes={task.offset + start + written}-{task.offset + end}"
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as res:
+            res.raise_for_status()
+            if task.accept_ranges and res.status_code != 206:
+                raise SegmentError(f"服务器未按 Range 返回数据 (HTTP {res.status_code})")
+
+            mode = 'r+b' if task.accept_ranges or written else 'wb'
+            with open(task.part_path, mode, buffering=0) as f:
+                writer = disk_io.RangeWriter(f, start + written, self.write_size)
+                try:
+                    for chunk in res.iter_content(chunk_size=self.chunk_size):
+                        if self._cancelled():
+                            raise DownloadCancelled("下载已取消")
+                        if not chunk:
+                            continue
+                        writer.write(chunk)
+                        self._on_bytes(task, len(chunk))
+                        if self.throttle is not None:
+                            self.throttle(len(chunk))
+                finally:
+                    # 出错时也把收到的数据写完，重试只请求剩下的部分
+                    writer.flush()
+                    progress['written'] = written = written + writer.written
+
+        if task.accept_ranges and written != end - start + 1:
+            raise SegmentError(f"分段数据不完整 ({written}/{end - start + 1} 字节)")
+        if not task.accept_ranges and task.size is None:
+            task.size = written
+        return written
+
+    # ------------------------------------------------------------------
+    # 进度
+    # ------------------------------------------------------------------
+
+    def _on_bytes(self, task, nbytes):
+        now = time.monotonic()
+        with self.lock:
+            task.downloaded += nbytes
+            self._speed_samples.append((now, nbytes))
+        metrics.DOWNLOADED_BYTES.inc(nbytes, task.host)
+        self._report()
+
+    def speed(self):
+        # 最近 2 秒的平均速度
+        now = time.monotonic()
+        with self.lock:
+            self._speed_samples = [s for s in self._speed_samples if now - s[0] <= 2.0]
+            if not self._speed_samples:
+                return 0.0
+            window = max(now - self._speed_samples[0][0], 0.5)
+            return sum(s[1] for s in self._speed_samples) / window
+
+    def _report(self, force=False):
+        if self.progress_callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < 0.2:
+            return
+        self._last_report = now
+        self.progress_callback(self.total_downloaded(), self.total_size(), self.speed())
@@ -106,7 +106,7 @@ QLabel#VideoInfo {
 }
 
 /* 日志区域 */
-QTextEdit {
+QTextEdit, QPlainTextEdit {
     background-color: #2c3e50;
     color: #ecf0f1;
     border-radius: 8px;
@@ -0,0 +1,101 @@
+# 测试共用：把项目根目录加入 sys.path (模块都在根目录下)，以及本地的 Range 测试服务器
+
+import os
+import random
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RangeServer:
+    """
+    在本机端口上提供 data，支持 Range (返回 206)。
+    ignore_range=True 时忽略 Range 总是返回 200 和完整内容；
+    fault(handler, path, number) 返回状态码时直接以该状态码回复，返回 'reset' 时发送一半数据后断开连接。
+    requests 记录每个请求的 (路径, Range 头)。
+    """
+
+    def __init__(self, data, ignore_range=False, fault=None):
+        self.data = data
+        self.ignore_range = ignore_range
+        self.fault = fault
+        self.lock = threading.Lock()
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path='/file.bin', host='127.0.0.1'):
+        return f'http://{host}:{self.server.server_address[1]}{path}'
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append((self.path, self.headers.get('Range')))
+                    number = len(server.requests)
+                action = server.fault(self, self.path, number) if server.fault else None
+                if isinstance(action, int):
+                    self.send_response(action)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                data = server.data
+                start, end, status = 0, len(data) - 1, 200
+                match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+                if match and not server.ignore_range:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                    status = 206
+                body = data[start:end + 1]
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                self.end_headers()
+                if action == 'reset' and len(body) > 1:
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def payload():
+    return random.Random(42).randbytes(3 * 1024 * 1024 + 12345)
+
+
+@pytest.fixture
+def range_server():
+    servers = []
+
+    def start(data, **kwargs):
+        server = RangeServer(data, **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+
+from bandwidth import HIGH, LOW, NORMAL, BandwidthScheduler, TokenBucket
+
+
+class FakeClock:
+    # 假时钟：sleep 只推进时间，不真的等待
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(100, capacity=200, clock=clock)
+    assert bucket.tokens == 0
+    clock.advance(1)
+    assert bucket.wait_time(100) == 0
+    clock.advance(10)
+    bucket.wait_time()
+    assert bucket.tokens == 200   # 不超过容量
+
+
+def test_bucket_burst_then_debt(clock):
+    bucket = TokenBucket(100, capacity=200, clock=clock)
+    clock.advance(5)
+    bucket.consume(500)           # 先用掉 200 的突发量，欠 300
+    assert bucket.tokens == -300
+    assert bucket.wait_time() == pytest.approx(3.0)
+    clock.advance(3)
+    assert bucket.wait_time() == 0
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(None, clock=clock)
+    bucket.consume(10 ** 9)
+    assert bucket.wait_time(10 ** 9) == 0
+
+
+def test_acquire_waits_for_refill(clock):
+    scheduler = BandwidthScheduler(100, clock=clock, sleep=clock.sleep, max_sleep=0.25)
+    clock.advance(1)
+    assert scheduler.acquire(100) == 0
+    waited = scheduler.acquire(50)
+    # NORMAL 需要桶里至少留有 25% 的容量
+    assert waited == pytest.approx(0.25)
+    assert all(step <= 0.25 for step in clock.slept)
+
+
+def test_priority_reserve(clock):
+    # 时间和速率都取二进制能精确表示的值，假时钟下没有舍入误差
+    scheduler = BandwidthScheduler(64, clock=clock, sleep=clock.sleep)
+    clock.advance(0.375)   # 桶里有 24 个令牌
+    bucket = scheduler.global_bucket
+    # 24 >= 16 (NORMAL 保留 25%)
+    assert scheduler.acquire(8, priority=NORMAL) == 0
+    # 剩 16 < 32 (LOW 保留 50%)，要等 16 个令牌
+    assert scheduler.acquire(8, priority=LOW) == 0.25
+    # HIGH 不需要保留量，桶空了也能立即拿到 (之后欠账)
+    bucket.tokens = 0
+    assert scheduler.acquire(10, priority=HIGH) == 0
+    assert bucket.tokens < 0
+
+
+def test_job_bucket_limits_single_job(clock):
+    scheduler = BandwidthScheduler(None, clock=clock, sleep=clock.sleep)
+    scheduler.register_job(1, rate=10)
+    clock.advance(1)
+    assert scheduler.acquire(10, job_id=1) == 0
+    assert scheduler.acquire(10, job_id=1) == pytest.approx(0.0)
+    assert scheduler.acquire(10, job_id=1) == pytest.approx(1.0)
+    # 其他任务不受影响
+    assert scheduler.acquire(10 ** 6, job_id=2) == 0
+
+
+def test_schedule_rules_switch_rate(clock):
+    current = {'time': datetime(2024, 1, 1, 10, 0)}
+    scheduler = BandwidthScheduler(1000, clock=clock, sleep=clock.sleep, now=lambda: current['time'],
+                                   schedule=[{'start': '09:00', 'end': '18:00', 'rate': 100},
+                                             {'start': '23:00', 'end': '07:00', 'rate': None}])
+    assert scheduler.current_rate() == 100
+    current['time'] = datetime(2024, 1, 1, 18, 0)
+    assert scheduler.current_rate() == 1000
+    # 跨午夜的规则
+    current['time'] = datetime(2024, 1, 2, 2, 30)
+    assert scheduler.current_rate() is None
+    assert scheduler.acquire(10 ** 9) == 0
+    current['time'] = datetime(2024, 1, 2, 7, 0)
+    assert scheduler.current_rate() == 1000
+
+
+def test_global_rate_change_applies_to_waiting_acquire(clock):
+    scheduler = BandwidthScheduler(1, clock=clock, sleep=clock.sleep)
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        scheduler.set_global_rate(None)   # 等待期间取消限速
+
+    scheduler.sleep = sleep
+    assert scheduler.acquire(1000) == pytest.approx(0.25)
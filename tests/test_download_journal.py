@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import deque
+
+import pytest
+
+import http_client
+from bandwidth import BandwidthScheduler
+from download_journal import DownloadJournal
+from downloader_core import DownloadEngine, DownloadJob, EventEmitter
+from job_history import JobHistory
+from progress_bus import ProgressBus
+from segmented_downloader import SegmentedDownloader, StreamTask
+from transfer_metrics import TransferHistory
+
+KB = 1024
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / 'journal')
+
+
+def write_interrupted(journal_dir, url, size):
+    # 模拟上次中断：视频流下了一部分，音频流已完成，合并正在进行
+    journal = DownloadJournal(journal_dir)
+    entry = journal.create(url, '30080', 'downloads', '%(title)s.%(ext)s', 'high', clip=(90.0, 165.0))
+    entry.reset_stream('30080', '/tmp/v.f30080.mp4', size, [[0, 64 * KB - 1]])
+    entry.mark_segment('30080', 64 * KB, 128 * KB - 1)      # 与前一段相邻，合并成一段
+    entry.mark_segment('30080', 512 * KB, 768 * KB - 1)
+    entry.reset_stream('30280', '/tmp/v.f30280.m4a', 4096, [[0, 4095]])
+    entry.mark_stream_done('30280')
+    entry.set_output('downloads/v.mp4')
+    entry.set_merge_status('running')
+    entry.save(force=True)      # mark_segment 的节流写盘
+    return entry
+
+
+def test_journal_restores_ranges_and_merge_state(journal_dir):
+    write_interrupted(journal_dir, 'https://www.bilibili.com/video/BV1Resume001', 1024 * KB)
+
+    [entry] = DownloadJournal(journal_dir).pending_entries()
+    assert (entry.url, entry.format_id, entry.priority) == ('https://www.bilibili.com/video/BV1Resume001', '30080', 'high')
+    assert entry.clip == [90.0, 165.0]
+    assert entry.data['merge'] == 'running'
+    assert entry.data['output'] == 'downloads/v.mp4'
+    video = entry.stream('30080')
+    assert video['size'] == 1024 * KB
+    assert video['completed'] == [[0, 128 * KB - 1], [512 * KB, 768 * KB - 1]]
+    assert not video['done']
+    assert entry.stream('30280') == {'path': '/tmp/v.f30280.m4a', 'size': 4096, 'completed': [[0, 4095]], 'done': True}
+
+
+def test_restored_ranges_resume_from_gaps(tmp_path, journal_dir, payload, range_server):
+    server = range_server(payload)
+    entry = write_interrupted(journal_dir, server.url(), len(payload))
+    completed = entry.stream('30080')['completed']
+    path = str(tmp_path / 'v.f30080.mp4')
+    part = bytearray(len(payload))
+    for start, end in completed:
+        part[start:end + 1] = payload[start:end + 1]
+    with open(path + '.part', 'wb') as f:
+        f.write(part)
+
+    [entry] = DownloadJournal(journal_dir).pending_entries()
+    stream = entry.stream('30080')
+    task = StreamTask(server.url(), path, size=stream['size'], completed=stream['completed'], format_id='30080')
+    SegmentedDownloader(session=http_client.create_download_session(), connections=4, min_segment_size=64 * KB,
+                        initial_segment_size=256 * KB, chunk_size=16 * KB, write_size=64 * KB,
+                        segment_callback=lambda task, start, end: entry.mark_segment(task.format_id, start, end),
+                        ).download_all([task])
+    entry.save(force=True)
+
+    assert open(path, 'rb').read() == payload
+    # 已完成的范围没有再请求
+    for _, value in server.requests[1:]:
+        start, end = (int(x) for x in value[len('bytes='):].split('-'))
+        assert all(end < done_start or start > done_end for done_start, done_end in completed)
+    [entry] = DownloadJournal(journal_dir).pending_entries()
+    assert entry.stream('30080')['completed'] == [[0, len(payload) - 1]]
+
+
+def make_engine(tmp_path, journal):
+    # 只有队列部分的引擎：不启动 yt-dlp 实例池、Cookie 自动刷新等后台服务，max_workers=0 时任务只排队不下载
+    engine = DownloadEngine.__new__(DownloadEngine)
+    EventEmitter.__init__(engine)
+    engine.max_workers = 0
+    engine.max_pending = 500
+    engine.save_path = 'downloads'
+    engine.outtmpl = '%(title)s [%(id)s].%(ext)s'
+    engine.journal = journal
+    engine.bandwidth = BandwidthScheduler()
+    engine.history = TransferHistory(str(tmp_path / 'transfers.jsonl'))
+    engine.job_history = JobHistory(str(tmp_path / 'history.sqlite3'))
+    engine.progress_bus = ProgressBus()
+    engine.lock = threading.RLock()
+    engine.idle_event = threading.Event()
+    engine.jobs = {}
+    engine.pending = deque()
+    engine._next_id = 1
+    return engine
+
+
+def test_restore_rebuilds_queue_and_cancel_drops_journal(tmp_path, journal_dir):
+    journal = DownloadJournal(journal_dir)
+    first = write_interrupted(journal_dir, 'https://www.bilibili.com/video/BV1Resume001', 1024 * KB)
+    second = journal.create('https://www.bilibili.com/video/BV1Resume002', None, 'downloads')
+    other = journal.create('https://www.bilibili.com/video/BV1Resume003', None, '/elsewhere')
+
+    engine = make_engine(tmp_path, journal)
+    assert engine.restore_from_journal() == 2
+    jobs = {job.url: job for job in engine.pending}
+    assert set(jobs) == {first.url, second.url}
+    restored = jobs[first.url]
+    assert (restored.format_id, restored.priority, restored.clip) == ('30080', 'high', (90.0, 165.0))
+    assert restored.journal_entry.stream('30080')['completed'] == [[0, 128 * KB - 1], [512 * KB, 768 * KB - 1]]
+    assert restored.journal_entry.data['merge'] == 'running'
+
+    # 用户取消排队中的任务：日志删除，下次启动不再恢复
+    assert engine.cancel(restored.job_id)
+    assert restored.state == DownloadJob.FAILED
+    assert not os.path.exists(journal.path_for(first.key))
+    # 用户取消运行中的任务：线程结束后删除日志
+    running = jobs[second.url]
+    engine.pending.remove(running)
+    running.state = DownloadJob.RUNNING
+    running.task = type('Task', (), {'stop': lambda self: None})()
+    assert engine.cancel(running.job_id)
+    engine._on_task_finished(running.job_id, False, "下载已取消")
+    assert not os.path.exists(journal.path_for(second.key))
+
+    assert [entry.key for entry in DownloadJournal(journal_dir).pending_entries()] == [other.key]
+    engine.progress_bus.stop()
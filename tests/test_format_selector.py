@@ -0,0 +1,28 @@
+from format_selector import parse_policy, policy_selector
+
+VIDEO = {'format_id': '100050', 'format': '100050 - 1920x1080', 'url': 'http://example/v', 'ext': 'mp4',
+         'vcodec': 'hev1.1.6.L150', 'acodec': 'none', 'width': 1920, 'height': 1080, 'fps': 30, 'tbr': 1500,
+         'protocol': 'https'}
+AUDIO = {'format_id': '30280', 'format': '30280 - audio only', 'url': 'http://example/a', 'ext': 'm4a',
+         'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 192, 'asr': 48000, 'tbr': 192, 'protocol': 'https'}
+
+
+def select(text, formats):
+    return list(policy_selector(parse_policy(text))({'formats': formats}))
+
+
+def test_merged_format_carries_video_and_audio_fields():
+    [merged] = select('1080p,hevc', [VIDEO, AUDIO])
+    assert merged['requested_formats'] == [VIDEO, AUDIO]
+    assert merged['format_id'] == '100050+30280'
+    assert merged['format'] == '100050 - 1920x1080+30280 - audio only'
+    assert merged['protocol'] == 'https+https'
+    assert (merged['width'], merged['height'], merged['fps'], merged['resolution']) == (1920, 1080, 30, '1920x1080')
+    assert merged['vcodec'] == 'hev1.1.6.L150'
+    assert (merged['acodec'], merged['abr'], merged['asr']) == ('mp4a.40.2', 192, 48000)
+    assert merged['tbr'] == 1692
+
+
+def test_single_stream_is_yielded_unchanged():
+    assert select('audio', [VIDEO, AUDIO]) == [AUDIO]
+    assert select('1080p', [VIDEO]) == [VIDEO]
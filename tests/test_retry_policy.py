@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+import http_client
+import retry_policy
+from retry_policy import Backoff, CircuitBreaker, RetryPolicy
+from segmented_downloader import SegmentedDownloader, StreamTask
+
+KB = 1024
+FAST = RetryPolicy(transient=Backoff(0.001, 0.01), throttled=Backoff(0.001, 0.01))
+
+
+@pytest.fixture(autouse=True)
+def breakers():
+    # 熔断器是进程级的，每个测试从干净的状态开始
+    retry_policy._breakers.clear()
+    yield retry_policy._breakers
+    retry_policy._breakers.clear()
+
+
+def lenient_breaker(host='127.0.0.1'):
+    # 并发连接同时失败时不让熔断器打开 (这些测试只关心重试本身)
+    retry_policy._breakers[host] = CircuitBreaker(host, failure_threshold=1000)
+
+
+def download(server_url, path, backups=None, **kwargs):
+    retries = []
+    downloader = SegmentedDownloader(session=http_client.create_download_session(), connections=4,
+                                     min_segment_size=64 * KB, initial_segment_size=256 * KB, chunk_size=16 * KB,
+                                     write_size=64 * KB, policy=FAST, retry_callback=retries.append, **kwargs)
+    downloader.download_all([StreamTask(server_url, path, backups=backups)])
+    return retries
+
+
+def first_attempt_per_range(action, key_of=lambda value: value):
+    # 每个 Range 第一次请求时注入故障，重试时正常返回
+    seen = set()
+    lock = threading.Lock()
+
+    def fault(handler, path, number):
+        key = (path, key_of(handler.headers.get('Range')))
+        with lock:
+            if key in seen:
+                return None
+            seen.add(key)
+        return action
+
+    return fault
+
+
+def test_503_is_retried_by_policy_only(tmp_path, payload, range_server):
+    lenient_breaker()
+    server = range_server(payload, fault=first_attempt_per_range(503))
+    path = str(tmp_path / 'out.bin')
+    retries = download(server.url(), path)
+    assert open(path, 'rb').read() == payload
+    # 每个 503 恰好对应一次 on_retry 报告：urllib3 没有在下面偷偷重试
+    failed = len(set(server.requests))
+    assert len(retries) == failed
+    assert len(server.requests) == 2 * failed
+    assert all(r['reason'] == '503' and r['host'] == '127.0.0.1' and r['switched_to'] is None for r in retries)
+
+
+def test_connection_reset_resumes_without_corruption(tmp_path, payload, range_server):
+    lenient_breaker()
+    # 断开后从已写入的位置继续请求，Range 的起点会变，所以按终点判断是不是同一段
+    server = range_server(payload, fault=first_attempt_per_range('reset', key_of=lambda value: value.partition('-')[2]))
+    path = str(tmp_path / 'out.bin')
+    retries = download(server.url(), path)
+    assert open(path, 'rb').read() == payload
+    assert retries
+    assert all(r['reason'] != '503' and r['switched_to'] is None for r in retries)
+
+
+def test_expired_url_switches_to_backup(tmp_path, payload, range_server):
+    server = range_server(payload, fault=lambda handler, path, number: 403 if path == '/file.bin' else None)
+    path = str(tmp_path / 'out.bin')
+    retries = download(server.url(), path, backups=[server.url('/mirror.bin')])
+    assert open(path, 'rb').read() == payload
+    assert retries[0]['reason'] == '403'
+    assert retries[0]['switched_to'] == '127.0.0.1'
+    # 只有第一次请求访问了失效的地址，之后全部走备用地址
+    assert [p for p, _ in server.requests].count('/file.bin') == 1
+    assert all(p == '/mirror.bin' for p, _ in server.requests[1:])
+
+
+def test_circuit_opens_and_fails_over_to_mirror(tmp_path, payload, range_server, breakers):
+    primary = range_server(payload, fault=lambda handler, path, number: 503)
+    mirror = range_server(payload)
+    path = str(tmp_path / 'out.bin')
+    retries = download(primary.url(), path, backups=[mirror.url(host='localhost')])
+    assert open(path, 'rb').read() == payload
+
+    assert breakers['127.0.0.1'].state == CircuitBreaker.OPEN
+    assert breakers['localhost'].state == CircuitBreaker.CLOSED
+    # 连续失败达到阈值 (5 次) 后熔断，随后切换到镜像主机
+    failures = [r for r in retries if r['reason'] == '503']
+    assert len(failures) == len(primary.requests) == 5
+    assert retries[-1]['reason'] == 'circuit_open'
+    assert retries[-1]['switched_to'] == 'localhost'
+    assert len(mirror.requests) > 2
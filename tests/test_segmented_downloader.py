@@ -0,0 +1,68 @@
+import os
+
+import http_client
+from segmented_downloader import SegmentedDownloader, StreamTask
+
+KB = 1024
+
+
+def make_downloader(**kwargs):
+    options = dict(session=http_client.create_download_session(), connections=4, min_segment_size=64 * KB,
+                   initial_segment_size=256 * KB, chunk_size=16 * KB, write_size=64 * KB)
+    options.update(kwargs)
+    return SegmentedDownloader(**options)
+
+
+def test_parallel_download_is_byte_exact(tmp_path, payload, range_server):
+    server = range_server(payload)
+    path = str(tmp_path / 'out.bin')
+    make_downloader().download(server.url(), path)
+    assert open(path, 'rb').read() == payload
+    assert not os.path.exists(path + '.part')
+    # 探测 1 次 + 多个分段
+    assert len(server.requests) > 2
+    assert all(r is not None for _, r in server.requests)
+
+
+def test_resume_fetches_only_missing_ranges(tmp_path, payload, range_server):
+    server = range_server(payload)
+    path = str(tmp_path / 'out.bin')
+    completed = [[0, 512 * KB - 1], [1024 * KB, 2048 * KB - 1]]
+    # 上次中断时留下的 .part：已完成的范围是正确数据，其余是零
+    part = bytearray(len(payload))
+    for start, end in completed:
+        part[start:end + 1] = payload[start:end + 1]
+    with open(path + '.part', 'wb') as f:
+        f.write(part)
+
+    segments = []
+    downloader = make_downloader(segment_callback=lambda task, start, end: segments.append((start, end)))
+    task = StreamTask(server.url(), path, size=len(payload), completed=completed)
+    downloader.download_all([task])
+
+    assert open(path, 'rb').read() == payload
+    requested = [tuple(map(int, r[len('bytes='):].split('-'))) for _, r in server.requests[1:]]
+    for start, end in requested:
+        for done_start, done_end in completed:
+            assert end < done_start or start > done_end
+    assert sum(end - start + 1 for start, end in segments) == len(payload) - sum(e - s + 1 for s, e in completed)
+
+
+def test_resume_discarded_when_part_missing(tmp_path, payload, range_server):
+    server = range_server(payload)
+    path = str(tmp_path / 'out.bin')
+    task = StreamTask(server.url(), path, size=len(payload), completed=[[0, 1024 * KB - 1]])
+    make_downloader().download_all([task])
+    assert open(path, 'rb').read() == payload
+    assert task.completed == []
+
+
+def test_server_ignoring_range_falls_back_to_single_stream(tmp_path, payload, range_server):
+    server = range_server(payload, ignore_range=True)
+    path = str(tmp_path / 'out.bin')
+    task = StreamTask(server.url(), path)
+    make_downloader().download_all([task])
+    assert open(path, 'rb').read() == payload
+    assert task.accept_ranges is False
+    # 探测 + 一次完整下载，没有并发分段
+    assert len(server.requests) == 2
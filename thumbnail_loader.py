@@ -0,0 +1,153 @@
+# 异步封面加载
+#
+# 下载、解码、缩放都在线程池中完成，不阻塞界面。
+# 缩放后的图片放在内存 LRU 缓存和磁盘缓存中 (磁盘缓存按总大小淘汰)，
+# 同一个 URL 同时只会有一个请求在进行。
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from bandwidth import HIGH, get_bandwidth_scheduler
+from metadata_cache import CACHE_DIR
+
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+CHUNK_SIZE = 16 * 1024
+
+
+class ThumbnailDiskCache:
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.jpg')
+
+    def get(self, key):
+        path = self.path_for(key)
+        image = QImage(path) if os.path.exists(path) else QImage()
+        if image.isNull():
+            return None
+        try:
+            os.utime(path)  # 更新访问时间，淘汰时按它排序
+        except OSError:
+            pass
+        return image
+
+    def put(self, key, image):
+        path = self.path_for(key)
+        temp_path = path + '.tmp'
+        if not image.save(temp_path, 'JPG', 85):
+            return
+        os.replace(temp_path, path)
+        with self.lock:
+            if self.total is None:
+                self.total = self._scan_total()
+            else:
+                self.total += os.path.getsize(path)
+            if self.total > self.max_bytes:
+                self._evict()
+
+    def _scan_total(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict(self):
+        # 删除最久未访问的文件，直到总大小降到上限的 80%
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()),
+                         key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes * 0.8:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass
+        self.total = total
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, loader, url):
+        super().__init__()
+        self.loader = loader
+        self.url = url
+
+    def run(self):
+        loader = self.loader
+        key = loader.cache_key(self.url)
+        try:
+            image = loader.disk_cache.get(key)
+            if image is None:
+                import http_client   # requests 较重，第一次加载封面时才导入 (在工作线程中)
+                # 封面流量同样计入带宽调度 (高优先级)：边读边申请令牌，限速时读取也会被拖慢
+                scheduler = get_bandwidth_scheduler()
+                data = bytearray()
+                with http_client.get_session().get(self.url, stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        scheduler.acquire(len(chunk), priority=HIGH)
+                        data += chunk
+
+                image = QImage()
+                if not image.loadFromData(bytes(data)):
+                    raise ValueError("无法解码图片")
+                image = image.scaled(loader.width, loader.height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                loader.disk_cache.put(key, image)
+            loader.result_signal.emit(self.url, image, '')
+        except Exception as e:
+            loader.result_signal.emit(self.url, QImage(), str(e))
+
+
+class ThumbnailLoader(QObject):
+    loaded_signal = pyqtSignal(str, QImage)   # url, 缩放后的图片
+    failed_signal = pyqtSignal(str, str)      # url, 错误信息
+    result_signal = pyqtSignal(str, QImage, str)  # 内部使用：工作线程 -> 主线程
+
+    def __init__(self, width=160, height=90, memory_items=256, max_threads=4, disk_cache=None, parent=None):
+        super().__init__(parent)
+        self.width = width
+        self.height = height
+        self.memory_items = memory_items
+        self.memory_cache = OrderedDict()
+        self.in_flight = set()
+        self.disk_cache = disk_cache or ThumbnailDiskCache()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.result_signal.connect(self._on_result)
+
+    def cache_key(self, url):
+        return f"{url}@{self.width}x{self.height}"
+
+    def request(self, url):
+        if not url:
+            return
+        image = self.memory_cache.get(url)
+        if image is not None:
+            self.memory_cache.move_to_end(url)
+            self.loaded_signal.emit(url, image)
+            return
+        if url in self.in_flight:
+            # 已经在加载，结果出来后统一通知
+            return
+        self.in_flight.add(url)
+        self.pool.start(ThumbnailTask(self, url))
+
+    def _on_result(self, url, image, error):
+        self.in_flight.discard(url)
+        if error:
+            self.failed_signal.emit(url, error)
+            return
+        self.memory_cache[url] = image
+        self.memory_cache.move_to_end(url)
+        while len(self.memory_cache) > self.memory_items:
+            self.memory_cache.popitem(last=False)
+        self.loaded_signal.emit(url, image)
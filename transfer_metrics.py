@@ -0,0 +1,267 @@
+# 传输统计：平滑速度 / 剩余时间、单调的整体进度、每个任务的历史记录
+#
+# yt-dlp 回调里的 speed / eta 是瞬时值，跳动很大，而且视频流下载完切换到音频流时会从 0 重新开始。
+# 这里把一个任务的所有流合在一起计算进度 (只增不减)，速度用指数加权移动平均 (EWMA)，
+# 任务结束时记录首字节时间、平均 / 峰值速度、停顿时间等，追加到历史文件，便于导出做容量规划。
+
+import csv
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from metadata_cache import CACHE_DIR
+
+HISTORY_FILE = os.path.join(CACHE_DIR, 'transfer_history.jsonl')
+
+HISTORY_FIELDS = (
+    'job_id', 'url', 'success', 'started_at', 'duration', 'bytes', 'total', 'ttfb', 'active_seconds',
+    'mean_speed', 'peak_speed', 'stall_seconds', 'stalls', 'merge_seconds', 'message',
+)
+
+
+def format_speed(bytes_per_sec):
+    if bytes_per_sec > 1024 * 1024:
+        return f"{bytes_per_sec / 1024 / 1024:.2f} MB/s"
+    elif bytes_per_sec > 1024:
+        return f"{bytes_per_sec / 1024:.2f} KB/s"
+    else:
+        return f"{bytes_per_sec:.2f} B/s"
+
+
+class RateEstimator:
+    # 按时间衰减的 EWMA：采样间隔不固定，权重 alpha = 1 - exp(-dt / tau)
+    def __init__(self, tau=3.0):
+        self.tau = tau
+        self.rate = None
+        self.last_time = None
+        self.last_bytes = 0
+
+    def update(self, total_bytes, now):
+        if self.last_time is None:
+            self.last_time = now
+            self.last_bytes = total_bytes
+            return self.rate or 0.0
+        dt = now - self.last_time
+        if dt <= 0:
+            return self.rate or 0.0
+        sample = max(total_bytes - self.last_bytes, 0) / dt
+        if self.rate is None:
+            self.rate = sample
+        else:
+            alpha = 1 - math.exp(-dt / self.tau)
+            self.rate += alpha * (sample - self.rate)
+        self.last_time = now
+        self.last_bytes = total_bytes
+        return self.rate
+
+    def reset(self):
+        self.rate = None
+        self.last_time = None
+
+
+class TransferMetrics:
+    def __init__(self, job_id=None, url=None, tau=3.0, stall_threshold=2.0, min_sample_interval=0.2,
+                 clock=time.monotonic, wall_clock=time.time):
+        self.job_id = job_id
+        self.url = url
+        self.clock = clock
+        self.stall_threshold = stall_threshold
+        self.min_sample_interval = min_sample_interval
+        self.estimator = RateEstimator(tau)
+        self.lock = threading.Lock()
+
+        self.streams = {}   # key -> [已下载, 总大小 (可能为 None)]
+        self.started = clock()
+        self.started_at = wall_clock()
+        self.first_byte = None
+        self.last_progress = None   # 最近一次有新数据的时间
+        self.last_sample = None
+        self.bytes = 0
+        self.progress = 0.0
+        self.speed = 0.0
+        self.peak_speed = 0.0
+        self.stall_seconds = 0.0
+        self.stalls = 0
+        self.summary = None
+
+    def expect(self, key, total):
+        # 预先登记还没开始下载的流 (如 yt-dlp 顺序下载时的音频流)，避免切换时进度倒退
+        with self.lock:
+            if total and key not in self.streams:
+                self.streams[key] = [0, total]
+
+    def resume(self, key, nbytes):
+        # 断点续传时已在磁盘上的字节：计入进度，但不算作本次传输的流量
+        with self.lock:
+            self.streams.setdefault(key, [0, None])[0] += nbytes
+
+    def update(self, key, downloaded, total=None):
+        # 返回合并后的进度字段，可以直接发给进度总线
+        now = self.clock()
+        with self.lock:
+            stream = self.streams.setdefault(key, [0, None])
+            delta = max(downloaded - stream[0], 0)
+            stream[0] = max(stream[0], downloaded)
+            if total:
+                stream[1] = total
+            self.bytes += delta
+
+            if delta:
+                if self.first_byte is None:
+                    self.first_byte = now
+                elif self.last_progress is not None and now - self.last_progress >= self.stall_threshold:
+                    self.stall_seconds += now - self.last_progress
+                    self.stalls += 1
+                self.last_progress = now
+
+            if self.last_sample is None or now - self.last_sample >= self.min_sample_interval:
+                self.last_sample = now
+                self.speed = self.estimator.update(self.bytes, now)
+                # 峰值取平滑后的速度，不受单个数据块的瞬时值影响
+                self.peak_speed = max(self.peak_speed, self.speed)
+            return self._fields()
+
+    def _totals(self):
+        downloaded = sum(stream[0] for stream in self.streams.values())
+        known = [stream for stream in self.streams.values() if stream[1]]
+        total = sum(stream[1] for stream in known) if len(known) == len(self.streams) else None
+        return downloaded, total
+
+    def _fields(self):
+        downloaded, total = self._totals()
+        fields = {'downloaded': downloaded, 'total': total, 'speed': self.speed, 'eta': None}
+        if total:
+            # 整体进度只增不减，最多到 99，100 留给真正完成 (含合并) 的时刻
+            self.progress = max(self.progress, min(downloaded / total * 100, 99.0))
+            if self.speed > 0:
+                fields['eta'] = int(math.ceil(max(total - downloaded, 0) / self.speed))
+        fields['progress'] = self.progress
+        return fields
+
+    def fields(self):
+        with self.lock:
+            return self._fields()
+
+    def finish(self, success, message='', merge_seconds=None):
+        with self.lock:
+            if self.summary is not None:
+                return self.summary
+            now = self.clock()
+            downloaded, total = self._totals()
+            active = (self.last_progress - self.first_byte) if self.first_byte is not None else 0.0
+            active = max(active - self.stall_seconds, 0.0)
+            self.summary = {
+                'job_id': self.job_id,
+                'url': self.url,
+                'success': bool(success),
+                'started_at': round(self.started_at, 3),
+                'duration': round(now - self.started, 3),
+                'bytes': self.bytes,
+                'total': total,
+                'ttfb': round(self.first_byte - self.started, 3) if self.first_byte is not None else None,
+                'active_seconds': round(active, 3),
+                'mean_speed': round(self.bytes / active, 1) if active > 0 else None,
+                'peak_speed': round(self.peak_speed, 1),
+                'stall_seconds': round(self.stall_seconds, 3),
+                'stalls': self.stalls,
+                'merge_seconds': round(merge_seconds, 3) if merge_seconds is not None else None,
+                'message': message,
+            }
+            return self.summary
+
+
+class TransferHistory:
+    # 已结束任务的统计，内存中保留最近 max_items 条，同时追加到 JSON Lines 文件
+    def __init__(self, path=HISTORY_FILE, max_items=1000, max_bytes=5 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.items = deque(maxlen=max_items)
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.items.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+
+    def record(self, summary):
+        with self.lock:
+            self.items.append(summary)
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+            if os.path.getsize(self.path) > self.max_bytes:
+                self._compact()
+
+    def _compact(self):
+        # 文件过大时只保留内存中的最近记录
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for item in list(self.items)[len(self.items) // 2:]:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.path)
+
+    def recent(self, limit=None):
+        with self.lock:
+            items = list(self.items)
+        return items[-limit:] if limit else items
+
+    def aggregate(self):
+        # 容量规划用的汇总：成功率、总流量、平均速度、首字节时间和停顿时间
+        items = self.recent()
+        finished = [item for item in items if item.get('success')]
+        speeds = sorted(item['mean_speed'] for item in finished if item.get('mean_speed'))
+        ttfbs = sorted(item['ttfb'] for item in items if item.get('ttfb') is not None)
+
+        def percentile(values, q):
+            return values[min(int(len(values) * q), len(values) - 1)] if values else None
+
+        return {
+            'jobs': len(items),
+            'succeeded': len(finished),
+            'bytes': sum(item.get('bytes') or 0 for item in items),
+            'mean_speed_p50': percentile(speeds, 0.5),
+            'mean_speed_p10': percentile(speeds, 0.1),
+            'peak_speed_max': max((item.get('peak_speed') or 0 for item in items), default=None),
+            'ttfb_p50': percentile(ttfbs, 0.5),
+            'ttfb_p90': percentile(ttfbs, 0.9),
+            'stall_seconds': round(sum(item.get('stall_seconds') or 0 for item in items), 3),
+        }
+
+    def export(self, path):
+        # 按扩展名导出为 CSV 或 JSON
+        items = self.recent()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(items)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'summary': self.aggregate(), 'jobs': items}, f, ensure_ascii=False, indent=2)
+        return len(items)
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_transfer_history():
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = TransferHistory()
+        return _history
@@ -0,0 +1,160 @@
+# yt-dlp 实例池
+#
+# 每次新建 YoutubeDL 都要重新初始化上千个解析器、格式选择器、网络栈和后处理器 (约 0.1s，
+# 第一次匹配链接时还要编译所有解析器的正则)，批量下载短视频时这部分开销比下载本身还大。
+# 这里按 "基础参数" 缓存实例：工作线程借出一个实例，套上本次任务的参数 (格式、输出模板、回调等)，
+# 用完后恢复原参数再放回池中。同一时刻一个实例只借给一个线程。
+#
+# 只有下面 OVERRIDABLE 中的参数可以按任务覆盖；影响网络栈或在初始化时就固定下来的参数
+# (代理、Cookies、后处理器等) 必须放在基础参数里，不同的基础参数对应不同的实例。
+
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+
+from cookie_manager import get_cookie_manager
+
+# 可以按任务覆盖的参数
+OVERRIDABLE = frozenset((
+    'format', 'outtmpl', 'progress_hooks', 'postprocessor_hooks', 'logger', 'download_ranges',
+    'retry_sleep_functions', 'quiet', 'no_warnings', 'noprogress', 'ratelimit', 'merge_output_format', 'paths',
+))
+
+WARMUP_URL = 'https://www.bilibili.com/video/BV1xx411c7mD'
+
+
+def options_key(options):
+    # 基础参数只能是简单的值 (字符串、数字、元组...)，按 repr 区分
+    return tuple(sorted((key, repr(value)) for key, value in options.items()))
+
+
+def create_ydl(options):
+    # 所有 yt-dlp 实例共用 cookie_manager 中的登录状态 (内存中的 Cookie 罐，不再各自读 cookies.txt)
+    return get_cookie_manager().attach(yt_dlp.YoutubeDL(dict(options)))
+
+
+class YdlPool:
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle    # 每组基础参数最多缓存的空闲实例数
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def borrow(self, options, **overrides):
+        unknown = set(overrides) - OVERRIDABLE
+        if unknown:
+            raise ValueError(f"这些参数不能按任务覆盖，请放在基础参数中: {', '.join(sorted(unknown))}")
+        key = options_key(options)
+        ydl = self._take(key, options)
+        saved = apply_overrides(ydl, overrides)
+        try:
+            yield ydl
+        except BaseException:
+            # 出错的实例状态不可靠 (可能停在下载中途)，直接丢弃
+            ydl.close()
+            raise
+        restore(ydl, saved)
+        self._give_back(key, ydl)
+
+    def _take(self, key, options):
+        with self.lock:
+            instances = self.idle.get(key)
+            if instances:
+                self.reused += 1
+                return instances.pop()
+            self.created += 1
+        return create_ydl(options)
+
+    def _give_back(self, key, ydl):
+        with self.lock:
+            instances = self.idle.setdefault(key, [])
+            if len(instances) < self.max_idle:
+                instances.append(ydl)
+                return
+        ydl.close()
+
+    def prewarm(self, options, count=1, background=True):
+        # 提前创建实例并匹配一次链接 (编译解析器的正则)，第一个任务不用再等
+        def warm():
+            key = options_key(options)
+            for _ in range(count):
+                ydl = create_ydl(options)
+                next((ie for ie in ydl._ies.values() if ie.suitable(WARMUP_URL)), None)
+                with self.lock:
+                    self.created += 1
+                self._give_back(key, ydl)
+
+        if not background:
+            warm()
+            return None
+        thread = threading.Thread(target=warm, name='ydl-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self.lock:
+            return {'created': self.created, 'reused': self.reused,
+                    'idle': sum(len(instances) for instances in self.idle.values())}
+
+    def close(self):
+        with self.lock:
+            instances = [ydl for group in self.idle.values() for ydl in group]
+            self.idle.clear()
+        for ydl in instances:
+            ydl.close()
+
+
+def apply_overrides(ydl, overrides):
+    # 返回恢复用的快照
+    saved = {
+        'params': dict(ydl.params),
+        'progress_hooks': ydl._progress_hooks,
+        'postprocessor_hooks': ydl._postprocessor_hooks,
+        'format_selector': ydl.format_selector,
+    }
+    for key, value in overrides.items():
+        ydl.params[key] = value
+    # 以下参数在 YoutubeDL 初始化时就被处理过，需要单独重建
+    if 'outtmpl' in overrides:
+        ydl._parse_outtmpl()
+    if 'format' in overrides:
+        ydl.format_selector = build_selector(ydl, overrides['format'])
+    ydl._progress_hooks = list(overrides.get('progress_hooks') or saved['progress_hooks'])
+    ydl._postprocessor_hooks = list(overrides.get('postprocessor_hooks') or saved['postprocessor_hooks'])
+    # 上一个任务留下的计数
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    return saved
+
+
+def restore(ydl, saved):
+    ydl.params.clear()
+    ydl.params.update(saved['params'])
+    ydl._progress_hooks = saved['progress_hooks']
+    ydl._postprocessor_hooks = saved['postprocessor_hooks']
+    ydl.format_selector = saved['format_selector']
+
+
+def build_selector(ydl, spec):
+    if spec in (None, '-') or callable(spec):
+        return spec
+    # 同一个实例上解析过的格式表达式直接复用
+    cache = ydl.__dict__.setdefault('_selector_cache', {})
+    if spec not in cache:
+        cache[spec] = ydl.build_format_selector(spec)
+    return cache[spec]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ydl_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = YdlPool()
+        return _pool